@@ -0,0 +1,152 @@
+from pyxavi.config import Config
+from pyxavi.logger import Logger
+from pyxavi.terminal_color import TerminalColor
+from pyxavi.queue_stack import Queue
+from pyxavi.mastodon_publisher import MastodonPublisherException
+from mastofeed.lib.publisher import Publisher
+from mastofeed.lib.queue_post import QueuePost
+from mastofeed.lib.storage_backend import StorageBackend
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AccountQueue(Queue):
+    '''
+    In-memory part of the queue that belongs to a single named account
+
+    It is filled from the main queue before publishing, and what leaves
+    it is removed from the main queue afterwards, which is the one saved.
+    '''
+
+    def save(self) -> None:
+        pass
+
+
+class AccountsPublisher:
+    '''
+    Publishes the queue through every named account, in parallel
+
+    Every post goes to the named account of its source, or to the default
+    one. The queue is split into a part per account and every part is
+    drained by the Publisher of its account in its own thread, with its
+    own connection and rate limit. The main queue only loses the posts
+    that were published.
+    '''
+
+    DEFAULT_NAMED_ACCOUNT = "default"
+
+    def __init__(
+        self,
+        config: Config,
+        base_path: str = None,
+        only_oldest: bool = None,
+        queue: Queue = None
+    ) -> None:
+        self._config = config
+        self._logger = Logger(config=config).get_logger()
+        self._base_path = base_path
+        self._only_oldest = only_oldest
+        self._is_dry_run = config.get("publisher.dry_run", False)
+
+        if queue is None:
+            self._queue = StorageBackend(
+                config=config, base_path=base_path
+            ).get_queue(
+                logger=self._logger, queue_item_object=QueuePost
+            )
+        else:
+            self._queue = queue
+
+        self._publishers = {}  # type: dict[str, Publisher]
+        self._account_queues = {}  # type: dict[str, AccountQueue]
+
+    def get_publisher(self, named_account: str = None) -> Publisher:
+        """The Publisher of the account, connected the first time it is needed"""
+        named_account = named_account if named_account is not None\
+            else self.DEFAULT_NAMED_ACCOUNT
+
+        if named_account not in self._publishers:
+            self._account_queues[named_account] = AccountQueue(
+                logger=self._logger, queue_item_object=QueuePost
+            )
+            self._publishers[named_account] = Publisher(
+                config=self._config,
+                named_account=named_account,
+                base_path=self._base_path,
+                only_oldest=self._only_oldest,
+                queue=self._account_queues[named_account]
+            )
+
+        return self._publishers[named_account]
+
+    def get_account_for(self, post: QueuePost) -> str:
+        """The named account that publishes the post. The default one if it is unknown"""
+        named_account = getattr(post, "named_account", None)
+        if named_account is None:
+            return self.DEFAULT_NAMED_ACCOUNT
+
+        if not self._config.key_exists(f"mastodon.named_accounts.{named_account}"):
+            self._logger.warning(
+                f"{TerminalColor.YELLOW}The named account {named_account} is not defined, " +
+                f"publishing {post.id} through the default one{TerminalColor.END}"
+            )
+            return self.DEFAULT_NAMED_ACCOUNT
+
+        return named_account
+
+    def publish_all_from_queue(self) -> None:
+        if self._queue.is_empty():
+            self._logger.info(
+                f"{TerminalColor.CYAN}The queue is empty, skipping.{TerminalColor.END}"
+            )
+            return
+
+        # Split the queue, keeping the order inside every part
+        parts = {}  # type: dict[str, list[QueuePost]]
+        for post in self._queue.get_all():
+            parts.setdefault(self.get_account_for(post), []).append(post)
+
+        # Connecting is done here, so the threads only publish
+        for named_account, posts in parts.items():
+            self.get_publisher(named_account)
+            self._account_queues[named_account].clean()
+            for post in posts:
+                self._account_queues[named_account].append(post)
+
+        with ThreadPoolExecutor(max_workers=len(parts),
+                                thread_name_prefix="publisher") as executor:
+            futures = {
+                named_account: executor.submit(self._publish_account, named_account)
+                for named_account in parts.keys()
+            }
+
+        published = []
+        for named_account, future in futures.items():
+            try:
+                future.result()
+            except (Exception, MastodonPublisherException) as e:
+                # As when publishing from a single queue, the part that failed is kept
+                self._logger.exception(e)
+                continue
+
+            remaining = set(
+                [x.unique_value() for x in self._account_queues[named_account].get_all()]
+            )
+            published += [x for x in parts[named_account] if x.unique_value() not in remaining]
+
+        if self._is_dry_run:
+            return
+
+        for post in published:
+            self._queue.remove(post)
+        self._logger.debug(f"Attempting to write {self._queue.length()} items in our storage")
+        self._queue.save()
+
+    def _publish_account(self, named_account: str) -> None:
+        self._logger.debug(
+            f"Publishing {self._account_queues[named_account].length()} " +
+            f"queued posts through {named_account}"
+        )
+        try:
+            self._publishers[named_account].publish_all_from_queue()
+        finally:
+            self._publishers[named_account].shutdown_media()
@@ -0,0 +1,53 @@
+from pyxavi.storage import Storage
+import tempfile
+import yaml
+import stat
+import os
+
+
+class AtomicStorage(Storage):
+    '''
+    Storage that writes its file atomically
+
+    The content is dumped into a temporary file in the same directory
+    and then renamed over the original one, so a crash in the middle
+    of the write never leaves a truncated file behind.
+
+    It also remembers the file status of the last read or write,
+    so it can tell when someone else changed the file.
+    '''
+
+    def read_file(self) -> None:
+        super().read_file()
+        self._file_status = self._get_file_status()
+
+    def has_changed(self) -> bool:
+        return self._get_file_status() != self._file_status
+
+    def _get_file_status(self) -> tuple:
+        if not os.path.exists(self._filename):
+            return None
+        status = os.stat(self._filename)
+        return (status.st_mtime_ns, status.st_size, status.st_ino)
+
+    def write_file(self) -> None:
+        directory = os.path.dirname(os.path.abspath(self._filename))
+        descriptor, temporary_file = tempfile.mkstemp(
+            prefix=f".{os.path.basename(self._filename)}.", suffix=".tmp", dir=directory
+        )
+        try:
+            with os.fdopen(descriptor, 'w') as stream:
+                yaml.safe_dump(self._content, stream)
+                stream.flush()
+                os.fsync(stream.fileno())
+
+            # Keep the permissions of the file we're replacing
+            if os.path.exists(self._filename):
+                os.chmod(temporary_file, stat.S_IMODE(os.stat(self._filename).st_mode))
+
+            os.replace(temporary_file, self._filename)
+            self._file_status = self._get_file_status()
+        except BaseException:
+            if os.path.exists(temporary_file):
+                os.remove(temporary_file)
+            raise
@@ -0,0 +1,104 @@
+from pyxavi.config import Config
+from hashlib import sha256
+import tempfile
+import pickle
+import glob
+import os
+
+
+class ConfigCache:
+    '''
+    Snapshot of the merged config files, so the YAML is not parsed on every run
+
+    The main.yaml is loaded first and the rest of the YAML files in the
+    config directory are merged over it, in alphabetical order. The result
+    is pickled together with the modification time, size and hash of every
+    file. While the times and sizes match, the snapshot is taken as is.
+    When they don't, the files are hashed, and only parsed again when their
+    content really changed, or a file appeared or went away.
+    '''
+
+    MAIN_FILE = "main.yaml"
+    VERSION = 1
+
+    def __init__(self, config_dir: str, cache_file: str) -> None:
+        self._config_dir = config_dir
+        self._cache_file = cache_file
+
+    def load(self) -> Config:
+        files = self.get_files()
+        stats = [self._get_file_status(x) for x in files]
+
+        cached = self._read_cache()
+        if cached is not None and cached["stats"] == stats:
+            return Config(params=cached["content"])
+
+        hashes = [self._get_file_hash(x) for x in files]
+        if cached is not None and cached["hashes"] == hashes:
+            # The files were only touched
+            content = cached["content"]
+        else:
+            content = self.merge_files(files)
+
+        self._write_cache(
+            {
+                "version": self.VERSION, "stats": stats, "hashes": hashes, "content": content
+            }
+        )
+        return Config(params=content)
+
+    def get_files(self) -> list:
+        main_file = os.path.join(self._config_dir, self.MAIN_FILE)
+        if not os.path.exists(main_file):
+            raise RuntimeError(f"Config file [{main_file}] not found")
+
+        other_files = [
+            x for x in glob.glob(os.path.join(self._config_dir, "*.yaml"))
+            if os.path.basename(x) != self.MAIN_FILE
+        ]
+        return [main_file] + sorted(other_files)
+
+    def merge_files(self, files: list) -> dict:
+        config = Config(filename=files[0])
+        for file in files[1:]:
+            config.merge_from_file(filename=file)
+
+        return config.get_all()
+
+    def _get_file_status(self, file: str) -> tuple:
+        status = os.stat(file)
+        return (os.path.basename(file), status.st_mtime_ns, status.st_size)
+
+    def _get_file_hash(self, file: str) -> str:
+        with open(file, "rb") as stream:
+            return sha256(stream.read()).hexdigest()
+
+    def _read_cache(self) -> dict:
+        if not os.path.exists(self._cache_file):
+            return None
+
+        try:
+            with open(self._cache_file, "rb") as stream:
+                cached = pickle.load(stream)
+        except Exception:
+            # A broken snapshot is just built again
+            return None
+
+        if not isinstance(cached, dict) or cached.get("version", None) != self.VERSION:
+            return None
+
+        return cached
+
+    def _write_cache(self, cached: dict) -> None:
+        directory = os.path.dirname(os.path.abspath(self._cache_file))
+        try:
+            descriptor, temporary_file = tempfile.mkstemp(
+                prefix=f".{os.path.basename(self._cache_file)}.", suffix=".tmp", dir=directory
+            )
+            with os.fdopen(descriptor, "wb") as stream:
+                pickle.dump(cached, stream, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary_file, self._cache_file)
+        except OSError:
+            # Without a place to keep it, the config is parsed in every run as before
+            if "temporary_file" in locals() and os.path.exists(temporary_file):
+                os.remove(temporary_file)
@@ -0,0 +1,72 @@
+from mastofeed.lib.atomic_storage import AtomicStorage
+from urllib.parse import urlparse, urlunparse
+from threading import RLock
+from time import time
+
+
+class DiscoveryCache:
+    '''
+    Cache of the feed discovery results, per normalized URL
+
+    It keeps what the discovery found, and also when it found nothing,
+    so testing a site and then adding it, or someone repeating the same
+    URL, does not crawl the site again. The found results live for ttl
+    seconds and the empty ones for negative_ttl, as a site may get its
+    feed fixed. The cache is kept in a file, to survive restarts.
+    '''
+
+    DEFAULT_FILE = "storage/discovery_cache.yaml"
+    DEFAULT_TTL = 86400
+    DEFAULT_NEGATIVE_TTL = 3600
+
+    def __init__(self, filename: str = None, ttl: int = None, negative_ttl: int = None) -> None:
+        self._ttl = ttl if ttl is not None else self.DEFAULT_TTL
+        self._negative_ttl = negative_ttl if negative_ttl is not None\
+            else self.DEFAULT_NEGATIVE_TTL
+        self._lock = RLock()
+        self._storage = AtomicStorage(
+            filename=filename if filename is not None else self.DEFAULT_FILE
+        )
+
+    def get(self, method: str, url: str, now: float = None) -> dict:
+        """Returns {"value": result} if there is a fresh result, otherwise None"""
+        now = now if now is not None else time()
+        with self._lock:
+            entry = self._storage.get_hashed(self._key(method, url), None)
+
+        if entry is None or now - entry["at"] >= self._get_ttl(entry["value"]):
+            return None
+
+        return {"value": entry["value"]}
+
+    def set(self, method: str, url: str, value: any, now: float = None) -> None:
+        now = now if now is not None else time()
+        with self._lock:
+            self._storage.set_hashed(self._key(method, url), {"value": value, "at": now})
+            self._prune(now)
+            self._storage.write_file()
+
+    def normalize(self, url: str) -> str:
+        """Same URL regardless of the case of the host, the fragment or the ending slash"""
+        parsed = urlparse(url.strip())
+        return urlunparse(
+            (
+                parsed.scheme.lower(),
+                parsed.netloc.lower(),
+                parsed.path.rstrip("/"),
+                parsed.params,
+                parsed.query,
+                ""
+            )
+        )
+
+    def _key(self, method: str, url: str) -> str:
+        return f"{method} {self.normalize(url)}"
+
+    def _get_ttl(self, value: any) -> int:
+        return self._ttl if value else self._negative_ttl
+
+    def _prune(self, now: float) -> None:
+        for key, entry in list(self._storage.get_all().items()):
+            if now - entry["at"] >= self._get_ttl(entry["value"]):
+                self._storage.delete(key)
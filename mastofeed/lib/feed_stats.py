@@ -0,0 +1,86 @@
+from __future__ import annotations
+from time import time
+
+
+class FeedStats:
+    '''
+    Statistics of the polls of a feed, to guess how often it is worth to poll it
+
+    - last_poll_at: when it was polled for the last time
+    - last_new_at: when it brought new entries for the last time
+    - mean_gap: moving average of the seconds between polls with new entries
+    - empty_polls: polls without new entries since the last one with them
+
+    The interval doubles with every empty poll, so dormant feeds fade away,
+    but it never goes beyond half of the usual gap between new entries,
+    and it goes back to the minimum as soon as the feed brings something new.
+    '''
+
+    STORAGE_KEY = "stats"
+    # Weight of the last gap in the moving average
+    GAP_SMOOTHING = 0.3
+    # Ratio of the interval that we allow to be early, so a feed
+    #   is not skipped just because the cron fired some seconds earlier.
+    DUE_MARGIN = 0.1
+    # The empty polls of a dead feed grow forever, but the interval stops doubling
+    MAX_BACKOFF_EXPONENT = 20
+
+    def __init__(
+        self,
+        last_poll_at: float = None,
+        last_new_at: float = None,
+        mean_gap: float = None,
+        empty_polls: int = 0
+    ) -> None:
+        self.last_poll_at = last_poll_at
+        self.last_new_at = last_new_at
+        self.mean_gap = mean_gap
+        self.empty_polls = empty_polls
+
+    def record_poll(self, new_entries: int, now: float = None) -> None:
+        now = now if now is not None else time()
+        self.last_poll_at = now
+
+        if new_entries == 0:
+            self.empty_polls += 1
+            return
+
+        if self.last_new_at is not None:
+            gap = now - self.last_new_at
+            self.mean_gap = gap if self.mean_gap is None\
+                else self.GAP_SMOOTHING * gap + (1 - self.GAP_SMOOTHING) * self.mean_gap
+        self.last_new_at = now
+        self.empty_polls = 0
+
+    def get_interval(self, min_interval: float, max_interval: float) -> float:
+        interval = min_interval * (2**min(self.empty_polls, self.MAX_BACKOFF_EXPONENT))
+        if self.mean_gap is not None:
+            interval = min(interval, self.mean_gap / 2)
+
+        return max(min_interval, min(interval, max_interval))
+
+    def is_due(self, min_interval: float, max_interval: float, now: float = None) -> bool:
+        if self.last_poll_at is None:
+            return True
+
+        now = now if now is not None else time()
+        interval = self.get_interval(min_interval, max_interval)
+        return now >= self.last_poll_at + interval * (1 - self.DUE_MARGIN)
+
+    def to_dict(self) -> dict:
+        return {
+            "last_poll_at": self.last_poll_at,
+            "last_new_at": self.last_new_at,
+            "mean_gap": self.mean_gap,
+            "empty_polls": self.empty_polls,
+        }
+
+    @staticmethod
+    def from_dict(dictionary: dict) -> FeedStats:
+        dictionary = dictionary if dictionary is not None else {}
+        return FeedStats(
+            last_poll_at=dictionary.get("last_poll_at", None),
+            last_new_at=dictionary.get("last_new_at", None),
+            mean_gap=dictionary.get("mean_gap", None),
+            empty_polls=dictionary.get("empty_polls", 0),
+        )
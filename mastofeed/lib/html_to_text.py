@@ -0,0 +1,125 @@
+from html.parser import HTMLParser
+import re
+
+
+class HtmlToText(HTMLParser):
+    '''
+    Converts HTML into a single line of plain text in one pass
+
+    While parsing, it drops the tags and the content of scripts and styles,
+    collapses the whitespace and stops as soon as it has max_length chars.
+    Block tags become a space, so their texts do not get glued together.
+    '''
+
+    SKIP_CONTENT_TAGS = ["script", "style"]
+    BLOCK_TAGS = [
+        "address",
+        "article",
+        "aside",
+        "blockquote",
+        "br",
+        "dd",
+        "div",
+        "dl",
+        "dt",
+        "figcaption",
+        "figure",
+        "footer",
+        "h1",
+        "h2",
+        "h3",
+        "h4",
+        "h5",
+        "h6",
+        "header",
+        "hr",
+        "li",
+        "ol",
+        "p",
+        "pre",
+        "section",
+        "table",
+        "td",
+        "th",
+        "tr",
+        "ul"
+    ]
+    WHITESPACE = re.compile(r"\s+")
+
+    class MaxLengthReached(Exception):
+        pass
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+
+    def convert(self, html: str, max_length: int = None) -> str:
+        """
+        Returns the text inside the given HTML
+
+        When max_length is given, the text is cut at that length
+        and the rest of the HTML is not even parsed.
+        """
+        self.reset()
+        self._max_length = max_length
+        self._chunks = []  # type: list[str]
+        self._length = 0
+        self._pending_space = False
+        self._skip_depth = 0
+
+        try:
+            self.feed(html)
+            self.close()
+        except HtmlToText.MaxLengthReached:
+            pass
+
+        return "".join(self._chunks)
+
+    def handle_starttag(self, tag: str, attrs: list) -> None:
+        if tag in self.SKIP_CONTENT_TAGS:
+            self._skip_depth += 1
+        elif tag in self.BLOCK_TAGS:
+            self._pending_space = True
+
+    def handle_startendtag(self, tag: str, attrs: list) -> None:
+        if tag in self.BLOCK_TAGS:
+            self._pending_space = True
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag in self.SKIP_CONTENT_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in self.BLOCK_TAGS:
+            self._pending_space = True
+
+    def handle_data(self, data: str) -> None:
+        if self._skip_depth > 0:
+            return
+
+        for word in self.WHITESPACE.split(data):
+            if word == "":
+                # The data started or ended with whitespace
+                self._pending_space = True
+                continue
+            if self._pending_space and self._length > 0:
+                self._append(" ")
+            self._pending_space = True
+            self._append(word)
+
+        # The last word is not followed by a space unless the data said so
+        self._pending_space = data[-1:].isspace() if data else self._pending_space
+
+    def _append(self, text: str) -> None:
+        if self._max_length is not None and self._length + len(text) >= self._max_length:
+            self._chunks.append(text[:self._max_length - self._length])
+            self._length = self._max_length
+            raise HtmlToText.MaxLengthReached()
+
+        self._chunks.append(text)
+        self._length += len(text)
+
+
+def html_to_text(html: str, max_length: int = None) -> str:
+    """Shortcut to convert HTML into plain text. Returns an empty string for None"""
+    if html is None:
+        return ""
+
+    return HtmlToText().convert(html, max_length=max_length)
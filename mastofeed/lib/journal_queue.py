@@ -0,0 +1,283 @@
+from pyxavi.queue_stack import Queue, QueueItemProtocol, SimpleQueueItem
+from mastofeed.lib.atomic_storage import AtomicStorage
+from contextlib import contextmanager
+from itertools import count
+import logging
+import fcntl
+import heapq
+import json
+import os
+
+
+class JournalQueue(Queue):
+    '''
+    Queue stored in a YAML snapshot plus an append-only journal
+
+    Every save() only appends the operations done since the last one
+    to the journal, and the snapshot is rewritten (compacted) once the
+    journal grows over a threshold. The snapshot keeps the same format
+    as the pyxavi Queue file, so both can read it.
+
+    In memory the items are kept in a heap ordered by their sort value
+    and in a dict by their unique value, so appending, popping and
+    deduplicating never walk the whole queue.
+
+    The feed run and the queue publisher can share the files, so every
+    load, save and compaction holds a lock file. Before writing, the
+    changes that another process saved meanwhile are read back and the
+    pending operations are replayed over them.
+    '''
+
+    DEFAULT_COMPACT_AFTER = 500
+    JOURNAL_SUFFIX = ".journal"
+    LOCK_SUFFIX = ".lock"
+    OP_APPEND = "append"
+    OP_REMOVE = "remove"
+    OP_CLEAN = "clean"
+
+    def __init__(
+        self,
+        logger: logging.Logger = None,
+        storage_file: str = None,
+        queue_item_object: QueueItemProtocol = SimpleQueueItem,
+        compact_after: int = None
+    ) -> None:
+        self._storage_file = storage_file
+        self._journal_file = storage_file + self.JOURNAL_SUFFIX\
+            if storage_file is not None else None
+        self._lock_file = storage_file + self.LOCK_SUFFIX\
+            if storage_file is not None else None
+        self._compact_after = compact_after if compact_after is not None\
+            else self.DEFAULT_COMPACT_AFTER
+        super().__init__(logger=logger, storage_file=None, queue_item_object=queue_item_object)
+
+    def load(self) -> int:
+        self._pending = []  # type: list[dict]
+
+        # Nothing to read yet, so no need to create the lock file
+        if self._storage_file is None or not os.path.exists(self._storage_file):
+            self._read_files()
+            return self.length()
+
+        with self._locked():
+            self._read_files()
+
+        return self.length()
+
+    def append(self, item: QueueItemProtocol) -> None:
+        # The dict on the unique value makes the deduplication happen here
+        if self._push(item):
+            self._pending.append({"op": self.OP_APPEND, "item": item.to_dict()})
+
+    def sort(self, param: str = None) -> None:
+        # The heap is always sorted
+        pass
+
+    def deduplicate(self, param: str = None) -> None:
+        # Duplicates never get in
+        pass
+
+    def save(self) -> None:
+        if self._storage_file is None:
+            self._logger.warning(
+                "This queue has no state and a call to save() is received. Ignoring"
+            )
+            return
+
+        if len(self._pending) == 0:
+            return
+
+        with self._locked():
+            self._merge_changes_from_disk()
+
+            if self._journal_length + len(self._pending) > self._compact_after:
+                self._compact()
+                return
+
+            self._logger.debug(f"Journaling {len(self._pending)} queue operations")
+            with open(self._journal_file, "a") as stream:
+                for operation in self._pending:
+                    stream.write(
+                        json.dumps({
+                            **operation, "generation": self._generation
+                        }) + "\n"
+                    )
+                stream.flush()
+                os.fsync(stream.fileno())
+                self._journal_offset = stream.tell()
+
+            self._journal_length += len(self._pending)
+            self._pending = []
+
+    def compact(self) -> None:
+        """Rewrites the snapshot with the current queue and discards the journal"""
+        with self._locked():
+            self._merge_changes_from_disk()
+            self._compact()
+
+    def is_empty(self) -> bool:
+        return len(self._items) == 0
+
+    def get_all(self) -> list:
+        return [self._items[entry[2]] for entry in sorted(self._valid_entries())]
+
+    def clean(self) -> None:
+        self._heap = []
+        self._items = {}
+        self._sequences = {}
+        self._pending.append({"op": self.OP_CLEAN})
+
+    def length(self) -> int:
+        return len(self._items)
+
+    def pop(self) -> QueueItemProtocol:
+        if self._discard_stale_head() is None:
+            return None
+
+        _, _, unique = heapq.heappop(self._heap)
+        item = self._items.pop(unique)
+        del self._sequences[unique]
+        self._pending.append({"op": self.OP_REMOVE, "id": unique})
+        return item
+
+    def remove(self, item: QueueItemProtocol) -> None:
+        """Takes the item out of the queue, wherever it is"""
+        unique = item.unique_value()
+        if unique not in self._items:
+            return
+
+        # The heap entry gets discarded lazily
+        del self._items[unique]
+        del self._sequences[unique]
+        self._pending.append({"op": self.OP_REMOVE, "id": unique})
+
+    def unpop(self, item: QueueItemProtocol) -> None:
+        # It goes back to its place, which is the head for a just popped item
+        self.append(item)
+
+    def first(self) -> QueueItemProtocol:
+        head = self._discard_stale_head()
+        return self._items[head[2]] if head is not None else None
+
+    def last(self) -> QueueItemProtocol:
+        entries = list(self._valid_entries())
+        return self._items[max(entries)[2]] if entries else None
+
+    @contextmanager
+    def _locked(self):
+        # Exclusive between processes, released when the file gets closed
+        with open(self._lock_file, "a") as lock:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            yield
+
+    def _read_files(self) -> None:
+        self._heap = []  # type: list[tuple]
+        self._items = {}  # type: dict[any, QueueItemProtocol]
+        self._sequences = {}  # type: dict[any, int]
+        self._counter = count()
+        self._generation = 0
+        self._journal_length = 0
+        self._journal_offset = 0
+
+        if self._storage_file is None:
+            return
+
+        self._queue_manager = AtomicStorage(filename=self._storage_file)
+        self._generation = self._queue_manager.get("generation", 0)
+        for item in self._queue_manager.get("queue", []):
+            self._push(self._queue_item_object.from_dict(item))
+
+        # Replay the journal. Lines from an older generation were already
+        #   compacted into the snapshot, in case we crashed before removing it.
+        if not os.path.exists(self._journal_file):
+            return
+
+        discarded = 0
+        with open(self._journal_file, "r") as stream:
+            for line in stream:
+                if not line.strip():
+                    continue
+                operation = json.loads(line)
+                if operation["generation"] == self._generation:
+                    self._apply(operation)
+                    self._journal_length += 1
+                else:
+                    discarded += 1
+        # We hold the lock, so nobody writes in between
+        self._journal_offset = os.path.getsize(self._journal_file)
+
+        if discarded > 0:
+            self._logger.warning(
+                f"Discarded {discarded} journal lines of the queue, " +
+                f"already compacted before generation {self._generation}"
+            )
+
+    def _merge_changes_from_disk(self) -> None:
+        """Reads what other processes saved, replaying the pending operations over it"""
+        journal_size = os.path.getsize(self._journal_file)\
+            if os.path.exists(self._journal_file) else 0
+        if not self._queue_manager.has_changed() and journal_size == self._journal_offset:
+            return
+
+        self._logger.debug(
+            f"The queue changed on disk, merging {len(self._pending)} pending operations"
+        )
+        pending = self._pending
+        self._read_files()
+        for operation in pending:
+            self._apply(operation)
+        self._pending = pending
+
+    def _compact(self) -> None:
+        self._logger.debug(f"Compacting the queue of {self.length()} items")
+        self._generation += 1
+        self._queue_manager.set("generation", self._generation)
+        self._queue_manager.set("queue", [x.to_dict() for x in self.get_all()])
+        self._queue_manager.write_file()
+
+        if os.path.exists(self._journal_file):
+            os.remove(self._journal_file)
+        self._journal_length = 0
+        self._journal_offset = 0
+        self._pending = []
+
+    def _push(self, item: QueueItemProtocol) -> bool:
+        unique = item.unique_value()
+        if unique is None:
+            raise RuntimeError("The unique value can't be None while deduplicating.")
+        if unique in self._items:
+            return False
+
+        self._items[unique] = item
+        # The counter breaks the ties keeping the insertion order
+        self._sequences[unique] = next(self._counter)
+        heapq.heappush(self._heap, (item.sort_value(), self._sequences[unique], unique))
+        return True
+
+    def _apply(self, operation: dict) -> None:
+        if operation["op"] == self.OP_APPEND:
+            self._push(self._queue_item_object.from_dict(operation["item"]))
+        elif operation["op"] == self.OP_REMOVE:
+            # The heap entry gets discarded lazily
+            self._items.pop(operation["id"], None)
+            self._sequences.pop(operation["id"], None)
+        elif operation["op"] == self.OP_CLEAN:
+            self._heap = []
+            self._items = {}
+            self._sequences = {}
+
+    def _valid_entries(self):
+        return (entry for entry in self._heap if self._is_current(entry))
+
+    def _is_current(self, entry: tuple) -> bool:
+        # Removed items leave their entry behind, and so does an item
+        #   removed and appended again.
+        return self._sequences.get(entry[2], None) == entry[1]
+
+    def _discard_stale_head(self) -> tuple:
+        while len(self._heap) > 0:
+            head = self._heap[0]
+            if self._is_current(head):
+                return head
+            heapq.heappop(self._heap)
+        return None
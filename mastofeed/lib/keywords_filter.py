@@ -1,15 +1,35 @@
 from pyxavi.config import Config
-from bs4 import BeautifulSoup
+from mastofeed.lib.text_normalizer import TextNormalizer
 import logging
+import re
 
 
 class KeywordsFilter:
+    '''
+    Allows or discards texts depending on the keywords of a profile
+
+    Every profile is compiled once into a single regular expression
+    that alternates all its keywords, so a text is checked in one pass
+    no matter how many keywords the profile has.
+
+    The texts are normalized once per cache_key (usually the post ID),
+    and shared by all the profiles checked against them.
+    '''
+
+    MAX_CACHED_TEXTS = 1000
 
     def __init__(self, config: Config) -> None:
         self._config = config
         self._logger = logging.getLogger(config.get("logger.name"))
+        self._compiled_profiles = {}  # type: dict[str, re.Pattern]
+        self._cleaned_texts = {}  # type: dict[any, str]
+        self._normalizer = TextNormalizer(
+            unicode_folding=config.get("keywords_filter.unicode_folding", False)
+        )
 
-    def profile_allows_text(self, profile: str, text: str) -> bool:
+    def profile_allows_text(
+        self, profile: str, text: str, cache_key: any = None, is_html: bool = True
+    ) -> bool:
         if profile not in self._config.get("keywords_filter.profiles", []):
             self._logger.warning(
                 f"Can't find the profile [{profile}] in the config's Keyword Filters"
@@ -17,41 +37,38 @@ class KeywordsFilter:
             # If the profile does not exist, assume that is not set up, so all is allowed
             return True
 
-        keywords = self._config.get(f"keywords_filter.profiles.{profile}.keywords", [])
-        text = self._clean_text(text)
-
-        for keyword in keywords:
-            if keyword in text:
-                return True
-
-        return False
-
-    def _clean_text(self, text: str) -> str:
-        # Remove HTML
-        text = ''.join(BeautifulSoup(text, "html.parser").findAll(text=True))
-
-        # All text to lowercase
-        text = text.lower()
-
-        # Map characters
-        mapping = {
-            "à": "a",
-            "á": "a",
-            "è": "e",
-            "é": "e",
-            "ì": "i",
-            "í": "i",
-            "ò": "o",
-            "ó": "o",
-            "ù": "u",
-            "ú": "u",
-            "ç": "c",
-            "ñ": "n"
-        }
-        text: text.translate(mapping)
-
-        # Remove characters
-        mapping = {"-": None, ".": None}
-        text: text.translate(mapping)
-
-        return text
+        pattern = self._get_compiled_profile(profile)
+        if pattern is None:
+            return False
+
+        return pattern.search(
+            self._clean_text(text, cache_key=cache_key, is_html=is_html)
+        ) is not None
+
+    def _get_compiled_profile(self, profile: str) -> re.Pattern:
+        if profile not in self._compiled_profiles:
+            keywords = [
+                self._normalizer.normalize(keyword) for keyword in
+                self._config.get(f"keywords_filter.profiles.{profile}.keywords", [])
+            ]
+            # Longest first, so a keyword never hides a longer one that starts the same
+            self._compiled_profiles[profile] = re.compile(
+                "|".join(
+                    re.escape(keyword)
+                    for keyword in sorted(set(keywords), key=len, reverse=True)
+                )
+            ) if keywords else None
+
+        return self._compiled_profiles[profile]
+
+    def _clean_text(self, text: str, cache_key: any = None, is_html: bool = True) -> str:
+        if cache_key is None:
+            return self._normalizer.normalize(text, is_html=is_html)
+
+        if cache_key not in self._cleaned_texts:
+            if len(self._cleaned_texts) >= self.MAX_CACHED_TEXTS:
+                # Forget the oldest one
+                del self._cleaned_texts[next(iter(self._cleaned_texts))]
+            self._cleaned_texts[cache_key] = self._normalizer.normalize(text, is_html=is_html)
+
+        return self._cleaned_texts[cache_key]
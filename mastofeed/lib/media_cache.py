@@ -0,0 +1,226 @@
+from __future__ import annotations
+from mastofeed.lib.atomic_storage import AtomicStorage
+from hashlib import sha256
+from threading import Lock, RLock
+from time import time
+import logging
+import os
+
+
+class MediaCache:
+    '''
+    Content addressed cache of the media that we download and upload
+
+    Every URL points to the hash of its content, and every content keeps
+    a single file in the media storage, its mime type, size and last use,
+    and the Mastodon media ID it got when uploaded by every account. So the
+    same image shared by several posts is stored and uploaded once.
+
+    Mastodon does not allow to attach a media to a second status, so an
+    ID is only reused while it is not attached yet (i.e. the status failed)
+    and younger than reuse_media_id_for seconds, as the instance removes
+    the unattached media after a while.
+
+    The contents not used for max_age seconds are evicted, and then the
+    least recently used ones until the cache fits in max_size bytes.
+
+    There is a single instance per file in the process, shared by the
+    publishers of all the accounts.
+    '''
+
+    DEFAULT_FILE = "storage/media_cache.yaml"
+    DEFAULT_MAX_SIZE = 104857600
+    DEFAULT_MAX_AGE = 604800
+    DEFAULT_REUSE_MEDIA_ID_FOR = 3600
+    HASH_LENGTH = 16
+    CHUNK_SIZE = 65536
+    DEFAULT_ACCOUNT = "default"
+
+    _instances = {}  # type: dict[str, MediaCache]
+    _instances_lock = RLock()
+
+    def __init__(
+        self,
+        media_storage: str,
+        filename: str = None,
+        max_size: int = None,
+        max_age: int = None,
+        reuse_media_id_for: int = None,
+        logger: logging.Logger = None
+    ) -> None:
+        self._media_storage = media_storage
+        self._max_size = max_size if max_size is not None else self.DEFAULT_MAX_SIZE
+        self._max_age = max_age if max_age is not None else self.DEFAULT_MAX_AGE
+        self._reuse_media_id_for = reuse_media_id_for if reuse_media_id_for is not None\
+            else self.DEFAULT_REUSE_MEDIA_ID_FOR
+        self._logger = logger if logger is not None else logging.getLogger()
+        self._lock = Lock()
+
+        self._storage = AtomicStorage(
+            filename=filename if filename is not None else self.DEFAULT_FILE
+        )
+        self._urls = self._storage.get("urls", None) or {}  # type: dict[str, str]
+        self._contents = self._storage.get("contents", None) or {}  # type: dict[str, dict]
+
+    @staticmethod
+    def get_instance(
+        media_storage: str,
+        filename: str = None,
+        max_size: int = None,
+        max_age: int = None,
+        reuse_media_id_for: int = None,
+        logger: logging.Logger = None
+    ) -> MediaCache:
+        filename = filename if filename is not None else MediaCache.DEFAULT_FILE
+        key = os.path.abspath(filename)
+        with MediaCache._instances_lock:
+            if key not in MediaCache._instances:
+                MediaCache._instances[key] = MediaCache(
+                    media_storage=media_storage,
+                    filename=filename,
+                    max_size=max_size,
+                    max_age=max_age,
+                    reuse_media_id_for=reuse_media_id_for,
+                    logger=logger
+                )
+            return MediaCache._instances[key]
+
+    def get(self, url: str, account: str = None, now: float = None) -> dict:
+        """
+        Returns the cached content of the URL, or None if it is not cached
+
+        The returned "media_id" is the one of the account, None when it can not be reused.
+        """
+        now = now if now is not None else time()
+        with self._lock:
+            content_hash = self._urls.get(self._hash_url(url), None)
+            content = self._contents.get(content_hash, None)
+            if content is None or not os.path.exists(content["file"]):
+                return None
+
+            content["last_used_at"] = now
+            return self._describe(content_hash, content, account, now)
+
+    def add(
+        self,
+        url: str,
+        file: str,
+        mime_type: str = None,
+        account: str = None,
+        now: float = None
+    ) -> dict:
+        """
+        Registers a downloaded file for the URL
+
+        The file is renamed after its content hash. If the same content
+        was already cached under another URL, the new file is removed.
+        """
+        now = now if now is not None else time()
+        content_hash = self._hash_file(file)
+        with self._lock:
+            content = self._contents.get(content_hash, None)
+            if content is not None and os.path.exists(content["file"]):
+                if os.path.abspath(file) != os.path.abspath(content["file"]):
+                    os.remove(file)
+            else:
+                cached_file = os.path.join(
+                    self._media_storage,
+                    content_hash[:self.HASH_LENGTH] + os.path.splitext(file)[1]
+                )
+                os.replace(file, cached_file)
+                content = {
+                    "file": cached_file,
+                    "mime_type": mime_type,
+                    "size": os.path.getsize(cached_file),
+                    "media_ids": {},
+                }
+                self._contents[content_hash] = content
+
+            content["last_used_at"] = now
+            self._urls[self._hash_url(url)] = content_hash
+            return self._describe(content_hash, content, account, now)
+
+    def set_media_id(
+        self, url: str, media_id: str, account: str = None, now: float = None
+    ) -> None:
+        with self._lock:
+            content = self._contents.get(self._urls.get(self._hash_url(url), None), None)
+            if content is not None:
+                content["media_ids"][self._account(account)] = {
+                    "id": media_id, "uploaded_at": now if now is not None else time()
+                }
+
+    def mark_attached(self, media_ids: list, account: str = None) -> None:
+        """The media IDs are now attached to a status, so they can't be reused"""
+        account = self._account(account)
+        with self._lock:
+            for content in self._contents.values():
+                uploaded = content["media_ids"].get(account, None)
+                if uploaded is not None and uploaded["id"] in media_ids:
+                    del content["media_ids"][account]
+
+    def evict(self, now: float = None) -> int:
+        """Removes the expired contents and then the LRU ones above max_size"""
+        now = now if now is not None else time()
+        with self._lock:
+            to_remove = []
+            remaining = []
+            for content_hash, content in self._contents.items():
+                if not os.path.exists(content["file"]) or\
+                   now - content["last_used_at"] > self._max_age:
+                    to_remove.append(content_hash)
+                else:
+                    remaining.append(content_hash)
+
+            remaining.sort(key=lambda x: self._contents[x]["last_used_at"])
+            total_size = sum([self._contents[x]["size"] for x in remaining])
+            while total_size > self._max_size and len(remaining) > 0:
+                content_hash = remaining.pop(0)
+                total_size -= self._contents[content_hash]["size"]
+                to_remove.append(content_hash)
+
+            for content_hash in to_remove:
+                file = self._contents.pop(content_hash)["file"]
+                if os.path.exists(file):
+                    os.remove(file)
+            for url_hash, content_hash in list(self._urls.items()):
+                if content_hash not in self._contents:
+                    del self._urls[url_hash]
+
+        if len(to_remove) > 0:
+            self._logger.debug(f"Evicted {len(to_remove)} media from the cache")
+        return len(to_remove)
+
+    def get_total_size(self) -> int:
+        return sum([content["size"] for content in self._contents.values()])
+
+    def save(self) -> None:
+        with self._lock:
+            self._storage.set("urls", self._urls)
+            self._storage.set("contents", self._contents)
+            self._storage.write_file()
+
+    def _describe(self, content_hash: str, content: dict, account: str, now: float) -> dict:
+        uploaded = content["media_ids"].get(self._account(account), None)
+        reusable = uploaded is not None and now - uploaded["uploaded_at"
+                                                           ] < self._reuse_media_id_for
+
+        return {
+            "file": content["file"],
+            "mime_type": content["mime_type"],
+            "content_hash": content_hash,
+            "media_id": uploaded["id"] if reusable else None
+        }
+
+    def _account(self, account: str = None) -> str:
+        return account if account is not None else self.DEFAULT_ACCOUNT
+
+    def _hash_url(self, url: str) -> str:
+        return sha256(url.encode()).hexdigest()
+
+    def _hash_file(self, file: str) -> str:
+        hasher = sha256()
+        with open(file, "rb") as stream:
+            for block in iter(lambda: stream.read(self.CHUNK_SIZE), b""):
+                hasher.update(block)
+        return hasher.hexdigest()
@@ -0,0 +1,124 @@
+from concurrent.futures import ThreadPoolExecutor, Future
+from urllib.parse import urlparse
+from hashlib import sha256
+from threading import Lock
+from pathlib import Path
+import mimetypes
+import tempfile
+import requests
+import logging
+import os
+
+
+class MediaPipeline:
+    '''
+    Downloads the media of the queued posts in the background
+
+    Every URL is downloaded into its own file in the media storage, so
+    the Publisher finds it already there when the post gets its turn.
+    The file belongs to whoever fetches it, usually to be moved into the
+    MediaCache, so the publishers of several accounts can download the
+    same URL at the same time. Downloads run in a pool of workers.
+    '''
+
+    DEFAULT_MAX_WORKERS = 4
+    DEFAULT_TIMEOUT = 30
+    HASH_LENGTH = 16
+    CHUNK_SIZE = 65536
+
+    def __init__(
+        self,
+        media_storage: str,
+        max_workers: int = None,
+        timeout: int = None,
+        logger: logging.Logger = None
+    ) -> None:
+        self._media_storage = media_storage
+        self._max_workers = max_workers if max_workers is not None\
+            else self.DEFAULT_MAX_WORKERS
+        self._timeout = timeout if timeout is not None else self.DEFAULT_TIMEOUT
+        self._logger = logger if logger is not None else logging.getLogger()
+        self._executor = None  # type: ThreadPoolExecutor
+        self._downloads = {}  # type: dict[str, Future]
+        self._lock = Lock()
+
+    def prefetch(self, media: list) -> int:
+        """Starts downloading the given media items. Returns how many were started"""
+        started = 0
+        for item in media:
+            url = item.get("url", None)
+            if url is None:
+                continue
+            with self._lock:
+                if url in self._downloads:
+                    continue
+                self._downloads[url] = self._get_executor().submit(self._download, url)
+            started += 1
+
+        return started
+
+    def fetch(self, url: str) -> dict:
+        """
+        Returns the downloaded file of the URL as {"file", "mime_type"}
+
+        It waits for the download if it is in progress,
+        or does it now if it was not prefetched.
+        The file is handed over to the caller.
+        """
+        with self._lock:
+            download = self._downloads.pop(url, None)
+        if download is None:
+            download = self._get_executor().submit(self._download, url)
+
+        return {"file": download.result(), "mime_type": self.guess_mime_type(url)}
+
+    def guess_mime_type(self, url: str) -> str:
+        return mimetypes.guess_type(urlparse(url).path)[0]
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+        # Nobody is going to take the prefetched files that are left
+        with self._lock:
+            downloads = list(self._downloads.values())
+            self._downloads = {}
+        for download in downloads:
+            if download.cancelled() or download.exception() is not None:
+                continue
+            if os.path.exists(download.result()):
+                os.remove(download.result())
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self._max_workers, thread_name_prefix="media-fetch"
+            )
+        return self._executor
+
+    def _download(self, url: str) -> str:
+        Path(self._media_storage).mkdir(parents=True, exist_ok=True)
+
+        # A unique name, so two downloads of the same URL never share the file.
+        #   It is only handed over once complete, so it is never taken half done.
+        descriptor, filename = tempfile.mkstemp(
+            prefix=sha256(url.encode()).hexdigest()[:self.HASH_LENGTH] + ".",
+            suffix=os.path.splitext(urlparse(url).path)[1],
+            dir=self._media_storage
+        )
+        try:
+            with os.fdopen(descriptor, "wb") as stream:
+                with requests.get(url, stream=True, allow_redirects=True,
+                                  timeout=self._timeout) as response:
+                    if not response.ok:
+                        raise RuntimeError(f"Could not download {url}: {response.status_code}")
+                    for block in response.iter_content(self.CHUNK_SIZE):
+                        stream.write(block)
+        except BaseException:
+            if os.path.exists(filename):
+                os.remove(filename)
+            raise
+
+        self._logger.debug(f"Downloaded {url} into {filename}")
+        return filename
@@ -2,31 +2,191 @@ from __future__ import annotations
 from mastodon import StreamListener
 from pyxavi.config import Config
 from pyxavi.logger import Logger
-from pyxavi.storage import Storage
 from pyxavi.mastodon_helper import StatusPost, StatusPostVisibility
 from pyxavi.url import Url
 from mastofeed.lib.publisher import Publisher
+from mastofeed.lib.storage_backend import StorageBackend
+from mastofeed.lib.storage_protocol import FeedsStorageProtocol
+from mastofeed.lib.html_to_text import html_to_text
+from mastofeed.lib.discovery_cache import DiscoveryCache
+from mastofeed.lib.atomic_storage import AtomicStorage
 from definitions import ROOT_DIR
 from slugify import slugify
-from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, RLock, Thread
+from time import time
 import re
 
 
 class MentionsListener(StreamListener):
+    '''
+    Listens to the notifications that arrive through the streaming
+
+    The streaming thread only queues the mentions, and a pool of workers
+    processes them, so a slow feed discovery never stalls the stream.
+
+    It remembers the ID of the last processed mention, so after a
+    reconnection the ones that arrived meanwhile are caught up from the
+    notifications API, and the ones that come twice are processed once.
+    '''
 
     NOTIFICATION_TYPE_MENTION = "mention"
+    DEFAULT_WORKERS = 2
+    DEFAULT_CATCH_UP_LIMIT = 40
 
     def load_config(self, config: Config):
         self._config = config
+        # Set up once, and shared by the parsers of all the mentions
+        self._context = MentionContext(config=config)
+        self._executor = ThreadPoolExecutor(
+            max_workers=config.get("mentions_listener.workers", self.DEFAULT_WORKERS),
+            thread_name_prefix="mention"
+        )
+        self._catch_up_limit = config.get(
+            "mentions_listener.catch_up_limit", self.DEFAULT_CATCH_UP_LIMIT
+        )
+        self._state_lock = Lock()
+        self._pending_ids = set()
+        self._finished_ids = set()
+        self._catch_up_with = None
+        self.last_event_at = None
+
+        state_file = config.get("mentions_listener.state_file", None)
+        self._state = AtomicStorage(filename=state_file) if state_file is not None else None
+        self.last_notification_id = self._state.get("last_notification_id", None)\
+            if self._state is not None else None
 
     def on_notification(self, notification):
+        self.last_event_at = time()
 
         # Discard notifications that are not mentions
         if notification.type != self.NOTIFICATION_TYPE_MENTION:
             return False
 
+        if not self._start_processing(notification.id):
+            self._context.logger.debug(f"Mention {notification.id} already processed")
+            return False
+
+        self._executor.submit(self.process_mention, notification)
+        return True
+
+    def handle_heartbeat(self):
+        self.last_event_at = time()
+
+        # The stream is connected, so nothing is missed after the catch up
+        with self._state_lock:
+            mastodon, self._catch_up_with = self._catch_up_with, None
+        if mastodon is not None:
+            self._executor.submit(self.catch_up, mastodon)
+
+    def request_catch_up(self, mastodon) -> None:
+        """Catches up the missed mentions once the stream is connected"""
+        with self._state_lock:
+            self._catch_up_with = mastodon
+
+    def catch_up(self, mastodon) -> int:
+        """
+        Queues the mentions received after the last processed one
+
+        They come in a single request of up to catch_up_limit mentions,
+        the oldest ones first. Returns how many were queued.
+        """
+        if self.last_notification_id is None:
+            self._context.logger.debug("No processed mention yet, nothing to catch up")
+            return 0
+
+        try:
+            notifications = mastodon.notifications(
+                min_id=self.last_notification_id,
+                types=[self.NOTIFICATION_TYPE_MENTION],
+                limit=self._catch_up_limit
+            )
+        except Exception as e:
+            self._context.logger.exception(e)
+            return 0
+
+        queued = 0
+        for notification in sorted(notifications, key=lambda x: self._id_key(x.id)):
+            if self.on_notification(notification):
+                queued += 1
+
+        if len(notifications) >= self._catch_up_limit:
+            self._context.logger.warning(
+                f"Caught up the maximum of {self._catch_up_limit} mentions, " +
+                "the older ones after them are missed"
+            )
+        if queued > 0:
+            self._context.logger.info(f"Caught up {queued} missed mentions")
+        return queued
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stops the workers, by default once the queued mentions are processed"""
+        self._executor.shutdown(wait=wait)
+
+    def process_mention(self, notification) -> None:
+        try:
+            self._process_mention(notification)
+        except Exception as e:
+            # Nobody waits for the worker, so it is our last chance to know
+            self._context.logger.exception(e)
+        finally:
+            # Also when it failed, so a broken mention is not retried forever
+            self._finish_processing(notification.id)
+
+    def _start_processing(self, notification_id) -> bool:
+        with self._state_lock:
+            if notification_id in self._pending_ids or\
+               not self._is_newer(notification_id, self.last_notification_id):
+                return False
+            self._pending_ids.add(notification_id)
+            return True
+
+    def _finish_processing(self, notification_id) -> None:
+        with self._state_lock:
+            self._pending_ids.discard(notification_id)
+            if not self._is_comparable(notification_id):
+                return
+            self._finished_ids.add(notification_id)
+
+            # The workers finish in any order. Only what has nothing older
+            #   still in process counts as processed, to not skip it after a crash.
+            pending = [x for x in self._pending_ids if self._is_comparable(x)]
+            oldest_pending = min(pending, key=self._id_key) if len(pending) > 0 else None
+            done = [
+                x for x in self._finished_ids
+                if oldest_pending is None or self._is_newer(oldest_pending, x)
+            ]
+            if len(done) == 0:
+                return
+
+            self._finished_ids.difference_update(done)
+            newest = max(done, key=self._id_key)
+            if self._is_newer(newest, self.last_notification_id):
+                self.last_notification_id = newest
+                self._save_state()
+
+    def _save_state(self) -> None:
+        if self._state is not None:
+            self._state.set("last_notification_id", self.last_notification_id)
+            self._state.write_file()
+
+    def _is_newer(self, notification_id, than_id) -> bool:
+        if than_id is None or not self._is_comparable(notification_id)\
+           or not self._is_comparable(than_id):
+            return True
+        return self._id_key(notification_id) > self._id_key(than_id)
+
+    def _is_comparable(self, notification_id) -> bool:
+        return isinstance(notification_id, (int, str))
+
+    def _id_key(self, notification_id) -> tuple:
+        # The IDs are numbers, that may come as strings of any length
+        return (len(str(notification_id)), str(notification_id))
+
+    def _process_mention(self, notification) -> None:
+
         # There we go
-        mention_parser = MentionParser(config=self._config)
+        mention_parser = MentionParser(config=self._config, context=self._context)
 
         # Load the mention notification. It will already validate the params
         mention_parser.load_mention(notification=notification)
@@ -34,13 +194,92 @@ class MentionsListener(StreamListener):
         # Now we parse the notification to get what do we need to do
         mention_parser.parse()
 
-        # Now we execute the action we parsed
-        mention_parser.execute()
+        # Now we execute the action we parsed.
+        #   The workers take turns to touch the feeds storage.
+        with self._context.lock:
+            mention_parser.execute()
 
         # And finally we answer back
         mention_parser.answer_back()
 
 
+class MentionContext:
+    '''
+    What the MentionParsers need, kept between mentions
+
+    The logger, the feeds storage and the Publisher, with its connection,
+    are set up once. The feeds storage is only read again when someone
+    else changed it, like the feed runner saving its state.
+
+    It also runs the feed discoveries, giving up on them after a timeout,
+    and remembers their results in the DiscoveryCache.
+    '''
+
+    DEFAULT_DISCOVERY_TIMEOUT = 30
+
+    def __init__(self, config: Config) -> None:
+        self.logger = Logger(config=config).get_logger()
+        self.publisher = Publisher(config=config, base_path=ROOT_DIR)
+        self.lock = RLock()
+        self._feeds_storage = StorageBackend(config=config).get_feeds_storage()
+        self._discovery_timeout = config.get(
+            "mentions_listener.discovery_timeout", self.DEFAULT_DISCOVERY_TIMEOUT
+        )
+        self._discovery_cache = DiscoveryCache(
+            filename=config.get("mentions_listener.discovery_cache.file", None),
+            ttl=config.get("mentions_listener.discovery_cache.ttl", None),
+            negative_ttl=config.get("mentions_listener.discovery_cache.negative_ttl", None)
+        ) if config.get("mentions_listener.discovery_cache.active", True) else None
+
+    def get_feeds_storage(self) -> FeedsStorageProtocol:
+        with self.lock:
+            if self._feeds_storage.has_changed():
+                self.logger.debug("The feeds storage changed, reloading it")
+                self._feeds_storage.read_file()
+
+        return self._feeds_storage
+
+    def discover(self, method, url: str, default: any = None) -> any:
+        """
+        Calls the discovery method for the URL, returning default after the timeout
+
+        The Url methods do not take a timeout, so the call runs in its own
+        thread, which is left behind to finish on its own when it's too slow.
+        """
+        if self._discovery_cache is not None:
+            cached = self._discovery_cache.get(method.__name__, url)
+            if cached is not None:
+                self.logger.debug(f"Discovery of {url} taken from the cache")
+                return cached["value"]
+
+        result = {}
+
+        def run_discovery() -> None:
+            # The error is given back to be logged, it would die in the thread otherwise
+            try:
+                result.update(value=method(url))
+            except Exception as e:
+                result.update(error=e)
+
+        thread = Thread(target=run_discovery, name="discovery", daemon=True)
+        thread.start()
+        thread.join(timeout=self._discovery_timeout)
+        if thread.is_alive():
+            self.logger.warning(
+                f"Could not discover {url} in {self._discovery_timeout} seconds"
+            )
+            return default
+        if "error" in result:
+            self.logger.exception(f"Could not discover {url}", exc_info=result["error"])
+            return default
+
+        # A timeout or an error are not a result, so only the finished ones are kept
+        if self._discovery_cache is not None:
+            self._discovery_cache.set(method.__name__, url, result["value"])
+
+        return result["value"]
+
+
 class MentionParser:
 
     ERROR_INVALID_ACTION = "I don't understand the action."
@@ -65,7 +304,6 @@ class MentionParser:
         "list -> Will show all the records I have"
     INFO_LIST_HEADER = "The registered Feeds are:\n\n"
 
-    DEFAULT_STORAGE_FILE = "storage/feeds.yaml"
     REGEXP_TEXT_WITHIN_QUOTES = r'"([\w+_\./\\\'\’\`\s\-]*)"'
 
     mention: Mention = None
@@ -75,14 +313,15 @@ class MentionParser:
     answer: StatusPost = None
     me: str = None
 
-    def __init__(self, config: Config) -> None:
+    def __init__(self, config: Config, context: MentionContext = None) -> None:
 
         self._config = config
-        self._logger = Logger(config=config).get_logger()
-        self._feeds_storage = Storage(
-            self._config.get("feed_parser.storage_file", self.DEFAULT_STORAGE_FILE)
-        )
-        self._publisher = Publisher(config=config, base_path=ROOT_DIR)
+        if context is None:
+            context = MentionContext(config=config)
+        self._context = context
+        self._logger = context.logger
+        self._feeds_storage = context.get_feeds_storage()
+        self._publisher = context.publisher
         self.me = config.get("app.user")
         if self.me is None:
             RuntimeError("Please define app.user in the config")
@@ -103,7 +342,7 @@ class MentionParser:
             raise RuntimeError("Load the mention successfully before trying to parse it")
 
         # Before anything, remove the HTML stuff
-        content = BeautifulSoup(self.mention.content, features="html.parser").get_text()
+        content = html_to_text(self.mention.content)
 
         # Removing the self username from the mention, so we have a clean string to parse
         username_position, content = self.remove_self_username_from_content(content=content)
@@ -226,14 +465,16 @@ class MentionParser:
                 )
                 return True
 
-            self._feeds_storage.set_slugged(
-                self.complements["alias"],
-                {
-                    "site_url": self.complements["site_url"],
-                    "feed_url": self.complements["feed_url"],
-                    "name": self.complements["name"]
-                }
-            )
+            feed = {
+                "site_url": self.complements["site_url"],
+                "feed_url": self.complements["feed_url"],
+                "name": self.complements["name"]
+            }
+            # The account it publishes to is only set in the storage. Keep it.
+            previous = self._feeds_storage.get(self.complements["alias"], None) or {}
+            if "named_account" in previous:
+                feed["named_account"] = previous["named_account"]
+            self._feeds_storage.set_slugged(self.complements["alias"], feed)
             self._feeds_storage.write_file()
             self.answer = StatusPost.from_dict(
                 {
@@ -339,11 +580,11 @@ class MentionParser:
                 self.error = self.ERROR_INVALID_URL
                 return False
             # It could be already a RSS URL
-            if Url.is_a_valid_feed(first_word):
+            if self._discover(Url.is_a_valid_feed, first_word, False):
                 rss_url = first_word
             else:
                 # Second, needs to be a valid RSS
-                list_of_possible_rss_urls = Url.findfeeds(first_word)
+                list_of_possible_rss_urls = self._discover(Url.findfeeds, first_word, [])
                 if len(list_of_possible_rss_urls) == 0:
                     self.error = self.ERROR_INVALID_RSS
                     return False
@@ -395,11 +636,11 @@ class MentionParser:
                 self.error = self.ERROR_INVALID_URL
                 return False
             # It could be already a RSS URL
-            if Url.is_a_valid_feed(first_word):
+            if self._discover(Url.is_a_valid_feed, second_word, False):
                 rss_url = second_word
             else:
                 # ... and contain a RSS
-                list_of_possible_rss_urls = Url.findfeeds(second_word)
+                list_of_possible_rss_urls = self._discover(Url.findfeeds, second_word, [])
                 if len(list_of_possible_rss_urls) == 0:
                     self.error = self.ERROR_INVALID_RSS
                     return False
@@ -444,11 +685,11 @@ class MentionParser:
                 self.error = self.ERROR_INVALID_URL
                 return False
             # It could be already a RSS URL
-            if Url.is_a_valid_feed(first_word):
+            if self._discover(Url.is_a_valid_feed, first_word, False):
                 rss_url = first_word
             else:
                 # Second, needs to be a valid RSS
-                list_of_possible_rss_urls = Url.findfeeds(first_word)
+                list_of_possible_rss_urls = self._discover(Url.findfeeds, first_word, [])
                 if len(list_of_possible_rss_urls) == 0:
                     self.error = self.ERROR_INVALID_RSS
                     return False
@@ -458,6 +699,9 @@ class MentionParser:
             self.complements = {"site_url": first_word, "feed_url": rss_url}
             return True
 
+    def _discover(self, method, url: str, default: any) -> any:
+        return self._context.discover(method, url, default=default)
+
     def is_alias_valid(self, alias) -> bool:
         return alias == slugify(alias)
 
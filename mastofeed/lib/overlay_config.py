@@ -0,0 +1,35 @@
+from pyxavi.config import Config
+
+
+class OverlayConfig(Config):
+    '''
+    Read-only Config with some top level keys set over another one
+
+    A key of the overlay replaces the whole key of the base config, and
+    the rest are read from the base, which is shared instead of copied,
+    so it is cheap to build. The overlay values are kept as given, not
+    copied either, which matters for objects like a Mastodon connection.
+    '''
+
+    def __init__(self, base: Config, overlay: dict) -> None:
+        self._base = base
+        super().__init__(params={})
+        self._content = overlay
+
+    def get(self, param_name: str = "", default_value: any = None) -> any:
+        if self._in_overlay(param_name):
+            return super().get(param_name=param_name, default_value=default_value)
+
+        return self._base.get(param_name=param_name, default_value=default_value)
+
+    def key_exists(self, param_name: str) -> bool:
+        if self._in_overlay(param_name):
+            return super().key_exists(param_name=param_name)
+
+        return self._base.key_exists(param_name=param_name)
+
+    def get_all(self) -> dict:
+        return {**self._base.get_all(), **self._content}
+
+    def _in_overlay(self, param_name: str) -> bool:
+        return param_name.split(self._separator)[0] in self._content
@@ -0,0 +1,85 @@
+from time import time
+import random
+
+
+class PollScheduler:
+    '''
+    Decides when every source has to be polled
+
+    Each source has an interval, by default the same for all. A random
+    jitter spreads the polls so they do not all land at the same time,
+    and a source that fails waits twice as long each time, up to a limit.
+    '''
+
+    DEFAULT_INTERVAL = 900
+    DEFAULT_JITTER = 0.1
+    DEFAULT_MAX_BACKOFF = 21600
+    # The failures of a dead source grow forever, but the backoff stops doubling
+    MAX_BACKOFF_EXPONENT = 20
+
+    def __init__(
+        self,
+        default_interval: int = None,
+        intervals: dict = None,
+        jitter: float = None,
+        max_backoff: int = None
+    ) -> None:
+        self._default_interval = default_interval if default_interval is not None\
+            else self.DEFAULT_INTERVAL
+        self._intervals = intervals if intervals is not None else {}
+        self._jitter = jitter if jitter is not None else self.DEFAULT_JITTER
+        self._max_backoff = max_backoff if max_backoff is not None\
+            else self.DEFAULT_MAX_BACKOFF
+        self._next_poll = {}  # type: dict[str, float]
+        self._failures = {}  # type: dict[str, int]
+
+    def sync(self, sources: list, now: float = None) -> None:
+        """Adds the new sources, due right away, and forgets the removed ones"""
+        now = now if now is not None else time()
+
+        for source in sources:
+            if source not in self._next_poll:
+                self._next_poll[source] = now
+                self._failures[source] = 0
+
+        for source in list(self._next_poll.keys()):
+            if source not in sources:
+                del self._next_poll[source]
+                del self._failures[source]
+
+    def get_interval(self, source: str) -> float:
+        return self._intervals.get(source, self._default_interval)
+
+    def get_due(self, now: float = None) -> list:
+        """The sources that have to be polled now, the most overdue first"""
+        now = now if now is not None else time()
+        return sorted(
+            [source for source, next_poll in self._next_poll.items() if next_poll <= now],
+            key=lambda source: self._next_poll[source]
+        )
+
+    def seconds_until_next(self, now: float = None) -> float:
+        """How long to wait until the next source is due. None if there is no source"""
+        if len(self._next_poll) == 0:
+            return None
+
+        now = now if now is not None else time()
+        return max(0, min(self._next_poll.values()) - now)
+
+    def mark_success(self, source: str, now: float = None, interval: float = None) -> None:
+        """The given interval, like an adaptive one, overrides the configured one"""
+        self._failures[source] = 0
+        self._schedule(
+            source, interval if interval is not None else self.get_interval(source), now
+        )
+
+    def mark_failure(self, source: str, now: float = None) -> None:
+        self._failures[source] = self._failures.get(source, 0) + 1
+        exponent = min(self._failures[source], self.MAX_BACKOFF_EXPONENT)
+        backoff = self.get_interval(source) * (2**exponent)
+        self._schedule(source, min(backoff, self._max_backoff), now)
+
+    def _schedule(self, source: str, interval: float, now: float = None) -> None:
+        now = now if now is not None else time()
+        spread = interval * self._jitter
+        self._next_poll[source] = now + interval + random.uniform(-spread, spread)
@@ -0,0 +1,250 @@
+from contextlib import contextmanager
+from collections import Counter
+from threading import Event, Lock, Thread, local, get_ident
+from datetime import datetime
+from slugify import slugify
+from pathlib import Path
+import threading
+import cProfile
+import pstats
+import sys
+import os
+
+
+class Profiler:
+    '''
+    Profiles everything a runner does, with cProfile or with a sampling profiler
+
+    cProfile gives exact calls and times, written as a pstats file to read
+    with pstats or snakeviz. The sampling profiler looks at the stack of
+    every thread from time to time, which costs much less while running,
+    and writes collapsed stacks, to read with flamegraph.pl or speedscope.
+    Both include the threads that fetch the feeds.
+
+    With per_source, the work done inside every section (a source of the
+    feeds) is also told apart: cProfile writes a pstats file per section,
+    and the sampling profiler adds the section as the root of the stacks.
+    From Python 3.12 cProfile sees all the threads at once, so the sections
+    of the fetches running concurrently can not be told apart there.
+    '''
+
+    CPROFILE = "cprofile"
+    SAMPLING = "sampling"
+    MODES = [CPROFILE, SAMPLING]
+    DEFAULT_INTERVAL = 0.005
+
+    _active = None  # type: Profiler
+
+    def __init__(
+        self,
+        mode: str = CPROFILE,
+        output_dir: str = "log",
+        name: str = "profile",
+        per_source: bool = False,
+        interval: float = DEFAULT_INTERVAL
+    ) -> None:
+        if mode not in self.MODES:
+            raise RuntimeError(f"Unknown profiler [{mode}]. Use one of {', '.join(self.MODES)}")
+
+        self._mode = mode
+        self._output_dir = output_dir
+        self._name = name
+        self._per_source = per_source
+        self._interval = interval
+        self._lock = Lock()
+        self._started_at = None  # type: datetime
+
+        # cProfile: one profile per thread, and per section
+        self._thread_profiles = []  # type: list[cProfile.Profile]
+        self._section_profiles = {}  # type: dict[str, list[cProfile.Profile]]
+        self._local = local()
+
+        # Sampling: the count of every collapsed stack
+        self._samples = Counter()
+        self._thread_sections = {}  # type: dict[int, list[str]]
+        self._sampler = None  # type: Thread
+        self._stop_event = Event()
+
+    @staticmethod
+    @contextmanager
+    def section(name: str):
+        """Tells apart the work done inside, when profiling per source"""
+        profiler = Profiler._active
+        if profiler is None or not profiler._per_source:
+            yield
+            return
+
+        profiler._enter_section(name)
+        try:
+            yield
+        finally:
+            profiler._exit_section(name)
+
+    def start(self) -> None:
+        self._started_at = datetime.now()
+        Profiler._active = self
+
+        if self._mode == self.CPROFILE:
+            # The threads started from now on get their own profile
+            threading.setprofile(self._profile_new_thread)
+            self._enable_thread_profile()
+        else:
+            self._stop_event.clear()
+            self._sampler = Thread(
+                target=self._sample_loop, name="profiler-sampler", daemon=True
+            )
+            self._sampler.start()
+
+    def stop(self) -> None:
+        if Profiler._active is self:
+            Profiler._active = None
+
+        if self._mode == self.CPROFILE:
+            threading.setprofile(None)
+            profile = getattr(self._local, "profile", None)
+            if profile is not None:
+                profile.disable()
+        elif self._sampler is not None:
+            self._stop_event.set()
+            self._sampler.join()
+            self._sampler = None
+
+    def write(self) -> list:
+        """Writes the profiles into the output directory, returning their filenames"""
+        Path(self._output_dir).mkdir(parents=True, exist_ok=True)
+        started_at = self._started_at or datetime.now()
+        base = os.path.join(
+            self._output_dir, f"profile-{self._name}-{started_at.strftime('%Y%m%d-%H%M%S')}"
+        )
+
+        if self._mode == self.SAMPLING:
+            filename = f"{base}.folded"
+            with open(filename, "w") as stream:
+                for stack, count in sorted(self._samples.items()):
+                    stream.write(f"{stack} {count}\n")
+            return [filename]
+
+        files = []
+        all_profiles = self._thread_profiles + [
+            profile for profiles in self._section_profiles.values() for profile in profiles
+        ]
+        if self._dump_stats(all_profiles, f"{base}.pstats"):
+            files.append(f"{base}.pstats")
+        for name, profiles in sorted(self._section_profiles.items()):
+            filename = f"{base}-{slugify(name)}.pstats"
+            if self._dump_stats(profiles, filename):
+                files.append(filename)
+        return files
+
+    def take_sample(self) -> None:
+        """Counts the current stack of every thread but the sampler"""
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        with self._lock:
+            sections = {ident: list(stack) for ident, stack in self._thread_sections.items()}
+
+        for ident, frame in sys._current_frames().items():
+            if self._sampler is not None and ident == self._sampler.ident:
+                continue
+
+            stack = []
+            while frame is not None:
+                stack.append(self._get_frame_label(frame))
+                frame = frame.f_back
+            stack.reverse()
+
+            root = [names.get(ident, str(ident))] + sections.get(ident, [])[-1:]
+            key = ";".join([x.replace(";", ":") for x in root] + stack)
+            with self._lock:
+                self._samples[key] += 1
+
+    def _sample_loop(self) -> None:
+        while not self._stop_event.wait(self._interval):
+            self.take_sample()
+
+    def _get_frame_label(self, frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})".replace(";", ":")
+
+    def _profile_new_thread(self, frame, event, arg) -> None:
+        # Called once at the first event of a new thread, to hand it over to cProfile
+        sys.setprofile(None)
+        self._enable_thread_profile()
+
+    def _enable_thread_profile(self) -> None:
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # From Python 3.12 the profile already running covers this thread
+            return
+
+        self._local.profile = profile
+        with self._lock:
+            self._thread_profiles.append(profile)
+
+    def _enter_section(self, name: str) -> None:
+        if self._mode == self.SAMPLING:
+            with self._lock:
+                self._thread_sections.setdefault(get_ident(), []).append(name)
+            return
+
+        # Swap the profile of the thread for the one of the section
+        current = getattr(self._local, "profile", None)
+        profile = cProfile.Profile()
+        if current is not None:
+            current.disable()
+        try:
+            profile.enable()
+        except ValueError:
+            # From Python 3.12 another thread holds cProfile. Keep measuring the run
+            profile = None
+            if current is not None:
+                current.enable()
+
+        stack = getattr(self._local, "sections", [])
+        stack.append((current, profile))
+        self._local.sections = stack
+        if profile is not None:
+            self._local.profile = profile
+            with self._lock:
+                self._section_profiles.setdefault(name, []).append(profile)
+
+    def _exit_section(self, name: str) -> None:
+        if self._mode == self.SAMPLING:
+            with self._lock:
+                stack = self._thread_sections.get(get_ident(), [])
+                if len(stack) > 0:
+                    stack.pop()
+                if len(stack) == 0:
+                    self._thread_sections.pop(get_ident(), None)
+            return
+
+        stack = getattr(self._local, "sections", [])
+        if len(stack) == 0:
+            return
+        previous, profile = stack.pop()
+        if profile is None:
+            return
+
+        profile.disable()
+        self._local.profile = previous
+        # The profiler may have been stopped meanwhile
+        if previous is not None and Profiler._active is self:
+            previous.enable()
+
+    def _dump_stats(self, profiles: list, filename: str) -> bool:
+        stats = None
+        for profile in profiles:
+            profile.create_stats()
+            if len(profile.stats) == 0:
+                continue
+            if stats is None:
+                stats = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+
+        if stats is None:
+            return False
+
+        stats.dump_stats(filename)
+        return True
@@ -4,7 +4,13 @@ from pyxavi.terminal_color import TerminalColor
 from pyxavi.mastodon_publisher import MastodonPublisher
 from pyxavi.queue_stack import Queue
 from pyxavi.mastodon_helper import StatusPost
-import os
+from mastofeed.lib.storage_backend import StorageBackend
+from mastofeed.lib.media_pipeline import MediaPipeline
+from mastofeed.lib.media_cache import MediaCache
+from mastofeed.lib.rate_limiter import RateLimiter, RateLimitReached
+from mastofeed.lib.atomic_storage import AtomicStorage
+from mastodon import MastodonRatelimitError
+from concurrent.futures import ThreadPoolExecutor
 
 
 class Publisher(MastodonPublisher):
@@ -12,9 +18,21 @@ class Publisher(MastodonPublisher):
     Publisher
 
     It is responsible to publish the queued status posts.
+
+    The media of the next posts in the queue is downloaded in the background
+    while publishing, and the media of a status is uploaded concurrently.
+    The MediaCache avoids downloading and uploading the same media twice.
+
+    The RateLimiter of the account waits for the instance when it answers
+    that we hit its rate limit, and when publisher.rate_limit.active is set
+    it also drains the queue at its pace. What can't be published in time
+    stays for the next run.
     '''
 
-    DEFAULT_QUEUE_FILE = "storage/queue.yaml"
+    DEFAULT_MAX_MEDIA_PER_STATUS = 4
+    DEFAULT_MEDIA_PREFETCH = 5
+    DEFAULT_RATE_LIMIT_FILE = "storage/rate_limit.yaml"
+    MAX_RATE_LIMIT_RETRIES = 3
 
     def __init__(
         self,
@@ -26,28 +44,160 @@ class Publisher(MastodonPublisher):
     ) -> None:
 
         logger = Logger(config=config).get_logger()
+        self._named_account = named_account
 
         super().__init__(
             config=config, logger=logger, named_account=named_account, base_path=base_path
         )
 
         if queue is None:
-            queue_storage_file = config.get("queue_storage.file", self.DEFAULT_QUEUE_FILE)
-            if base_path is not None:
-                queue_storage_file = os.path.join(base_path, queue_storage_file)
-            self._queue = Queue(logger=logger, storage_file=queue_storage_file)
+            self._queue = StorageBackend(
+                config=config, base_path=base_path
+            ).get_queue(logger=logger)
         else:
             self._queue = queue
 
         self._only_oldest = only_oldest if only_oldest is not None\
             else config.get("publisher.only_oldest_post_every_iteration", False)
 
+        self._max_media_per_status = config.get(
+            "publisher.max_media_per_status", self.DEFAULT_MAX_MEDIA_PER_STATUS
+        )
+        self._media_prefetch = config.get(
+            "publisher.media_prefetch", self.DEFAULT_MEDIA_PREFETCH
+        )
+        self._media_pipeline = MediaPipeline(
+            media_storage=self._media_storage,
+            max_workers=config.get("publisher.media_workers", None),
+            logger=logger
+        )
+        self._media_cache = MediaCache.get_instance(
+            media_storage=self._media_storage,
+            filename=config.get("media_cache.file", None),
+            max_size=config.get("media_cache.max_size", None),
+            max_age=config.get("media_cache.max_age", None),
+            reuse_media_id_for=config.get("media_cache.reuse_media_id_for", None),
+            logger=logger
+        )
+        # The pace is opt in, the rate limit of the instance is always followed
+        self._is_rate_limit_active = config.get("publisher.rate_limit.active", False)
+        self._rate_limiter = RateLimiter(
+            capacity=config.get("publisher.rate_limit.max_posts", None),
+            period=config.get("publisher.rate_limit.period", None),
+            max_wait=config.get("publisher.rate_limit.max_wait", None),
+            storage=AtomicStorage(
+                filename=config.get("publisher.rate_limit.file", self.DEFAULT_RATE_LIMIT_FILE)
+            ),
+            key=named_account,
+            logger=logger
+        )
+
+    def load_mastodon_instance(self) -> None:
+        super().load_mastodon_instance()
+        # We handle the rate limits ourselves, instead of sleeping blindly
+        self._mastodon.ratelimit_method = "throw"
+
+    def publish_media(self, media: list = None) -> list:
+        """Uploads the media concurrently, keeping their order in the status"""
+
+        if self._is_dry_run:
+            self._logger.debug("It's a Dry Run, not publishing Media.")
+            return None
+
+        if len(media) > self._max_media_per_status:
+            self._logger.info(
+                f"Only the first {self._max_media_per_status} of {len(media)} media are posted"
+            )
+            media = media[:self._max_media_per_status]
+
+        self._logger.info(
+            f"{TerminalColor.CYAN}Publishing %s media items{TerminalColor.END}", len(media)
+        )
+        # The ones not prefetched nor cached start downloading all at once
+        self._media_pipeline.prefetch(self._get_not_cached_media(media))
+        with ThreadPoolExecutor(max_workers=max(1, len(media)),
+                                thread_name_prefix="media-upload") as executor:
+            posted_results = list(executor.map(self._publish_single_media, media))
+
+        return [result["id"] for result in posted_results if result]
+
+    def _publish_single_media(self, item: dict) -> dict:
+        url = item.get("url", None)
+        if url is not None:
+            cached = self._media_cache.get(url, account=self._named_account)
+            if cached is None:
+                try:
+                    downloaded = self._media_pipeline.fetch(url)
+                    cached = self._media_cache.add(
+                        url,
+                        downloaded["file"],
+                        downloaded["mime_type"],
+                        account=self._named_account
+                    )
+                except Exception as e:
+                    self._logger.exception(e)
+                    return None
+            if cached["media_id"] is not None:
+                self._logger.debug(f"Reusing the already uploaded media for {url}")
+                return {"id": cached["media_id"]}
+            media_file = cached["file"]
+            mime_type = cached["mime_type"]
+        elif "path" in item and item["path"] is not None:
+            media_file = item["path"]
+            mime_type = item["mime_type"] if "mime_type" in item else None
+        else:
+            self._logger.warning(
+                f"{TerminalColor.RED}the Media to post does " +
+                f"not have an URL or a PATH{TerminalColor.END}"
+            )
+            return None
+
+        posted_result = self._do_media_publish(
+            media_file=media_file,
+            download_file=False,
+            description=item["alt_text"] if "alt_text" in item else None,
+            mime_type=mime_type
+        )
+        if not posted_result:
+            self._logger.info(
+                f"{TerminalColor.RED}Could not post %s{TerminalColor.END}", media_file
+            )
+            return None
+
+        if url is not None:
+            self._media_cache.set_media_id(
+                url, posted_result["id"], account=self._named_account
+            )
+
+        return posted_result
+
+    def prefetch_media(self) -> None:
+        """Starts downloading the media of the next posts in the queue"""
+
+        if self._is_dry_run or self._media_prefetch <= 0:
+            return
+
+        media = []
+        for queued_post in self._queue.get_all()[:self._media_prefetch]:
+            media += (queued_post.to_dict().get("media", None) or
+                      [])[:self._max_media_per_status]
+        # The cached ones are already in place
+        started = self._media_pipeline.prefetch(self._get_not_cached_media(media))
+        if started > 0:
+            self._logger.debug(f"Prefetching {started} media of the next posts")
+
+    def _get_not_cached_media(self, media: list) -> list:
+        return [
+            x for x in media
+            if x.get("url", None) is None or self._media_cache.get(x["url"]) is None
+        ]
+
     def _execute_action(self, toot: dict, previous_id: int = None) -> dict:
 
         if "action" in toot and toot["action"]:
             if toot["action"] == "reblog":
                 self._logger.info("Retooting post %d", toot["id"])
-                return self._mastodon.status_reblog(toot["id"])
+                return self._call_rate_limited(self._mastodon.status_reblog, toot["id"])
             elif toot["action"] == "new":
                 self._logger.debug("The Publisher._execute_action has a new post")
 
@@ -66,6 +216,8 @@ class Publisher(MastodonPublisher):
                 )
 
                 published = self.publish_status_post(status_post=status_post)
+                if published is not None and posted_media:
+                    self._media_cache.mark_attached(posted_media, account=self._named_account)
                 return published
 
         else:
@@ -74,6 +226,64 @@ class Publisher(MastodonPublisher):
                 toot["published_at"]
             )
 
+    def _do_status_publish(self, status_post: StatusPost) -> dict:
+        return self._call_rate_limited(super()._do_status_publish, status_post=status_post)
+
+    def _do_media_publish(
+        self,
+        media_file: str,
+        download_file: bool,
+        description: str,
+        mime_type: str = None
+    ) -> dict:
+        if download_file is True:
+            return super()._do_media_publish(
+                media_file=media_file,
+                download_file=download_file,
+                description=description,
+                mime_type=mime_type
+            )
+
+        try:
+            return self._call_rate_limited(
+                self._mastodon.media_post,
+                media_file,
+                mime_type=mime_type,
+                description=description,
+                focus=(0, 1)
+            )
+        except Exception as e:
+            self._logger.exception(e)
+
+    def _call_rate_limited(self, method, *args, **kwargs) -> dict:
+        """
+        Calls the API method, waiting until the reset when we hit the rate limit
+
+        Raises RateLimitReached when the reset is too far away.
+        """
+        retry = 0
+        while True:
+            try:
+                result = method(*args, **kwargs)
+            except MastodonRatelimitError:
+                retry += 1
+                reset_at = getattr(self._mastodon, "ratelimit_reset", None)
+                if retry > self.MAX_RATE_LIMIT_RETRIES:
+                    raise RateLimitReached(reset_at=reset_at)
+                self._logger.warning(
+                    f"{TerminalColor.YELLOW}Hit the rate limit of the instance." +
+                    f"{TerminalColor.END}"
+                )
+                self._rate_limiter.block_until(reset_at)
+                self._rate_limiter.wait_until_reset()
+                continue
+
+            self._rate_limiter.sync(
+                remaining=getattr(self._mastodon, "ratelimit_remaining", None),
+                reset_at=getattr(self._mastodon, "ratelimit_reset", None)
+            )
+            return result
+
     def publish_all_from_queue(self) -> None:
         if self._queue.is_empty():
             self._logger.info(
@@ -81,45 +291,74 @@ class Publisher(MastodonPublisher):
             )
             return
 
-        should_continue = True
-        previous_id = None
-        self._logger.debug("Queue is not empty, publishing from it")
-        while should_continue and not self._queue.is_empty():
-            # Get the first element from the queue
-            queued_post = self._queue.pop().to_dict()
-            self._logger.debug(f"Picked the item {queued_post['id']} to process")
-            self._logger.debug(f"Queue has now {self._queue.length()} items")
-            # Publish it
-            result = self._execute_action(queued_post, previous_id=previous_id)
-            # Let's capture the ID in case we want to do a thread
-            if result is not None:
-                # If it's a dry-run, there won't be any result returned.
-                previous_id = result["id"]
-                self._logger.debug(f"Post was published with ID {previous_id}")
-
-            # Maybe we have several posts in a group that we need to post
-            #  all together, regardless of the rest of conditions
-            if previous_id is not None and "group_id" in queued_post and\
-               self.__next_in_queue_matches_group_id(queued_post["group_id"]):
-                self._logger.debug(
-                    "Post was published and there are more in this group. Continue"
-                )
-                should_continue = True
-            else:
-                # Do we want to publish only the oldest in every iteration?
-                #   This means that the queue gets empty one item every run
-                if self._only_oldest:
+        try:
+            should_continue = True
+            previous_id = None
+            self._logger.debug("Queue is not empty, publishing from it")
+            self.prefetch_media()
+            while should_continue and not self._queue.is_empty():
+                if self._is_rate_limit_active and not self._is_dry_run and\
+                   not self._rate_limiter.acquire():
                     self._logger.info(
-                        f"{TerminalColor.CYAN}We're meant to publish only the oldest." +
-                        f" Finishing.{TerminalColor.END}"
+                        f"{TerminalColor.CYAN}Rate limit reached, the rest of the queue " +
+                        f"waits for the next run.{TerminalColor.END}"
                     )
-                    should_continue = False
+                    break
 
-        if not self._is_dry_run:
-            self._logger.debug(
-                f"Attempting to write {self._queue.length()} items in our storage"
-            )
-            self._queue.save()
+                # Get the first element from the queue
+                queued_item = self._queue.pop()
+                queued_post = queued_item.to_dict()
+                self._logger.debug(f"Picked the item {queued_post['id']} to process")
+                self._logger.debug(f"Queue has now {self._queue.length()} items")
+                # Publish it
+                try:
+                    result = self._execute_action(queued_post, previous_id=previous_id)
+                except RateLimitReached as e:
+                    self._logger.warning(
+                        f"{TerminalColor.YELLOW}{e}, the post goes back " +
+                        f"to the queue for the next run.{TerminalColor.END}"
+                    )
+                    self._queue.unpop(queued_item)
+                    break
+                # Let's capture the ID in case we want to do a thread
+                if result is not None:
+                    # If it's a dry-run, there won't be any result returned.
+                    previous_id = result["id"]
+                    self._logger.debug(f"Post was published with ID {previous_id}")
+
+                # Maybe we have several posts in a group that we need to post
+                #  all together, regardless of the rest of conditions
+                if previous_id is not None and "group_id" in queued_post and\
+                   self.__next_in_queue_matches_group_id(queued_post["group_id"]):
+                    self._logger.debug(
+                        "Post was published and there are more in this group. Continue"
+                    )
+                    should_continue = True
+                else:
+                    # Do we want to publish only the oldest in every iteration?
+                    #   This means that the queue gets empty one item every run
+                    if self._only_oldest:
+                        self._logger.info(
+                            f"{TerminalColor.CYAN}We're meant to publish only the oldest." +
+                            f" Finishing.{TerminalColor.END}"
+                        )
+                        should_continue = False
+
+            if not self._is_dry_run:
+                self._logger.debug(
+                    f"Attempting to write {self._queue.length()} items in our storage"
+                )
+                self._queue.save()
+                self._media_cache.evict()
+                self._media_cache.save()
+                self._rate_limiter.save()
+        finally:
+            # The prefetched media that nobody took is not tracked by the MediaCache
+            self.shutdown_media()
+
+    def shutdown_media(self) -> None:
+        """Stops the media downloads and removes the files that were not taken"""
+        self._media_pipeline.shutdown()
 
     def __next_in_queue_matches_group_id(self, group_id: str) -> bool:
         """
@@ -1,5 +1,6 @@
 from __future__ import annotations
 from pyxavi.queue_stack import QueueItemProtocol
+from mastofeed.lib.html_to_text import html_to_text
 from datetime import datetime
 import logging
 
@@ -16,6 +17,7 @@ class QueuePost(QueueItemProtocol):
     language: str = None
     media: list[QueuePostMedia] = None
     published_at: datetime = None
+    named_account: str = None
 
     def __init__(
         self,
@@ -29,6 +31,7 @@ class QueuePost(QueueItemProtocol):
         language: str = None,
         media: list[QueuePostMedia] = None,
         published_at: datetime = None,
+        named_account: str = None,
     ) -> None:
 
         self.id = id
@@ -41,6 +44,15 @@ class QueuePost(QueueItemProtocol):
         self.language = language
         self.media = media
         self.published_at = published_at
+        self.named_account = named_account
+        self._plain_combined_content = None
+
+    @property
+    def plain_combined_content(self) -> str:
+        # Calculated once and kept, as it is not part of the to/from dict either
+        if self._plain_combined_content is None and self.raw_combined_content is not None:
+            self._plain_combined_content = html_to_text(self.raw_combined_content)
+        return self._plain_combined_content
 
     def to_dict(self) -> dict:
         # Attention: raw_content and raw_combined_body
@@ -56,6 +68,7 @@ class QueuePost(QueueItemProtocol):
             "media": list(map(lambda x: x.to_dict(), self.media)) if self.media else None,
             "published_at": datetime.timestamp(self.published_at)
             if self.published_at is not None else None,
+            "named_account": self.named_account,
         }
 
     @staticmethod
@@ -73,7 +86,8 @@ class QueuePost(QueueItemProtocol):
             if "action" in dictionary else None,
             media=list(map(lambda x: QueuePostMedia.from_dict(x), dictionary["media"]))
             if "media" in dictionary and dictionary["media"] else None,
-            published_at=datetime.fromtimestamp(dictionary["published_at"])
+            published_at=datetime.fromtimestamp(dictionary["published_at"]),
+            named_account=dictionary["named_account"] if "named_account" in dictionary else None
         )
 
     def sort_value(self, param: any = None) -> any:
@@ -0,0 +1,148 @@
+from pyxavi.storage import Storage
+from threading import Lock
+from time import time, sleep
+import logging
+
+
+class RateLimitReached(BaseException):
+    '''
+    The API refuses more calls until reset_at, which is too far to wait
+
+    As the MastodonPublisherException, it is a BaseException so the
+    retries for the generic errors let it through.
+    '''
+
+    def __init__(self, reset_at: float = None) -> None:
+        super().__init__(f"Rate limit reached until {reset_at}")
+        self.reset_at = reset_at
+
+
+class RateLimiter:
+    '''
+    Token bucket that spaces the statuses published by an account
+
+    The bucket holds up to capacity tokens and refills them evenly along
+    the period, so a big backlog is drained at a steady pace instead of
+    at once. Every publish takes a token, waiting for it when needed.
+
+    It also follows the rate limit headers of the instance: when it says
+    that nothing is left, we wait precisely until its window resets.
+    Whatever would wait more than max_wait is refused, so the caller can
+    leave the work for the next run. The state can be kept in a storage,
+    under the account key, so it survives between runs. The limiters of
+    all the accounts can share the same file.
+    '''
+
+    DEFAULT_CAPACITY = 30
+    DEFAULT_PERIOD = 1800
+    DEFAULT_MAX_WAIT = 300
+
+    # The limiters of several accounts may save into the same file at once
+    _storage_lock = Lock()
+
+    def __init__(
+        self,
+        capacity: int = None,
+        period: int = None,
+        max_wait: int = None,
+        storage: Storage = None,
+        key: str = None,
+        logger: logging.Logger = None,
+        clock=time,
+        sleeper=sleep
+    ) -> None:
+        self._capacity = capacity if capacity is not None else self.DEFAULT_CAPACITY
+        self._period = period if period is not None else self.DEFAULT_PERIOD
+        self._max_wait = max_wait if max_wait is not None else self.DEFAULT_MAX_WAIT
+        self._storage = storage
+        self._key = key
+        self._logger = logger if logger is not None else logging.getLogger()
+        self._clock = clock
+        self._sleeper = sleeper
+
+        state = storage.get(key, None) if storage is not None and key is not None else None
+        state = state if state is not None else {}
+        self._tokens = state.get("tokens", self._capacity)
+        self._updated_at = state.get("updated_at", self._clock())
+        self._blocked_until = state.get("blocked_until", None)
+
+    def acquire(self, tokens: int = 1) -> bool:
+        """
+        Takes the tokens, waiting for them if needed
+
+        Returns False without taking anything if it would need to wait
+        more than max_wait.
+        """
+        wait = self.seconds_until_available(tokens)
+        if wait > self._max_wait:
+            self._logger.info(
+                f"Rate limit: {round(wait)} seconds to wait are more than {self._max_wait}"
+            )
+            return False
+
+        if wait > 0:
+            self._logger.debug(f"Rate limit: waiting {round(wait, 1)} seconds")
+            self._sleeper(wait)
+
+        self._refill()
+        self._tokens = max(0, self._tokens - tokens)
+        return True
+
+    def seconds_until_available(self, tokens: int = 1) -> float:
+        self._refill()
+        now = self._clock()
+        wait = max(0, (tokens - self._tokens) * self._period / self._capacity)
+        if self._blocked_until is not None and self._blocked_until > now:
+            wait = max(wait, self._blocked_until - now)
+
+        return wait
+
+    def sync(self, remaining: int = None, reset_at: float = None) -> None:
+        """Takes the rate limit values returned by the instance"""
+        if remaining is not None and remaining <= 0:
+            self.block_until(reset_at)
+
+    def block_until(self, reset_at: float = None) -> None:
+        """Nothing passes until reset_at. Without it, until a token is refilled"""
+        self._refill()
+        now = self._clock()
+        self._blocked_until = reset_at if reset_at is not None and reset_at > now\
+            else now + self._period / self._capacity
+        self._tokens = 0
+
+    def wait_until_reset(self) -> None:
+        """Waits for the block, or raises RateLimitReached if it is too long"""
+        wait = self.seconds_until_available(0)
+        if wait > self._max_wait:
+            raise RateLimitReached(reset_at=self._blocked_until)
+        if wait > 0:
+            self._logger.debug(f"Rate limit: waiting {round(wait, 1)} seconds for the reset")
+            self._sleeper(wait)
+
+    def save(self) -> None:
+        if self._storage is None or self._key is None:
+            return
+
+        self._refill()
+        with RateLimiter._storage_lock:
+            # Read again, to keep what the other accounts saved meanwhile
+            self._storage.read_file()
+            self._storage.set(
+                self._key,
+                {
+                    "tokens": self._tokens,
+                    "updated_at": self._updated_at,
+                    "blocked_until": self._blocked_until
+                }
+            )
+            self._storage.write_file()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        elapsed = max(0, now - self._updated_at)
+        self._tokens = min(
+            self._capacity, self._tokens + elapsed * self._capacity / self._period
+        )
+        self._updated_at = now
+        if self._blocked_until is not None and self._blocked_until <= now:
+            self._blocked_until = None
@@ -0,0 +1,208 @@
+from contextlib import contextmanager
+from threading import Lock
+from time import time, perf_counter
+import tempfile
+import json
+import stat
+import os
+
+
+class RunMetrics:
+    '''
+    Timings per stage and counters of the posts, of a run and of every source
+
+    The stages are measured where they happen, so the fetch of a feed,
+    the parsing of its entries, the filters, the media, the format, the
+    queue persistence and the publishing can be told apart. A stage can be
+    measured many times, like once per post, and the times are added up.
+    The sources are fetched concurrently, so the sum of their stages may
+    be longer than the run itself.
+
+    The result is a JSON report, and optionally a Prometheus textfile
+    for the textfile collector of the node_exporter.
+    '''
+
+    FETCH = "fetch"
+    PARSE = "parse"
+    FILTER = "filter"
+    MEDIA = "media"
+    FORMAT = "format"
+    QUEUE_PERSIST = "queue_persist"
+    PUBLISH = "publish"
+
+    PROMETHEUS_PREFIX = "mastofeed"
+    # The collectors, like node_exporter, usually run as another user
+    FILE_MODE = 0o644
+
+    def __init__(self, runner: str = None, clock=perf_counter) -> None:
+        self._runner = runner
+        self._clock = clock
+        self._lock = Lock()
+        self._started_at = time()
+        self._started = clock()
+        self._finished = None
+        self._stages = {}  # type: dict[str, float]
+        self._counters = {}  # type: dict[str, int]
+        self._sources = {}  # type: dict[str, dict]
+
+    @contextmanager
+    def measure(self, stage: str, source: str = None):
+        """Adds the time spent inside the block to the stage, of the run and of the source"""
+        started = self._clock()
+        try:
+            yield
+        finally:
+            self.add_time(stage, self._clock() - started, source=source)
+
+    def add_time(self, stage: str, seconds: float, source: str = None) -> None:
+        with self._lock:
+            self._stages[stage] = self._stages.get(stage, 0) + seconds
+            if source is not None:
+                stages = self._get_source(source)["stages"]
+                stages[stage] = stages.get(stage, 0) + seconds
+
+    def count(self, counter: str, amount: int = 1, source: str = None) -> None:
+        if amount == 0:
+            return
+
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + amount
+            if source is not None:
+                counters = self._get_source(source)["counters"]
+                counters[counter] = counters.get(counter, 0) + amount
+
+    def finish(self) -> None:
+        self._finished = self._clock()
+
+    def get_duration(self) -> float:
+        finished = self._finished if self._finished is not None else self._clock()
+        return finished - self._started
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "runner": self._runner,
+                "started_at": self._started_at,
+                "duration": self.get_duration(),
+                "stages": dict(self._stages),
+                "counters": dict(self._counters),
+                "sources": {
+                    source: {
+                        "stages": dict(values["stages"]), "counters": dict(values["counters"])
+                    }
+                    for source,
+                    values in self._sources.items()
+                }
+            }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2, sort_keys=True)
+
+    def to_prometheus(self) -> str:
+        report = self.to_dict()
+        runner = {"runner": report["runner"] or ""}
+        lines = []
+
+        self._add_metric(
+            lines,
+            "run_timestamp_seconds",
+            "When the last run started", [(runner, report["started_at"])]
+        )
+        self._add_metric(
+            lines,
+            "run_duration_seconds",
+            "Duration of the last run", [(runner, report["duration"])]
+        )
+        self._add_metric(
+            lines,
+            "run_stage_seconds",
+            "Seconds spent in every stage of the last run",
+            [
+                ({
+                    **runner, "stage": stage
+                }, value) for stage,
+                value in sorted(report["stages"].items())
+            ]
+        )
+        self._add_metric(
+            lines,
+            "run_posts",
+            "Posts counted in the last run",
+            [
+                ({
+                    **runner, "counter": counter
+                }, value) for counter,
+                value in sorted(report["counters"].items())
+            ]
+        )
+
+        source_stages = []
+        source_counters = []
+        for source, values in sorted(report["sources"].items()):
+            for stage, value in sorted(values["stages"].items()):
+                source_stages.append(({**runner, "source": source, "stage": stage}, value))
+            for counter, value in sorted(values["counters"].items()):
+                source_counters.append(
+                    ({
+                        **runner, "source": source, "counter": counter
+                    }, value)
+                )
+        self._add_metric(
+            lines,
+            "source_stage_seconds",
+            "Seconds spent in every stage per source in the last run",
+            source_stages
+        )
+        self._add_metric(
+            lines, "source_posts", "Posts counted per source in the last run", source_counters
+        )
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, json_file: str = None, prometheus_file: str = None) -> None:
+        if json_file is not None:
+            self._write_atomically(json_file, self.to_json() + "\n")
+        if prometheus_file is not None:
+            self._write_atomically(prometheus_file, self.to_prometheus())
+
+    def _get_source(self, source: str) -> dict:
+        if source not in self._sources:
+            self._sources[source] = {"stages": {}, "counters": {}}
+        return self._sources[source]
+
+    def _add_metric(self, lines: list, name: str, help: str, samples: list) -> None:
+        if len(samples) == 0:
+            return
+
+        name = f"{self.PROMETHEUS_PREFIX}_{name}"
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in samples:
+            label_list = ",".join(
+                [f"{key}=\"{self._escape_label(value)}\"" for key, value in labels.items()]
+            )
+            lines.append(f"{name}{{{label_list}}} {value}")
+
+    def _escape_label(self, value: str) -> str:
+        return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+    def _write_atomically(self, filename: str, content: str) -> None:
+        # The collectors must never read a half written file
+        directory = os.path.dirname(os.path.abspath(filename))
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temporary_file = tempfile.mkstemp(
+            prefix=f".{os.path.basename(filename)}.", suffix=".tmp", dir=directory
+        )
+        try:
+            with os.fdopen(descriptor, "w") as stream:
+                stream.write(content)
+
+            # mkstemp makes it readable only by us. Keep the permissions of the replaced one
+            mode = stat.S_IMODE(os.stat(filename).st_mode) if os.path.exists(filename)\
+                else self.FILE_MODE
+            os.chmod(temporary_file, mode)
+            os.replace(temporary_file, filename)
+        except BaseException:
+            if os.path.exists(temporary_file):
+                os.remove(temporary_file)
+            raise
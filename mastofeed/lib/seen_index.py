@@ -0,0 +1,102 @@
+from pyxavi.storage import Storage
+from hashlib import sha256
+from time import time
+
+
+class SeenIndex:
+    '''
+    Keeps the IDs already seen for every source
+
+    The IDs are stored as short stable hashes mapped to the timestamp
+    when they were seen, so checking them is O(1) and the state
+    can be bounded per source by amount of items and by age.
+    '''
+
+    STORAGE_KEY = "seen"
+    LEGACY_STORAGE_KEY = "urls_seen"
+    HASH_LENGTH = 16
+    SECONDS_IN_A_DAY = 86400
+
+    def __init__(
+        self, storage: Storage, max_items: int = None, max_age_days: int = None
+    ) -> None:
+        self._storage = storage
+        self._max_items = max_items
+        self._max_age_days = max_age_days
+        self._index = {}  # type: dict[str, dict[str, int]]
+        self._dirty = set()  # type: set[str]
+
+    @staticmethod
+    def hash_id(id: any) -> str:
+        return sha256(str(id).encode()).hexdigest()[:SeenIndex.HASH_LENGTH]
+
+    def load(self, source: str) -> int:
+        """
+        Loads the index of the given source from the storage
+
+        Sources that still have the old list of URLs get migrated,
+        and then it returns the amount of items loaded.
+        """
+        index = dict(self._storage.get(f"{source}.{self.STORAGE_KEY}", {}))
+
+        legacy_list = self._storage.get(f"{source}.{self.LEGACY_STORAGE_KEY}", None)
+        if legacy_list is not None:
+            now = int(time())
+            for id in legacy_list:
+                index[self.hash_id(id)] = now
+            self._dirty.add(source)
+
+        self._index[source] = index
+        return len(index)
+
+    def contains(self, source: str, id: any) -> bool:
+        return source in self._index and self.hash_id(id) in self._index[source]
+
+    def add(self, source: str, list_of_ids: list) -> None:
+        if source not in self._index:
+            self._index[source] = {}
+
+        now = int(time())
+        for id in list_of_ids:
+            self._index[source][self.hash_id(id)] = now
+
+        self._prune(source, now)
+        self._dirty.add(source)
+
+    def get_items(self, source: str) -> dict:
+        """Returns the hashes of the given source with the timestamp when they were seen"""
+        return self._index.get(source, {})
+
+    def length(self, source: str) -> int:
+        return len(self._index[source]) if source in self._index else 0
+
+    def is_dirty(self, source: str) -> bool:
+        return source in self._dirty
+
+    def save(self, source: str) -> None:
+        """Moves the index of the given source into the storage. It does not write the file"""
+
+        self._storage.set(f"{source}.{self.STORAGE_KEY}", self._index.get(source, {}))
+        if self._storage.key_exists(f"{source}.{self.LEGACY_STORAGE_KEY}"):
+            self._storage.delete(f"{source}.{self.LEGACY_STORAGE_KEY}")
+        self._dirty.discard(source)
+
+    def _prune(self, source: str, now: int) -> None:
+        index = self._index[source]
+
+        if self._max_age_days:
+            oldest_allowed = now - self._max_age_days * self.SECONDS_IN_A_DAY
+            index = {
+                key: seen_at
+                for key, seen_at in index.items() if seen_at >= oldest_allowed
+            }
+
+        if self._max_items and len(index) > self._max_items:
+            # Keep the newest ones. Ties are resolved by insertion order,
+            #   as the migrated items share the same timestamp.
+            newest = sorted(
+                enumerate(index.items()), key=lambda x: (x[1][1], x[0]), reverse=True
+            )[:self._max_items]
+            index = {key: seen_at for _, (key, seen_at) in sorted(newest)}
+
+        self._index[source] = index
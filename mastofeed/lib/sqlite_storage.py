@@ -0,0 +1,264 @@
+from __future__ import annotations
+from pyxavi.dictionary import Dictionary
+from pyxavi.queue_stack import Queue, QueueItemProtocol, SimpleQueueItem
+from mastofeed.lib.seen_index import SeenIndex
+from slugify import slugify
+from threading import RLock
+from pathlib import Path
+from time import time
+import logging
+import sqlite3
+import json
+import os
+
+
+class SqliteDatabase:
+    '''
+    Embedded SQLite database that holds the feeds, the seen state and the queue
+
+    There is a single connection per file in the process, shared by all the
+    storage objects, so the changes they do are committed together.
+    '''
+
+    SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS feeds (alias TEXT PRIMARY KEY, data TEXT NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS seen (" + "alias TEXT NOT NULL, hash TEXT NOT NULL, " +
+        "seen_at INTEGER NOT NULL, PRIMARY KEY (alias, hash)) WITHOUT ROWID",
+        "CREATE INDEX IF NOT EXISTS seen_alias_seen_at ON seen (alias, seen_at)",
+        "CREATE TABLE IF NOT EXISTS queue (" +
+        "id TEXT PRIMARY KEY, published_at REAL, data TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS queue_published_at ON queue (published_at)",
+    ]
+    TIMEOUT = 30
+
+    _instances = {}  # type: dict[str, SqliteDatabase]
+    _instances_lock = RLock()
+
+    def __init__(self, filename: str) -> None:
+        self._filename = filename
+        self._lock = RLock()
+
+        Path(os.path.dirname(os.path.abspath(filename))).mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(
+            filename, timeout=self.TIMEOUT, check_same_thread=False
+        )
+        # Let the listener process read while the runner writes
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        for statement in self.SCHEMA:
+            self._connection.execute(statement)
+        self._connection.commit()
+
+    @staticmethod
+    def get_instance(filename: str) -> SqliteDatabase:
+        key = os.path.abspath(filename)
+        with SqliteDatabase._instances_lock:
+            if key not in SqliteDatabase._instances:
+                SqliteDatabase._instances[key] = SqliteDatabase(filename)
+            return SqliteDatabase._instances[key]
+
+    def execute(self, statement: str, parameters: tuple = ()) -> list:
+        with self._lock:
+            return self._connection.execute(statement, parameters).fetchall()
+
+    def execute_many(self, statement: str, parameters: list) -> None:
+        with self._lock:
+            self._connection.executemany(statement, parameters)
+
+    def get_data_version(self) -> int:
+        """Changes every time another connection commits into the database"""
+        with self._lock:
+            return self._connection.execute("PRAGMA data_version").fetchone()[0]
+
+    def commit(self) -> None:
+        with self._lock:
+            self._connection.commit()
+
+    def rollback(self) -> None:
+        with self._lock:
+            self._connection.rollback()
+
+
+class SqliteFeedsStorage(Dictionary):
+    '''
+    Registry of feeds by alias, stored in SQLite
+
+    All feeds are kept in memory, as they are just a few fields each.
+    Only the aliases that changed are written when write_file() is called.
+    '''
+
+    def __init__(self, database: SqliteDatabase, path_separator_char=None) -> None:
+        self._database = database
+        super().__init__(content={}, path_separator_char=path_separator_char)
+        self.read_file()
+
+    def read_file(self) -> None:
+        self._content = {
+            alias: json.loads(data)
+            for alias,
+            data in self._database.execute("SELECT alias, data FROM feeds")
+        }
+        self._changed_aliases = set()  # type: set[str]
+        self._data_version = self._database.get_data_version()
+
+    def has_changed(self) -> bool:
+        return self._database.get_data_version() != self._data_version
+
+    def write_file(self) -> None:
+        try:
+            for alias in self._changed_aliases:
+                if alias in self._content:
+                    self._database.execute(
+                        "INSERT OR REPLACE INTO feeds (alias, data) VALUES (?, ?)",
+                        (alias, json.dumps(self._content[alias]))
+                    )
+                else:
+                    self._database.execute("DELETE FROM feeds WHERE alias = ?", (alias, ))
+                    self._database.execute("DELETE FROM seen WHERE alias = ?", (alias, ))
+            self._database.commit()
+        except Exception:
+            self._database.rollback()
+            raise
+
+        self._changed_aliases = set()
+
+    def set(self, param_name: str, value: any = None) -> None:
+        super().set(param_name=param_name, value=value)
+        self._changed_aliases.add(self._alias_from_path(param_name))
+
+    def set_slugged(self, param_name: str, value: any = None) -> None:
+        self.set(slugify(param_name), value)
+
+    def delete(self, param_name: str) -> bool:
+        deleted = super().delete(param_name=param_name)
+        if deleted:
+            self._changed_aliases.add(self._alias_from_path(param_name))
+        return deleted
+
+    def _alias_from_path(self, param_name: str) -> str:
+        return param_name.split(self._separator)[0]
+
+
+class SqliteSeenIndex:
+    '''
+    The IDs already seen for every source, stored in SQLite
+
+    The hashes are the same as in the SeenIndex, and every check is
+    an indexed lookup, so nothing gets loaded in memory.
+    The changes are committed together with the feeds storage.
+    '''
+
+    def __init__(
+        self,
+        database: SqliteDatabase,
+        max_items: int = None,
+        max_age_days: int = None
+    ) -> None:
+        self._database = database
+        self._max_items = max_items
+        self._max_age_days = max_age_days
+        self._dirty = set()  # type: set[str]
+
+    def load(self, source: str) -> int:
+        return self.length(source)
+
+    def contains(self, source: str, id: any) -> bool:
+        return len(
+            self._database.execute(
+                "SELECT 1 FROM seen WHERE alias = ? AND hash = ?",
+                (source, SeenIndex.hash_id(id))
+            )
+        ) > 0
+
+    def add(self, source: str, list_of_ids: list) -> None:
+        now = int(time())
+        self.import_items(source, {SeenIndex.hash_id(id): now for id in list_of_ids})
+        self._prune(source, now)
+        self._dirty.add(source)
+
+    def import_items(self, source: str, items: dict) -> None:
+        """Inserts the given hashes with their seen timestamp. Does not commit"""
+        self._database.execute_many(
+            "INSERT OR REPLACE INTO seen (alias, hash, seen_at) VALUES (?, ?, ?)",
+            [(source, hash, seen_at) for hash, seen_at in items.items()]
+        )
+
+    def length(self, source: str) -> int:
+        return self._database.execute("SELECT COUNT(*) FROM seen WHERE alias = ?",
+                                      (source, ))[0][0]
+
+    def is_dirty(self, source: str) -> bool:
+        return source in self._dirty
+
+    def save(self, source: str) -> None:
+        # The rows are already in place, waiting for the feeds storage to commit.
+        self._dirty.discard(source)
+
+    def _prune(self, source: str, now: int) -> None:
+        if self._max_age_days:
+            self._database.execute(
+                "DELETE FROM seen WHERE alias = ? AND seen_at < ?",
+                (source, now - self._max_age_days * SeenIndex.SECONDS_IN_A_DAY)
+            )
+
+        if self._max_items:
+            self._database.execute(
+                "DELETE FROM seen WHERE alias = ? AND hash NOT IN (" +
+                "SELECT hash FROM seen WHERE alias = ? ORDER BY seen_at DESC LIMIT ?)",
+                (source, source, self._max_items)
+            )
+
+
+class SqliteQueue(Queue):
+    '''
+    Queue stored in SQLite
+
+    It behaves as the pyxavi Queue, but saving only inserts the new
+    items and deletes the ones that left, instead of rewriting it all.
+    '''
+
+    def __init__(
+        self,
+        database: SqliteDatabase,
+        logger: logging.Logger = None,
+        queue_item_object: QueueItemProtocol = SimpleQueueItem
+    ) -> None:
+        self._database = database
+        super().__init__(logger=logger, storage_file=None, queue_item_object=queue_item_object)
+
+    def load(self) -> int:
+        rows = self._database.execute("SELECT data FROM queue ORDER BY published_at, rowid")
+        self._queue = [self._queue_item_object.from_dict(json.loads(row[0])) for row in rows]
+        self._saved_ids = set([str(item.unique_value()) for item in self._queue])
+        return self.length()
+
+    def remove(self, item: QueueItemProtocol) -> None:
+        """Takes the item out of the queue, wherever it is"""
+        unique = item.unique_value()
+        self._queue = [x for x in self._queue if x.unique_value() != unique]
+
+    def save(self) -> None:
+        self._logger.debug("Saving the queue")
+        current = {str(item.unique_value()): item for item in self._queue}
+
+        try:
+            self._database.execute_many(
+                "DELETE FROM queue WHERE id = ?",
+                [(id, ) for id in self._saved_ids if id not in current]
+            )
+            self._database.execute_many(
+                "INSERT OR IGNORE INTO queue (id, published_at, data) VALUES (?, ?, ?)",
+                [
+                    (id, self._sort_timestamp(item), json.dumps(item.to_dict())) for id,
+                    item in current.items() if id not in self._saved_ids
+                ]
+            )
+            self._database.commit()
+        except Exception:
+            self._database.rollback()
+            raise
+
+        self._saved_ids = set(current.keys())
+
+    def _sort_timestamp(self, item: QueueItemProtocol) -> float:
+        value = item.sort_value()
+        return value.timestamp() if hasattr(value, "timestamp") else value
@@ -0,0 +1,90 @@
+from pyxavi.config import Config
+from pyxavi.queue_stack import Queue, QueueItemProtocol
+from mastofeed.lib.storage_protocol import FeedsStorageProtocol, SeenIndexProtocol
+from mastofeed.lib.atomic_storage import AtomicStorage
+from mastofeed.lib.journal_queue import JournalQueue
+from mastofeed.lib.seen_index import SeenIndex
+from mastofeed.lib.queue_post import QueuePost
+import logging
+import os
+
+
+class StorageBackend:
+    '''
+    Builds the storage objects for the configured backend
+
+    - "yaml": the feeds registry and the seen state live in the feeds YAML file
+        and the queue lives in the queue YAML file and its journal. This is the default.
+    - "sqlite": all of them live in a single embedded SQLite database.
+    '''
+
+    YAML = "yaml"
+    SQLITE = "sqlite"
+    DEFAULT_BACKEND = YAML
+    DEFAULT_FEEDS_FILE = "storage/feeds.yaml"
+    DEFAULT_QUEUE_FILE = "storage/queue.yaml"
+    DEFAULT_DATABASE_FILE = "storage/mastofeed.db"
+
+    def __init__(self, config: Config, base_path: str = None) -> None:
+        self._config = config
+        self._base_path = base_path
+        self._backend = config.get("storage.backend", self.DEFAULT_BACKEND)
+        if self._backend not in [self.YAML, self.SQLITE]:
+            raise RuntimeError(f"Storage backend [{self._backend}] is not supported")
+
+    def get_feeds_storage(self) -> FeedsStorageProtocol:
+        if self._backend == self.SQLITE:
+            from mastofeed.lib.sqlite_storage import SqliteFeedsStorage
+            return SqliteFeedsStorage(database=self._get_database())
+
+        return AtomicStorage(
+            self._config.get("feed_parser.storage_file", self.DEFAULT_FEEDS_FILE)
+        )
+
+    def get_seen_index(
+        self,
+        feeds_storage: FeedsStorageProtocol,
+        max_items: int = None,
+        max_age_days: int = None
+    ) -> SeenIndexProtocol:
+        if self._backend == self.SQLITE:
+            from mastofeed.lib.sqlite_storage import SqliteSeenIndex
+            return SqliteSeenIndex(
+                database=self._get_database(), max_items=max_items, max_age_days=max_age_days
+            )
+
+        return SeenIndex(storage=feeds_storage, max_items=max_items, max_age_days=max_age_days)
+
+    def get_queue(
+        self,
+        logger: logging.Logger = None,
+        queue_item_object: QueueItemProtocol = QueuePost
+    ) -> Queue:
+        if self._backend == self.SQLITE:
+            from mastofeed.lib.sqlite_storage import SqliteQueue
+            return SqliteQueue(
+                database=self._get_database(),
+                logger=logger,
+                queue_item_object=queue_item_object
+            )
+
+        return JournalQueue(
+            logger=logger,
+            storage_file=self._path(
+                self._config.get("queue_storage.file", self.DEFAULT_QUEUE_FILE)
+            ),
+            queue_item_object=queue_item_object,
+            compact_after=self._config.get(
+                "queue_storage.compact_after", JournalQueue.DEFAULT_COMPACT_AFTER
+            )
+        )
+
+    def _get_database(self):
+        from mastofeed.lib.sqlite_storage import SqliteDatabase
+        return SqliteDatabase.get_instance(
+            self._path(self._config.get("storage.database_file", self.DEFAULT_DATABASE_FILE))
+        )
+
+    def _path(self, filename: str) -> str:
+        return os.path.join(self._base_path, filename) if self._base_path is not None\
+            else filename
@@ -0,0 +1,63 @@
+from typing import Protocol, runtime_checkable
+
+
+@runtime_checkable
+class FeedsStorageProtocol(Protocol):
+    '''
+    The registry of feeds, by alias.
+
+    It keeps the pyxavi Storage interface, so the YAML backend
+    is just a Storage and the paths look like "alias.field".
+    '''
+
+    def get(self, param_name: str = "", default_value: any = None) -> any:
+        """Returns the value in the given path, otherwise the default_value"""
+
+    def set(self, param_name: str, value: any = None) -> None:
+        """Sets the value in the given path"""
+
+    def set_slugged(self, param_name: str, value: any = None) -> None:
+        """Sets the value in the slugified given path"""
+
+    def delete(self, param_name: str) -> None:
+        """Removes the given path"""
+
+    def key_exists(self, param_name: str) -> bool:
+        """Returns True if the given path exists"""
+
+    def get_all(self) -> dict:
+        """Returns all the feeds by alias"""
+
+    def read_file(self) -> None:
+        """Loads the registry from the persistence"""
+
+    def write_file(self) -> None:
+        """Persists the changes of the registry"""
+
+    def has_changed(self) -> bool:
+        """Returns True if the persistence changed since the last read or write"""
+
+
+@runtime_checkable
+class SeenIndexProtocol(Protocol):
+    '''
+    The IDs already seen for every source
+    '''
+
+    def load(self, source: str) -> int:
+        """Prepares the given source and returns how many IDs it has"""
+
+    def contains(self, source: str, id: any) -> bool:
+        """Returns True if the ID is already seen in the given source"""
+
+    def add(self, source: str, list_of_ids: list) -> None:
+        """Registers the IDs as seen in the given source"""
+
+    def length(self, source: str) -> int:
+        """Returns how many IDs the given source has"""
+
+    def is_dirty(self, source: str) -> bool:
+        """Returns True if the given source has changes to save"""
+
+    def save(self, source: str) -> None:
+        """Moves the changes of the given source to the feeds storage"""
@@ -0,0 +1,58 @@
+from mastofeed.lib.html_to_text import html_to_text
+import unicodedata
+
+
+class TextNormalizer:
+    '''
+    Normalizes texts so they can be compared against keywords
+
+    - Removes the HTML
+    - Lowercases everything
+    - Maps the accented characters to their base letter
+    - Removes the characters that usually split words ("-", ".", "'")
+
+    The translation table is built once for the whole process. When the
+    Unicode folding is active, any accent gets removed via NFKD, not only
+    the ones in the table.
+    '''
+
+    CHARACTERS_MAP = str.maketrans(
+        {
+            "à": "a",
+            "á": "a",
+            "è": "e",
+            "é": "e",
+            "ì": "i",
+            "í": "i",
+            "ò": "o",
+            "ó": "o",
+            "ù": "u",
+            "ú": "u",
+            "ç": "c",
+            "ñ": "n",
+            "-": None,
+            ".": None,
+            "'": None,
+        }
+    )
+
+    def __init__(self, unicode_folding: bool = False) -> None:
+        self._unicode_folding = unicode_folding
+
+    def normalize(self, text: str, is_html: bool = True) -> str:
+        text = (self.strip_html(text) if is_html else text).lower()
+
+        if self._unicode_folding:
+            text = "".join(
+                char for char in unicodedata.normalize("NFKD", text)
+                if not unicodedata.combining(char)
+            )
+
+        return text.translate(self.CHARACTERS_MAP)
+
+    def strip_html(self, text: str) -> str:
+        # Plain texts do not need to go through the parser
+        if "<" not in text and "&" not in text:
+            return text
+
+        return html_to_text(text)
@@ -1,15 +1,23 @@
 from pyxavi.config import Config
-from pyxavi.storage import Storage
 from pyxavi.media import Media
 from pyxavi.url import Url
 from pyxavi.terminal_color import TerminalColor
 from mastofeed.parsers.parser_protocol import ParserProtocol
 from mastofeed.lib.queue_post import QueuePost, QueuePostMedia
+from mastofeed.lib.storage_backend import StorageBackend
+from mastofeed.lib.html_to_text import html_to_text
+from mastofeed.lib.feed_stats import FeedStats
+from mastofeed.lib.run_metrics import RunMetrics
+from mastofeed.lib.profiler import Profiler
 from datetime import datetime
 from dateutil import parser
-from bs4 import BeautifulSoup
+from dateutil.relativedelta import relativedelta
 from time import mktime
 from string import Template
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from threading import BoundedSemaphore, Lock
+from urllib.parse import urlparse
+from typing import Iterator
 import feedparser
 import logging
 import re
@@ -23,7 +31,15 @@ class FeedParser(ParserProtocol):
     '''
     MAX_SUMMARY_LENGTH = 300
     DEFAULT_LANGUAGE = "en"
-    DEFAULT_STORAGE_FILE = "storage/feeds.yaml"
+    DEFAULT_MAX_WORKERS = 8
+    DEFAULT_MAX_WORKERS_PER_HOST = 2
+    HTTP_NOT_MODIFIED = 304
+    HTTP_BAD_REQUEST = 400
+    DEFAULT_SEEN_MAX_ITEMS = 1000
+    DEFAULT_SEEN_MAX_AGE_DAYS = 365
+    DEFAULT_STOP_AFTER_SEEN_STREAK = 0
+    DEFAULT_ADAPTIVE_MIN_INTERVAL = 900
+    DEFAULT_ADAPTIVE_MAX_INTERVAL = 86400
 
     FEED_EMULATED_PARAMS = {
         # [String]
@@ -45,13 +61,92 @@ class FeedParser(ParserProtocol):
     def __init__(self, config: Config) -> None:
         self._config = config
         self._logger = logging.getLogger(config.get("logger.name"))
-        self._feeds_storage = Storage(
-            self._config.get("feed_parser.storage_file", self.DEFAULT_STORAGE_FILE)
+        storage_backend = StorageBackend(config=self._config)
+        self._feeds_storage = storage_backend.get_feeds_storage()
+        self._max_workers = self._config.get(
+            "feed_parser.max_workers", self.DEFAULT_MAX_WORKERS
         )
+        self._max_workers_per_host = self._config.get(
+            "feed_parser.max_workers_per_host", self.DEFAULT_MAX_WORKERS_PER_HOST
+        )
+        self._host_semaphores = {}  # type: dict[str, BoundedSemaphore]
+        self._host_semaphores_lock = Lock()
+        self._seen_index = storage_backend.get_seen_index(
+            feeds_storage=self._feeds_storage,
+            max_items=self._config.get(
+                "feed_parser.seen_index.max_items", self.DEFAULT_SEEN_MAX_ITEMS
+            ),
+            max_age_days=self._config.get(
+                "feed_parser.seen_index.max_age_days", self.DEFAULT_SEEN_MAX_AGE_DAYS
+            )
+        )
+        self._stop_after_seen_streak = self._config.get(
+            "feed_parser.stop_after_seen_streak", self.DEFAULT_STOP_AFTER_SEEN_STREAK
+        )
+        self._adaptive_polling = self._config.get("feed_parser.adaptive_polling.active", False)
+        self._adaptive_min_interval = self._config.get(
+            "feed_parser.adaptive_polling.min_interval", self.DEFAULT_ADAPTIVE_MIN_INTERVAL
+        )
+        self._adaptive_max_interval = self._config.get(
+            "feed_parser.adaptive_polling.max_interval", self.DEFAULT_ADAPTIVE_MAX_INTERVAL
+        )
+        self._failed_sources = set()  # type: set[str]
+        self._run_metrics = RunMetrics()
         # self._sources = {x["name"]: x for x in self._config.get("feed_parser.sites", [])}
         self._load_sources()
+        self._load_validators()
+        self._load_stats()
         self._load_already_seen()
 
+    def set_run_metrics(self, run_metrics: RunMetrics) -> None:
+        self._run_metrics = run_metrics
+
+    def reload_sources_if_changed(self) -> bool:
+        """
+        Reloads the sources if the feeds storage changed from outside,
+        like when the listener adds or removes a feed. True if it did.
+
+        It must not be called between fetching and committing the seen state.
+        """
+        if not self._feeds_storage.has_changed():
+            return False
+
+        self._logger.debug("The feeds storage changed, reloading the sources")
+        self._feeds_storage.read_file()
+        self._load_sources()
+        self._load_validators()
+        self._load_stats()
+        self._load_already_seen()
+        return True
+
+    def get_failed_sources(self) -> list:
+        """The sources that failed in their last fetch"""
+        return list(self._failed_sources)
+
+    def get_due_sources(self, now: float = None) -> list:
+        """
+        The sources worth to poll now
+
+        With the adaptive polling, the ones that are unlikely to have
+        anything new according to their stats are left out.
+        """
+        if not self._adaptive_polling:
+            return list(self._sources.keys())
+
+        return [
+            source for source in self._sources.keys() if self._stats[source].
+            is_due(self._adaptive_min_interval, self._adaptive_max_interval, now=now)
+        ]
+
+    def get_poll_interval(self, source: str) -> float:
+        """Seconds until the source is worth to poll again. None without adaptive polling"""
+        if not self._adaptive_polling:
+            return None
+
+        return self._stats[source].get_interval(
+            self._adaptive_min_interval, self._adaptive_max_interval
+        )
+
     def _load_sources(self) -> None:
         # This takes the data from the self._feeds_storage,
         #   that since the new listener, it contains also the sites data,
@@ -81,15 +176,36 @@ class FeedParser(ParserProtocol):
                     "feed_parser.max_summary_length",
                     self.FEED_EMULATED_PARAMS["max_summary_length"]
                 ),
+                "named_account": params["named_account"] if "named_account" in params else None,
+            }
+
+    def _load_validators(self) -> None:
+        # The ETag and Last-Modified values we got in the last fetch of every source.
+        #   The new ones are kept apart until the seen state is saved,
+        #   so a failed run does not skip the content it never processed.
+        self._validators = {}  # type: dict[str, dict]
+        self._pending_validators = {}  # type: dict[str, dict]
+        for source in self._sources.keys():
+            self._validators[source] = {
+                "etag": self._feeds_storage.get(f"{source}.etag", None),
+                "modified": self._feeds_storage.get(f"{source}.modified", None),
             }
 
+    def _load_stats(self) -> None:
+        self._stats = {
+            source: FeedStats.from_dict(
+                self._feeds_storage.get(f"{source}.{FeedStats.STORAGE_KEY}", None)
+            )
+            for source in self._sources.keys()
+        }  # type: dict[str, FeedStats]
+
     def _load_already_seen(self) -> None:
 
         self._logger.debug("Loading already seen URLs")
-        self._already_seen = {}  # type: dict[str, list]
+        # The IDs set as seen during the run wait here until they are committed
+        self._pending_seen = {}  # type: dict[str, list]
         for source in self._sources.keys():
-            self._already_seen[source] = self._feeds_storage.get(f"{source}.urls_seen", [])
-            how_many = len(self._already_seen[source])
+            how_many = self._seen_index.load(source)
             self._logger.debug(
                 f"{TerminalColor.YELLOW}{source}{TerminalColor.END} has " +
                 f"{TerminalColor.YELLOW}{how_many}{TerminalColor.END} already seen URLs"
@@ -111,14 +227,16 @@ class FeedParser(ParserProtocol):
             else:
                 title = post.raw_content["title"]
 
-        # Cleaning body
+        # The body will be cut to this length at most, see below.
+        max_length = self._config.get("default.max_length", self.MAX_SUMMARY_LENGTH)
+        if "max_summary_length" in self._sources[source] and\
+           self._sources[source]["max_summary_length"]:
+            max_length = self._sources[source]["max_summary_length"]
+
+        # Cleaning body. No need to parse beyond what we'll use.
         body = ""
         if "body" in post.raw_content and post.raw_content["body"] != "":
-            body = post.raw_content["body"] + "\n\n"
-            body = ''.join(BeautifulSoup(body, "html.parser").findAll(string=True))
-            body = body.replace("\n\n\n", "\n\n")
-            body = re.sub(r'\s+', ' ', body)
-            body = body.strip(" ")
+            body = html_to_text(post.raw_content["body"], max_length=max_length + 1)
 
         # Do we need to add the source name into the title?
         if "show_name" in self._sources[source] and self._sources[source]["show_name"]:
@@ -133,10 +251,6 @@ class FeedParser(ParserProtocol):
             title = None
 
         # Cutting the body as per max length
-        max_length = self._config.get("default.max_length", self.MAX_SUMMARY_LENGTH)
-        if "max_summary_length" in self._sources[source] and\
-           self._sources[source]["max_summary_length"]:
-            max_length = self._sources[source]["max_summary_length"]
         # The max_length is only the space we have for the mastodon status.
         #   The template has a link added...
         #   we have to calculate how much the link will occupy, plus the \n
@@ -204,10 +318,40 @@ class FeedParser(ParserProtocol):
         # initialising
         metadata = {}
         list_of_raw_posts = []
-        discarded_posts = 0
 
         self._logger.debug("Parsing site %s", source)
-        parsed_site = feedparser.parse(site["url"])
+        self._failed_sources.discard(source)
+        # Don't hammer a single host when several feeds live in it.
+        #   Also send back the validators from the last fetch, so that
+        #   the server can answer with a 304 if nothing changed.
+        validators = self._validators[source]
+        with self._get_host_semaphore(site["url"]):
+            # feedparser downloads and parses the XML in one go
+            with Profiler.section(f"source:{source}"),\
+                 self._run_metrics.measure(RunMetrics.FETCH, source=source):
+                parsed_site = feedparser.parse(
+                    site["url"], etag=validators["etag"], modified=validators["modified"]
+                )
+
+        # Keep the new validators to be saved along with the seen state
+        new_validators = {
+            "etag": parsed_site.get("etag", validators["etag"]),
+            "modified": parsed_site.get("modified", validators["modified"]),
+        }
+        if new_validators != validators:
+            self._pending_validators[source] = new_validators
+
+        # The feed could not be fetched or parsed at all
+        if parsed_site.get("status", 0) >= self.HTTP_BAD_REQUEST or\
+           (parsed_site.get("bozo", False) and not parsed_site.get("entries", None)):
+            self._logger.warning(f"Could not get the feed {source}, skipping.")
+            self._failed_sources.add(source)
+            return list_of_raw_posts
+
+        # Nothing changed since the last fetch
+        if parsed_site.get("status", None) == self.HTTP_NOT_MODIFIED:
+            self._logger.debug("Feed not modified since the last fetch, skipping.")
+            return list_of_raw_posts
 
         # This site may not have posts
         if "entries" not in parsed_site or not parsed_site["entries"]:
@@ -217,11 +361,65 @@ class FeedParser(ParserProtocol):
         # Maybe we have a language setting at site level
         metadata["language"] = self.__choose_language_for_source(source, parsed_site)
 
-        for post in parsed_site["entries"]:
+        discarded = {"invalid": 0, "seen": 0, "too_old": 0}
+        with Profiler.section(f"source:{source}"),\
+             self._run_metrics.measure(RunMetrics.PARSE, source=source):
+            list_of_raw_posts = list(
+                self._posts_from_entries(source, parsed_site["entries"], metadata, discarded)
+            )
+        self._run_metrics.count("entries", len(parsed_site["entries"]), source=source)
+        for reason, amount in discarded.items():
+            self._run_metrics.count(reason, amount, source=source)
+
+        self._logger.debug(
+            f"Discarded {discarded['invalid']} invalid posts, {discarded['seen']} " +
+            f"already seen and {discarded['too_old']} too old from {source}"
+        )
+
+        return list_of_raw_posts
+
+    def _posts_from_entries(self, source: str, entries: list, metadata: dict,
+                            discarded: dict) -> Iterator[QueuePost]:
+        """
+        Yields the posts of the feed entries that are worth to process
+
+        The cheap checks go first, so the entries already seen or too old
+        are discarded before parsing their dates or building the posts.
+        In feeds ordered by date, a streak of seen entries means that
+        the rest are seen as well, so it can stop there.
+        """
+
+        oldest_timestamp = self._get_oldest_allowed_timestamp()
+        stop_after_seen_streak = self._stop_after_seen_streak\
+            if self._are_entries_ordered_by_date(entries) else 0
+        seen_streak = 0
+
+        for index, post in enumerate(entries):
 
             # We try to gather here everything that is needed for a Post
             post_url = Url.clean(post["link"], {"scheme": True})
 
+            if self._seen_index.contains(source, post_url):
+                discarded["seen"] += 1
+                seen_streak += 1
+                if stop_after_seen_streak > 0 and seen_streak >= stop_after_seen_streak:
+                    self._logger.debug(
+                        f"Found {seen_streak} seen posts in a row. The rest are older."
+                    )
+                    discarded["seen"] += len(entries) - index - 1
+                    return
+                continue
+            seen_streak = 0
+
+            # We need the published date to be able to calculate how old is it.
+            #   The struct one can be checked without building a datetime.
+            published_parsed = post["published_parsed"]\
+                if "published_parsed" in post and post["published_parsed"] else None
+            if published_parsed is not None and oldest_timestamp is not None and\
+               mktime(published_parsed) < oldest_timestamp:
+                discarded["too_old"] += 1
+                continue
+
             # In some cases we don't have a 'summary', but a 'description' field
             summary = post["summary"] if "summary" in post else None
             if summary is None and "description" in post:
@@ -230,63 +428,171 @@ class FeedParser(ParserProtocol):
             # If we still don't have a summary, the post is useless
             if summary is None:
                 self._logger.debug("Could not fix not present [summary]. Discarding.")
-                discarded_posts += 1
+                discarded["invalid"] += 1
                 continue
 
-            # We need the published date to be able to calculate how old is it.
-            post_date = self.__datetime_from_struct_date(post["published_parsed"])\
-                if "published_parsed" in post and post["published_parsed"] else None
+            post_date = self.__datetime_from_struct_date(published_parsed)\
+                if published_parsed is not None else None
             if post_date is None and "published" in post and post["published"]:
                 post_date = parser.parse(post["published"])
+                if oldest_timestamp is not None and post_date.timestamp() < oldest_timestamp:
+                    discarded["too_old"] += 1
+                    continue
             # We still don't have a post date
             if post_date is None:
                 self._logger.debug("No usable published date. Discarding")
-                discarded_posts += 1
+                discarded["invalid"] += 1
                 continue
 
-            list_of_raw_posts.append(
-                QueuePost(
-                    id=post_url,
-                    raw_content={
-                        "url": post["link"],
-                        "title": post["title"],
-                        "body": summary,
-                    },
-                    raw_combined_content=f"{post['title']} {summary}",
-                    published_at=post_date,
-                    language=metadata["language"]
-                    if metadata is not None and "language" in metadata else None
-                )
+            yield QueuePost(
+                id=post_url,
+                raw_content={
+                    "url": post["link"],
+                    "title": post["title"],
+                    "body": summary,
+                },
+                raw_combined_content=f"{post['title']} {summary}",
+                published_at=post_date,
+                language=metadata["language"]
+                if metadata is not None and "language" in metadata else None
             )
 
-        self._logger.debug(f"Discarded {discarded_posts} invalid posts from {source}")
+    def _get_oldest_allowed_timestamp(self) -> float:
+        """The timestamp before which the posts are too old, or None if there is no limit"""
 
-        return list_of_raw_posts
+        months = self._config.get("default.months_post_too_old", None)
+        if months is None:
+            return None
+
+        # A day of margin, as the final check is done in UTC
+        return (datetime.now() - relativedelta(months=months, days=1)).timestamp()
+
+    def _are_entries_ordered_by_date(self, entries: list) -> bool:
+        """True if all the entries have a parsed date and come from newest to oldest"""
+
+        dates = [post.get("published_parsed", None) for post in entries]
+        if None in dates:
+            return False
+
+        return all(tuple(dates[i]) >= tuple(dates[i + 1]) for i in range(len(dates) - 1))
+
+    def get_raw_content_for_sources(self,
+                                    sources: list = None,
+                                    skip_failed: bool = False) -> Iterator[tuple]:
+        """
+        Gets the data from all the given sources concurrently
+
+        It yields a tuple (source, list_of_posts) as soon as each source is done,
+        so the caller can process the results as they arrive.
+        With skip_failed, a source that raises is logged and left out
+        instead of stopping the rest.
+        """
+
+        if sources is None:
+            sources = list(self._sources.keys())
+        if len(sources) == 0:
+            return
+
+        workers = max(1, min(self._max_workers, len(sources)))
+        self._logger.debug(f"Fetching {len(sources)} sources with {workers} workers")
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="feed-fetch")
+        try:
+            futures = {
+                executor.submit(self.get_raw_content_for_source, source): source
+                for source in sources
+            }
+            for future in as_completed(futures):
+                source = futures[future]
+                try:
+                    posts = future.result()
+                except Exception as e:
+                    if not skip_failed:
+                        raise
+                    self._logger.exception(e)
+                    self._failed_sources.add(source)
+                    continue
+                yield source, posts
+        finally:
+            # If the caller stops iterating we don't want to start the pending ones
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _get_host_semaphore(self, url: str) -> BoundedSemaphore:
+        host = urlparse(url).hostname or ""
+        with self._host_semaphores_lock:
+            if host not in self._host_semaphores:
+                self._host_semaphores[host] = BoundedSemaphore(self._max_workers_per_host)
+            return self._host_semaphores[host]
 
     def is_id_already_seen_for_source(self, source: str, id: any) -> bool:
         """Identifies if this ID is already registered in the state"""
 
-        return True if id in self._already_seen[source] else False
+        return self._seen_index.contains(source, id)
 
     def set_ids_as_seen_for_source(self, source: str, list_of_ids: list) -> None:
-        """Performs the saving of the seen state"""
+        """
+        Registers the IDs as seen for the source
 
-        if len(list_of_ids) == 0:
-            self._logger.debug(
-                f"{TerminalColor.YELLOW}{source}{TerminalColor.END} has " +
-                f"{len(list_of_ids)} new seen URLs. Skipping re-writting them."
-            )
+        They are kept in memory until commit_seen_state() is called,
+        so that nothing is marked as seen before it is safely queued.
+        """
+
+        self._logger.debug(f"Buffering {len(list_of_ids)} seen URLs for {source}")
+        if source not in self._pending_seen:
+            self._pending_seen[source] = []
+        self._pending_seen[source] += list_of_ids
+
+    def commit_seen_state(self) -> None:
+        """Performs the saving of the seen state buffered during the run"""
+
+        changed_sources = 0
+        for source, list_of_ids in self._pending_seen.items():
+            validators_updated = self._store_validators_for_source(source)
+            stats_updated = self._store_stats_for_source(source, len(list_of_ids))
+
+            if len(list_of_ids) == 0 and not self._seen_index.is_dirty(source):
+                if validators_updated or stats_updated:
+                    changed_sources += 1
+                continue
+
+            self._logger.debug(f"Adding {len(list_of_ids)} seen URLs to {source}")
+            self._seen_index.add(source, list_of_ids)
+            self._seen_index.save(source)
+            changed_sources += 1
+
+        self._pending_seen = {}
+
+        if changed_sources == 0:
+            self._logger.debug("No changes in the seen state. Skipping re-writting it.")
             return
 
-        self._logger.debug(f"Adding {len(list_of_ids)} seen URLs to {source}")
-        for new_url in list_of_ids:
-            self._already_seen[source].append(new_url)
+        self._logger.debug(f"Writting the seen state of {changed_sources} sources")
+        self._feeds_storage.write_file()
 
-        self._logger.debug(
-            f"Updating {len(self._already_seen[source])} seen URLs in the storage for {source}"
+    def _store_stats_for_source(self, source: str, new_entries: int) -> bool:
+        """Records this poll into the stats of the source. True if they changed"""
+
+        if not self._adaptive_polling or source in self._failed_sources or\
+           source not in self._stats:
+            return False
+
+        self._stats[source].record_poll(new_entries)
+        self._feeds_storage.set(
+            f"{source}.{FeedStats.STORAGE_KEY}", self._stats[source].to_dict()
         )
-        self._feeds_storage.set(f"{source}.urls_seen", self._already_seen[source])
-        self._feeds_storage.write_file()
+        return True
+
+    def _store_validators_for_source(self, source: str) -> bool:
+        """Moves the pending validators into the storage. True if there were any"""
+
+        if source not in self._pending_validators:
+            return False
+
+        self._validators[source] = self._pending_validators.pop(source)
+        for key, value in self._validators[source].items():
+            if value is not None:
+                self._feeds_storage.set(f"{source}.{key}", value)
+
+        return True
 
     def post_process_for_source(self, source: str, posts: list[QueuePost]) -> list[QueuePost]:
         return posts
@@ -1,6 +1,7 @@
-from typing import Protocol, runtime_checkable
+from typing import Protocol, Iterator, runtime_checkable
 from pyxavi.config import Config
 from mastofeed.lib.queue_post import QueuePost
+from mastofeed.lib.run_metrics import RunMetrics
 
 
 @runtime_checkable
@@ -9,16 +10,39 @@ class ParserProtocol(Protocol):
     def __init__(self, config: Config) -> None:
         """Initializing the class"""
 
+    def set_run_metrics(self, run_metrics: RunMetrics) -> None:
+        """Sets where to measure the fetch and parse of the sources"""
+
     def get_sources(self) -> dict:
         """Gets each source and all related parameters by name"""
 
     def get_raw_content_for_source(self, source: str) -> list[QueuePost]:
         """Gets the data from the source"""
 
+    def get_raw_content_for_sources(self,
+                                    sources: list = None,
+                                    skip_failed: bool = False) -> Iterator[tuple]:
+        """Gets the data from the sources, yielding (source, posts) as they arrive"""
+
+    def get_failed_sources(self) -> list:
+        """Returns the sources that failed in their last fetch"""
+
+    def get_due_sources(self, now: float = None) -> list:
+        """Returns the sources worth to poll now"""
+
+    def get_poll_interval(self, source: str) -> float:
+        """Returns the seconds until the source is worth to poll again, if it knows"""
+
+    def reload_sources_if_changed(self) -> bool:
+        """Reloads the sources if they changed since loaded. True if they did"""
+
     def is_id_already_seen_for_source(self, source: str, id: any) -> bool:
         """Returns True if the ID is already registered in the state by the given source"""
 
     def set_ids_as_seen_for_source(self, source: str, list_of_ids: list) -> bool:
+        """Registers the IDs as seen by the given source, to be saved on commit"""
+
+    def commit_seen_state(self) -> None:
         """Performs the saving of the seen state"""
 
     def post_process_for_source(self, source: str, posts: list[QueuePost]) -> list[QueuePost]:
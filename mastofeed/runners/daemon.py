@@ -0,0 +1,126 @@
+from pyxavi.config import Config
+from pyxavi.terminal_color import TerminalColor
+from mastofeed.lib.poll_scheduler import PollScheduler
+from mastofeed.runners.runner_protocol import RunnerProtocol
+from mastofeed.parsers.parser_protocol import ParserProtocol
+from mastofeed.runners.main import Main
+from threading import Event
+import signal
+import logging
+
+
+class FeedDaemon(RunnerProtocol):
+    '''
+    Runs the MastoFeed bot as a long running process
+
+    The config, the logger, the Mastodon connection, the queue and the
+    parsers are set up once. Then every source is polled when it is due,
+    according to the PollScheduler, and the queue is published as in a
+    regular run. The sources are reloaded when the feeds storage changes.
+    '''
+
+    DEFAULT_RELOAD_CHECK_SECONDS = 60
+
+    def __init__(self, config: Config, logger: logging, params: dict = None) -> None:
+        self._config = config
+        self._logger = logger
+        self._main = Main(config=config, logger=logger)
+        self._stop_event = Event()
+        self._reload_check_seconds = config.get(
+            "feed_daemon.reload_check_seconds", self.DEFAULT_RELOAD_CHECK_SECONDS
+        )
+        self._parsers = {}  # type: dict[str, ParserProtocol]
+        self._schedulers = {}  # type: dict[str, PollScheduler]
+
+    def run(self) -> None:
+
+        self._logger.info(f"{TerminalColor.MAGENTA}MastoFeed daemon{TerminalColor.END}")
+        self._handle_signals()
+
+        try:
+            self.load_parsers()
+        except Exception as e:
+            self._main.report_error(e, runner_name="Daemon")
+            return
+
+        while not self._stop_event.is_set():
+            self.run_cycle()
+            self._stop_event.wait(self.seconds_to_wait())
+
+        self._logger.info(f"{TerminalColor.MAGENTA}MastoFeed daemon stopped{TerminalColor.END}")
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def load_parsers(self) -> None:
+        parsers_config = self._main.prepare_config_for_parsers()
+        for name, module in self._main.load_active_parsers().items():
+            self._parsers[name] = module(config=parsers_config)
+            self._schedulers[name] = self._build_scheduler()
+
+    def run_cycle(self) -> None:
+        """Polls the sources that are due, in every parser"""
+
+        self._main.start_run_metrics(runner_name="daemon")
+        polled = False
+        for name, instance in self._parsers.items():
+            scheduler = self._schedulers[name]
+            due = []
+            try:
+                instance.reload_sources_if_changed()
+                scheduler.sync(list(instance.get_sources().keys()))
+
+                due = scheduler.get_due()
+                if len(due) == 0:
+                    continue
+
+                self._logger.debug(f"{name}: {len(due)} sources are due")
+                if not polled:
+                    # Another process (the publish_queue cron) may have changed it meanwhile
+                    self._main.reload_queue()
+                polled = True
+                self._main.run_parser(instance=instance, sources=due, skip_failed=True)
+
+                failed = instance.get_failed_sources()
+                for source in due:
+                    if source in failed:
+                        scheduler.mark_failure(source)
+                    else:
+                        scheduler.mark_success(
+                            source, interval=instance.get_poll_interval(source)
+                        )
+
+            except Exception as e:
+                self._main.report_error(e, runner_name="Daemon")
+                for source in due:
+                    scheduler.mark_failure(source)
+
+        # Every cycle that polled something is a run
+        if polled:
+            self._main.write_run_metrics()
+
+    def seconds_to_wait(self) -> float:
+        """Until the next source is due, but checking the storage from time to time"""
+
+        waits = [self._reload_check_seconds]
+        for scheduler in self._schedulers.values():
+            seconds = scheduler.seconds_until_next()
+            if seconds is not None:
+                waits.append(seconds)
+
+        return min(waits)
+
+    def _build_scheduler(self) -> PollScheduler:
+        return PollScheduler(
+            default_interval=self._config.get("feed_daemon.interval", None),
+            intervals=self._config.get("feed_daemon.intervals", None),
+            jitter=self._config.get("feed_daemon.jitter", None),
+            max_backoff=self._config.get("feed_daemon.max_backoff", None),
+        )
+
+    def _handle_signals(self) -> None:
+        try:
+            signal.signal(signal.SIGTERM, lambda signum, frame: self.stop())
+        except ValueError:
+            # Signals can only be set from the main thread
+            pass
@@ -6,6 +6,9 @@ from pyxavi.mastodon_helper import MastodonHelper, MastodonConnectionParams
 from mastofeed.lib.mentions_listener import MentionsListener
 from mastofeed.runners.runner_protocol import RunnerProtocol
 from definitions import ROOT_DIR
+from threading import Event
+from time import time
+import random
 import logging
 
 
@@ -13,38 +16,113 @@ class Listener(RunnerProtocol):
     '''
     Starts the Mastodon Streaming listener. It will kidnap the thread, so you better
     run it as a separated command and leave it running in the background.
+
+    The stream is supervised: when it fails or ends, we connect again after
+    an exponential backoff with jitter, and the mentions that arrived meanwhile
+    are caught up through the notifications API. The stream is taken as dead
+    when nothing, not even its heartbeat, arrives in stream_timeout seconds.
     '''
 
+    DEFAULT_STREAM_TIMEOUT = 60
+    DEFAULT_BACKOFF_BASE = 5
+    DEFAULT_MAX_BACKOFF = 600
+    DEFAULT_JITTER = 0.2
+    DEFAULT_HEALTHY_AFTER = 300
+    # The failures of a long outage grow forever, but the backoff stops doubling
+    MAX_BACKOFF_EXPONENT = 16
+
     def __init__(self, config: Config, logger: logging, params: dict = None) -> None:
         self._config = config
         self._logger = logger
+        self._stop_event = Event()
+        self._stream_timeout = config.get(
+            "listener.stream_timeout", self.DEFAULT_STREAM_TIMEOUT
+        )
+        self._backoff_base = config.get("listener.backoff_base", self.DEFAULT_BACKOFF_BASE)
+        self._max_backoff = config.get("listener.max_backoff", self.DEFAULT_MAX_BACKOFF)
+        self._jitter = config.get("listener.jitter", self.DEFAULT_JITTER)
+        self._healthy_after = config.get("listener.healthy_after", self.DEFAULT_HEALTHY_AFTER)
+        self._failures = 0
+        self._mastodon_instance = None
+        self._mention_listener = None  # type: MentionsListener
 
     def run(self) -> None:
 
         self._logger.info(f"{TerminalColor.MAGENTA}MastoFeed listener{TerminalColor.END}")
-        try:
 
-            # Instantiate the classes
-            mastodon_instance = self._get_default_mastodon_instance()
+        while not self._stop_event.is_set():
+            started_at = time()
+            try:
+                self.listen()
+                self.count_failure(started_at)
+                self._logger.warning(
+                    f"{TerminalColor.YELLOW}The stream was closed{TerminalColor.END}"
+                )
+            except Exception as e:
+                self.count_failure(started_at)
+                self.report_failure(e)
+
+            self._stop_event.wait(self.seconds_to_wait())
+
+        if self._mention_listener is not None:
+            self._mention_listener.shutdown()
+        self._logger.info(
+            f"{TerminalColor.MAGENTA}MastoFeed listener stopped{TerminalColor.END}"
+        )
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def listen(self) -> None:
+        """Connects the stream, that blocks until it fails"""
+
+        # Instantiate the classes, once
+        if self._mastodon_instance is None:
+            self._mastodon_instance = self._get_default_mastodon_instance()
+        if self._mention_listener is None:
             mention_listener = MentionsListener()
             mention_listener.load_config(config=self._config)
+            self._mention_listener = mention_listener
+
+        # What arrived while we were not listening comes when the stream is connected
+        self._mention_listener.request_catch_up(self._mastodon_instance)
+
+        # Set the listener for the Streaming for User stuff
+        self._mastodon_instance.stream_user(
+            self._mention_listener, timeout=self._stream_timeout
+        )
+
+    def count_failure(self, started_at: float) -> None:
+        # A connection that lasted starts a new streak of failures
+        if time() - started_at >= self._healthy_after:
+            self._failures = 0
+        self._failures += 1
+
+    def report_failure(self, error: Exception) -> None:
+        if self._failures > 1:
+            # Already reported at the beginning of the streak
+            self._logger.warning(
+                f"{TerminalColor.YELLOW}The stream failed again ({self._failures} " +
+                f"in a row): {error}{TerminalColor.END}"
+            )
+            return
+
+        if self._config.get("janitor.active", False):
+            remote_url = self._config.get("janitor.remote_url")
+            if remote_url is not None and not self._config.get("publisher.dry_run"):
+                app_name = self._config.get("app.name")
+                Janitor(remote_url).error(
+                    message="```\n" + full_stack() + "\n```",
+                    summary=f"MastoFeed Listener [{app_name}] failed: {error}"
+                )
+
+        self._logger.exception(error)
 
-            # Set the listener for the Streaming for User stuff
-            mastodon_instance.stream_user(mention_listener)
-
-        except Exception as e:
-            if self._config.get("janitor.active", False):
-                remote_url = self._config.get("janitor.remote_url")
-                if remote_url is not None and not self._config.get("publisher.dry_run"):
-                    app_name = self._config.get("app.name")
-                    Janitor(remote_url).error(
-                        message="```\n" + full_stack() + "\n```",
-                        summary=f"MastoFeed Listener [{app_name}] failed: {e}"
-                    )
-
-            self._logger.exception(e)
-            # Let's try an infinite loop
-            self.run()
+    def seconds_to_wait(self) -> float:
+        exponent = min(self._failures - 1, self.MAX_BACKOFF_EXPONENT)
+        backoff = min(self._backoff_base * (2**exponent), self._max_backoff)
+        spread = backoff * self._jitter
+        return max(0, backoff + random.uniform(-spread, spread))
 
     def _get_default_mastodon_instance(self, named_account="default"):
         return MastodonHelper.get_instance(
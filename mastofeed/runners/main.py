@@ -2,11 +2,14 @@ from pyxavi.config import Config
 from pyxavi.janitor import Janitor
 from pyxavi.debugger import full_stack
 from pyxavi.terminal_color import TerminalColor
-from pyxavi.queue_stack import Queue
-from mastofeed.lib.publisher import Publisher
+from mastofeed.lib.accounts_publisher import AccountsPublisher
 from mastofeed.lib.keywords_filter import KeywordsFilter
 from mastofeed.runners.runner_protocol import RunnerProtocol
 from mastofeed.lib.queue_post import QueuePost
+from mastofeed.lib.storage_backend import StorageBackend
+from mastofeed.lib.overlay_config import OverlayConfig
+from mastofeed.lib.run_metrics import RunMetrics
+from mastofeed.lib.profiler import Profiler
 from definitions import ROOT_DIR
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
@@ -31,7 +34,6 @@ class Main(RunnerProtocol):
         },
     }
     MONTHS_POST_TOO_OLD = 6
-    DEFAULT_QUEUE_FILE = "storage/queue.yaml"
     # Be careful, these parameters are not completelly merged here.
     #   There are still values defined in the module classes!
     DEFAULT = {
@@ -39,7 +41,8 @@ class Main(RunnerProtocol):
         "max_media_per_status": 4,
         "language": "en",
         "merge_content": True,
-        "publish_only_older_toot": False
+        "publish_only_older_toot": False,
+        "months_post_too_old": MONTHS_POST_TOO_OLD
     }
 
     def __init__(self, config: Config, logger: logging, params: dict = None) -> None:
@@ -47,12 +50,10 @@ class Main(RunnerProtocol):
         self._logger = logger
 
         self._keywords_filter = KeywordsFilter(config)
-        self._queue = Queue(
-            logger=self._logger,
-            storage_file=config.get("queue_storage.file", self.DEFAULT_QUEUE_FILE),
-            queue_item_object=QueuePost
+        self._queue = StorageBackend(config=config).get_queue(
+            logger=self._logger, queue_item_object=QueuePost
         )
-        self._publisher = Publisher(
+        self._accounts_publisher = AccountsPublisher(
             config=self._config,
             base_path=ROOT_DIR,
             only_oldest=self._config.get(
@@ -60,10 +61,14 @@ class Main(RunnerProtocol):
             ),
             queue=self._queue
         )
+        # The default account is also the one that the parsers use
+        self._publisher = self._accounts_publisher.get_publisher()
+        self._run_metrics = RunMetrics()
 
     def run(self) -> None:
 
         self._logger.info(f"{TerminalColor.MAGENTA}Main MastoFeed run{TerminalColor.END}")
+        self.start_run_metrics(runner_name="main")
         try:
 
             # Get the parsers that are active from the defined ones above.
@@ -76,85 +81,162 @@ class Main(RunnerProtocol):
                 # Instantiate this parser
                 instance = module(config=parsers_config)  # type: ParserProtocol
 
-                # Walk through all sources defined in the parser's config
-                for source, parameters in instance.get_sources().items():
+                self.run_parser(instance=instance)
 
-                    self._logger.info(
-                        f"{TerminalColor.BLUE}Processing source " +
-                        f"{TerminalColor.YELLOW}{source}{TerminalColor.END}"
-                    )
+        except Exception as e:
+            self.report_error(e, runner_name="Main")
 
-                    # Get all the raw data related to this source
-                    posts = instance.get_raw_content_for_source(source)
-                    self._logger.debug(f"Ready to process {len(posts)} posts.")
+        self.write_run_metrics()
 
-                    # Walk the posts to process them
-                    valid_posts = []  # type: list[QueuePost]
-                    discarded_posts = 0
-                    for post in posts:
+    def reload_queue(self) -> None:
+        """Reads the queue again from its storage, dropping what was not saved"""
+        self._queue.load()
 
-                        # Apply filters
-                        if self.is_post_invalid(post=post,
-                                                source=source,
-                                                instance=instance,
-                                                source_params=parameters):
-                            discarded_posts += 1
-                            continue
+    def start_run_metrics(self, runner_name: str) -> RunMetrics:
+        """Starts measuring a new run"""
+        self._run_metrics = RunMetrics(runner=runner_name)
+        return self._run_metrics
 
-                        valid_posts.append(post)
+    def write_run_metrics(self) -> None:
+        """Writes the report of the run, if it is active in the config"""
+        self._run_metrics.finish()
+        if not self._config.get("run_metrics.active", False):
+            return
 
-                    color = TerminalColor.END if discarded_posts == 0 else TerminalColor.RED
-                    self._logger.info(
-                        f"{color}Discarded {discarded_posts} posts.{TerminalColor.END}"
-                    )
+        try:
+            self._run_metrics.write(
+                json_file=self._config.get("run_metrics.file", None),
+                prometheus_file=self._config.get("run_metrics.prometheus_file", None)
+            )
+        except Exception as e:
+            # Not being able to report is not a reason to stop the bot
+            self._logger.exception(e)
 
-                    # At this point, we should add these new posts into the state
-                    instance.set_ids_as_seen_for_source(source, [x.id for x in valid_posts])
+    def run_parser(
+        self,
+        instance: ParserProtocol,
+        sources: list = None,
+        skip_failed: bool = False
+    ) -> None:
+        """
+        Fetches the given sources of the parser (the due ones by default),
+        queues their posts and publishes the queue
+        """
+
+        instance.set_run_metrics(self._run_metrics)
+
+        # Walk through all sources defined in the parser's config.
+        #   They are fetched concurrently and come as they are ready.
+        all_sources = instance.get_sources()
+        if sources is None:
+            sources = instance.get_due_sources()
+            skipped = len(all_sources) - len(sources)
+            if skipped > 0:
+                self._logger.info(
+                    f"Skipping {skipped} sources that are unlikely to have anything new"
+                )
+        for source, posts in instance.get_raw_content_for_sources(sources,
+                                                                  skip_failed=skip_failed):
+            with Profiler.section(f"source:{source}"):
+                self.process_source(
+                    instance=instance,
+                    source=source,
+                    posts=posts,
+                    parameters=all_sources[source]
+                )
 
-                    # In some cases the instance wants to post process the resulting list.
-                    processed_posts = instance.post_process_for_source(source, valid_posts)
+        # Trying to isolate the possible issues between parsers,
+        #   we secure the current queue before we move to the next parser.
+        with self._run_metrics.measure(RunMetrics.QUEUE_PERSIST):
+            self._logger.debug(
+                f"Prepare queue of {self._queue.length()} items to be deduplicated"
+            )
+            self._queue.deduplicate()
+            self._logger.debug(f"Deduplicated. Now {self._queue.length()} items to be sorted")
+            self._queue.sort()
+            self._logger.debug(f"Sorted. Now {self._queue.length()} items to be saved")
+            self._queue.save()
+
+            # Only now that the posts are safe in the queue we mark them as seen.
+            #   If anything failed before, they'll be picked up again in the next run.
+            instance.commit_seen_state()
+
+        # Now publish the queue, according to the config preferences.
+        #   Every named account publishes its posts at the same time.
+        with self._run_metrics.measure(RunMetrics.PUBLISH):
+            self._accounts_publisher.publish_all_from_queue()
+
+    def process_source(
+        self, instance: ParserProtocol, source: str, posts: list, parameters: dict
+    ) -> None:
+        """Filters, formats and queues the posts of a source"""
+
+        self._logger.info(
+            f"{TerminalColor.BLUE}Processing source " +
+            f"{TerminalColor.YELLOW}{source}{TerminalColor.END}"
+        )
+        self._logger.debug(f"Ready to process {len(posts)} posts.")
 
-                    # And finally walk them to download media and apply format
-                    for post in processed_posts:
+        # Walk the posts to process them
+        valid_posts = []  # type: list[QueuePost]
+        discarded_posts = 0
+        for post in posts:
 
-                        # Parse the content searching for media.
-                        #   Some parsers would download them, some others would just
-                        #   identify them and let the Publisher download them.
-                        instance.parse_media(post)
+            # Apply filters
+            with self._run_metrics.measure(RunMetrics.FILTER, source=source):
+                is_invalid = self.is_post_invalid(
+                    post=post, source=source, instance=instance, source_params=parameters
+                )
+            if is_invalid:
+                discarded_posts += 1
+                continue
 
-                        # Format the post, according to what the instance wants.
-                        instance.format_post_for_source(source, post)
+            valid_posts.append(post)
 
-                        # And finally, add it into the queue
-                        self._queue.append(post)
+        self._run_metrics.count("discarded", discarded_posts, source=source)
+        color = TerminalColor.END if discarded_posts == 0 else TerminalColor.RED
+        self._logger.info(f"{color}Discarded {discarded_posts} posts.{TerminalColor.END}")
 
-                # Trying to isolate the possible issues between parsers,
-                #   we secure the current queue before we move to the next parser.
-                self._logger.debug(
-                    f"Prepare queue of {self._queue.length()} items to be deduplicated"
-                )
-                self._queue.deduplicate()
-                self._logger.debug(
-                    f"Deduplicated. Now {self._queue.length()} items to be sorted"
-                )
-                self._queue.sort()
-                self._logger.debug(f"Sorted. Now {self._queue.length()} items to be saved")
-                self._queue.save()
+        # At this point, we should add these new posts into the state.
+        #   It is not saved until the queue is saved.
+        instance.set_ids_as_seen_for_source(source, [x.id for x in valid_posts])
 
-                # Now publish the queue, according to the config preferences.
-                self._publisher.publish_all_from_queue()
+        # In some cases the instance wants to post process the resulting list.
+        processed_posts = instance.post_process_for_source(source, valid_posts)
 
-        except Exception as e:
-            if self._config.get("janitor.active", False):
-                remote_url = self._config.get("janitor.remote_url")
-                if remote_url is not None and not self._config.get("publisher.dry_run"):
-                    app_name = self._config.get("app.name")
-                    Janitor(remote_url).error(
-                        message="```\n" + full_stack() + "\n```",
-                        summary=f"MastoFeed Main [{app_name}] failed: {e}"
-                    )
+        # And finally walk them to download media and apply format
+        for post in processed_posts:
 
-            self._logger.exception(e)
+            # Parse the content searching for media.
+            #   Some parsers would download them, some others would just
+            #   identify them and let the Publisher download them.
+            with self._run_metrics.measure(RunMetrics.MEDIA, source=source):
+                instance.parse_media(post)
+
+            # Format the post, according to what the instance wants.
+            with self._run_metrics.measure(RunMetrics.FORMAT, source=source):
+                instance.format_post_for_source(source, post)
+
+            # Route it to the named account of the source, if any
+            post.named_account = parameters["named_account"]\
+                if "named_account" in parameters else None
+
+            # And finally, add it into the queue
+            self._queue.append(post)
+
+        self._run_metrics.count("queued", len(processed_posts), source=source)
+
+    def report_error(self, e: Exception, runner_name: str) -> None:
+        if self._config.get("janitor.active", False):
+            remote_url = self._config.get("janitor.remote_url")
+            if remote_url is not None and not self._config.get("publisher.dry_run"):
+                app_name = self._config.get("app.name")
+                Janitor(remote_url).error(
+                    message="```\n" + full_stack() + "\n```",
+                    summary=f"MastoFeed {runner_name} [{app_name}] failed: {e}"
+                )
+
+        self._logger.exception(e)
 
     def load_active_parsers(self) -> dict:
         """Get the list of parsers that are active"""
@@ -165,13 +247,12 @@ class Main(RunnerProtocol):
         }
 
     def prepare_config_for_parsers(self) -> Config:
-        parsers_config = Config(params=self._config.get_all())
-        parsers_config.merge_from_dict(
-            parameters={
+        return OverlayConfig(
+            base=self._config,
+            overlay={
                 "mastodon": self._publisher._mastodon, "default": self.DEFAULT
             }
         )
-        return parsers_config
 
     def is_post_invalid(
         self, post: QueuePost, source: str, instance: ParserProtocol, source_params: dict
@@ -179,10 +260,13 @@ class Main(RunnerProtocol):
 
         result = False
         if self._is_already_seen(post=post, source=source, instance=instance):
+            self._run_metrics.count("seen", source=source)
             result = True
         if not self._is_valid_date(post=post):
+            self._run_metrics.count("too_old", source=source)
             result = True
         if not self._is_valid_keyword_profile(post=post, source_params=source_params):
+            self._run_metrics.count("keyword_rejected", source=source)
             result = True
 
         return result
@@ -231,14 +315,16 @@ class Main(RunnerProtocol):
             return True
 
         # The content to analyse comes in [raw_combined_body]
-        #   and it is unclean, so it could come unnormalized.
+        #   and it is unclean, so we use its plain text, still unnormalized.
         if self._keywords_filter.profile_allows_text(source_params["keywords_filter_profile"],
-                                                     post.raw_combined_content):
+                                                     post.plain_combined_content,
+                                                     cache_key=post.id,
+                                                     is_html=False):
             return True
 
         self._logger.debug(
             f"Discarding post {post.id}: Do not pass keywords profile " +
-            f"{post.filters['keywords_profile']}"
+            f"{source_params['keywords_filter_profile']}"
         )
         return False
 
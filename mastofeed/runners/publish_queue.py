@@ -1,6 +1,6 @@
 from pyxavi.config import Config
 from pyxavi.terminal_color import TerminalColor
-from mastofeed.lib.publisher import Publisher
+from mastofeed.lib.accounts_publisher import AccountsPublisher
 from mastofeed.runners.runner_protocol import RunnerProtocol
 from definitions import ROOT_DIR
 import logging
@@ -14,7 +14,7 @@ class QueuePublisher(RunnerProtocol):
     def __init__(self, config: Config, logger: logging, params: dict = None) -> None:
         self._config = config
         self._logger = logger
-        self._publisher = Publisher(config=self._config, base_path=ROOT_DIR)
+        self._publisher = AccountsPublisher(config=self._config, base_path=ROOT_DIR)
 
     def run(self):
         '''
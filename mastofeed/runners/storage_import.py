@@ -0,0 +1,87 @@
+from pyxavi.config import Config
+from pyxavi.storage import Storage
+from pyxavi.terminal_color import TerminalColor
+from mastofeed.lib.queue_post import QueuePost
+from mastofeed.lib.journal_queue import JournalQueue
+from mastofeed.lib.seen_index import SeenIndex
+from mastofeed.lib.storage_backend import StorageBackend
+from mastofeed.lib.sqlite_storage import SqliteDatabase, SqliteFeedsStorage,\
+    SqliteSeenIndex, SqliteQueue
+from mastofeed.runners.runner_protocol import RunnerProtocol
+import logging
+
+
+class StorageImport(RunnerProtocol):
+    '''
+    Imports the feeds registry, the seen state and the queue
+    from the YAML files into the SQLite database.
+
+    It is safe to run it more than once: existing aliases get overwritten,
+    seen hashes and queued posts get merged.
+    '''
+
+    def __init__(self, config: Config, logger: logging, params: dict = None) -> None:
+        self._config = config
+        self._logger = logger
+
+    def run(self) -> None:
+        self._logger.info(
+            f"{TerminalColor.MAGENTA}Importing the YAML storage into SQLite{TerminalColor.END}"
+        )
+        try:
+            database = SqliteDatabase.get_instance(
+                self._config.get("storage.database_file", StorageBackend.DEFAULT_DATABASE_FILE)
+            )
+            self.import_feeds(database=database)
+            self.import_queue(database=database)
+        except Exception as e:
+            self._logger.exception(e)
+
+    def import_feeds(self, database: SqliteDatabase) -> None:
+        yaml_feeds = Storage(
+            self._config.get("feed_parser.storage_file", StorageBackend.DEFAULT_FEEDS_FILE)
+        )
+        yaml_seen_index = SeenIndex(storage=yaml_feeds)
+        sqlite_feeds = SqliteFeedsStorage(database=database)
+        sqlite_seen_index = SqliteSeenIndex(database=database)
+
+        for alias, params in yaml_feeds.get_all().items():
+            # The seen state goes to its own table
+            how_many = yaml_seen_index.load(alias)
+            sqlite_seen_index.import_items(alias, yaml_seen_index.get_items(alias))
+            sqlite_feeds.set(
+                alias,
+                {
+                    key: value
+                    for key,
+                    value in params.items()
+                    if key not in [SeenIndex.STORAGE_KEY, SeenIndex.LEGACY_STORAGE_KEY]
+                }
+            )
+            self._logger.info(
+                f"Imported feed {TerminalColor.YELLOW}{alias}{TerminalColor.END} " +
+                f"with {how_many} seen URLs"
+            )
+
+        # This commits the seen state too
+        sqlite_feeds.write_file()
+
+    def import_queue(self, database: SqliteDatabase) -> None:
+        yaml_queue = JournalQueue(
+            logger=self._logger,
+            storage_file=self._config.get(
+                "queue_storage.file", StorageBackend.DEFAULT_QUEUE_FILE
+            ),
+            queue_item_object=QueuePost
+        )
+        sqlite_queue = SqliteQueue(
+            database=database, logger=self._logger, queue_item_object=QueuePost
+        )
+
+        for item in yaml_queue.get_all():
+            sqlite_queue.append(item)
+        sqlite_queue.deduplicate()
+        sqlite_queue.sort()
+        sqlite_queue.save()
+
+        self._logger.info(f"Imported queue, now with {sqlite_queue.length()} items")
@@ -1,6 +1,7 @@
 from argparse import ArgumentParser, Namespace
-import pkg_resources
+from importlib.metadata import version, PackageNotFoundError
 from mastofeed.runners.runner_protocol import RunnerProtocol
+from mastofeed.lib.config_cache import ConfigCache
 from pyxavi.terminal_color import TerminalColor
 from pyxavi.config import Config
 from pyxavi.logger import Logger
@@ -8,22 +9,33 @@ import os
 from definitions import ROOT_DIR, CONFIG_DIR
 from pyxavi.debugger import full_stack
 from string import Template
-import glob
+import importlib
 import logging
 
-from mastofeed.runners.main import Main
-from mastofeed.runners.listener import Listener
-from mastofeed.runners.publish_queue import QueuePublisher
-from mastofeed.runners.publish_test import PublishTest
-from mastofeed.runners.janitor_test import JanitorTest
-
 PROGRAM_NAME = "MastoFeed"
 CLI_NAME = "mastofeed"
 PROGRAM_DESC = "CLI command to execute runners and tasks"
 PROGRAM_EPILOG = f"Use [{CLI_NAME} commands] to get a list of available commands."
-PROGRAM_VERSION = pkg_resources.get_distribution(PROGRAM_NAME).version
 VERBOSE_LOGLEVEL = 10
+UNKNOWN_VERSION = "unknown"
+CONFIG_CACHE_FILE = os.path.join(ROOT_DIR, "storage", "config.cache")
+# Same as Profiler.MODES, not imported to keep the start up light
+PROFILE_MODES = ["cprofile", "sampling"]
+DEFAULT_PROFILE_DIR = "log"
+
+
+def get_version() -> str:
+    try:
+        return version(PROGRAM_NAME)
+    except PackageNotFoundError:
+        # Running from the sources, without installing the package
+        return UNKNOWN_VERSION
 
+
+PROGRAM_VERSION = get_version()
+
+# The runners are given by their import path, and imported only when they run,
+#   as they pull the heavy libraries that a command like this list does not need.
 SUBCOMMAND_TOKEN = "#SUBCOMMAND#"
 HELP_TOKEN = "#HELP#"
 IMPLEMENTED_IN_BASH_TOKEN = "#BASH#"
@@ -37,16 +49,26 @@ COMMAND_MAP = {
     ),
     "mastodon": (SUBCOMMAND_TOKEN, "Performs tasks related to the Mastodon-like API"),
     "janitor": (SUBCOMMAND_TOKEN, "Performs tasks related to the Janitor API"),
+    "storage": (SUBCOMMAND_TOKEN, "Performs tasks related to the storage backend"),
     "validate_config": (IMPLEMENTED_IN_BASH_TOKEN, "Validates the current configs"),
 }
 
 SUBCOMMAND_MAP = {
     "feed": {
-        "run": (Main, "Runs the application"),
-        "listener": (Listener, "Runs the streaming listener in foreground"),
+        "run": ("mastofeed.runners.main.Main", "Runs the application"),
+        "daemon": (
+            "mastofeed.runners.daemon.FeedDaemon",
+            "Runs the application as a daemon, polling every feed when due"
+        ),
+        "listener": (
+            "mastofeed.runners.listener.Listener", "Runs the streaming listener in foreground"
+        ),
     },
     "streaming": {
-        "start": (Listener, "Starts the streaming listener serrvice in background."),
+        "start": (
+            "mastofeed.runners.listener.Listener",
+            "Starts the streaming listener serrvice in background."
+        ),
         "status": (
             IMPLEMENTED_IN_BASH_TOKEN,
             "Requests the status of the streaming listener. Will print the PID if running"
@@ -55,16 +77,25 @@ SUBCOMMAND_MAP = {
     },
     "mastodon": {
         "test": (
-            PublishTest,
+            "mastofeed.runners.publish_test.PublishTest",
             "Publishes a test message to the Mastodon-like API to ensure that all is set up ok."
         ),
         "publish_queue": (
-            QueuePublisher,
+            "mastofeed.runners.publish_queue.QueuePublisher",
             "Publishes the current queue to the Mastodon-like API, attending the config file."
         ),
     },
     "janitor": {
-        "test": (JanitorTest, "Tests the connection to the Janitor API")
+        "test": (
+            "mastofeed.runners.janitor_test.JanitorTest",
+            "Tests the connection to the Janitor API"
+        )
+    },
+    "storage": {
+        "import": (
+            "mastofeed.runners.storage_import.StorageImport",
+            "Imports the feeds, seen URLs and queue from the YAML files into SQLite"
+        )
     },
 }
 
@@ -113,6 +144,12 @@ def print_command_list(with_colors: bool = True):
     print(content)
 
 
+def load_runner(path: str) -> RunnerProtocol:
+    """Imports the runner class from its path, as module.Class"""
+    module_name, class_name = path.rsplit(".", 1)
+    return getattr(importlib.import_module(module_name), class_name)
+
+
 def _get_runner_by_command(args: Namespace) -> RunnerProtocol:
     command_candidate = args.command
 
@@ -136,7 +173,9 @@ def _get_runner_by_command(args: Namespace) -> RunnerProtocol:
                     else:
                         # It is a direct Runner.
                         # DO NOT return the instance, let it be in the main.
-                        return SUBCOMMAND_MAP[command_candidate][subcommand_candidate][0]
+                        return load_runner(
+                            SUBCOMMAND_MAP[command_candidate][subcommand_candidate][0]
+                        )
                 elif subcommand_candidate is None:
                     # A subcommand is expected
                     raise RuntimeError(
@@ -172,7 +211,7 @@ def _get_runner_by_command(args: Namespace) -> RunnerProtocol:
             else:
                 # It is a direct Runner.
                 # DO NOT return the instance, let it be in the main.
-                return COMMAND_MAP[command_candidate][0]
+                return load_runner(COMMAND_MAP[command_candidate][0])
     else:
         # Oops! It's not here, return an error
         raise RuntimeError(f"The requested command '{command_candidate}' does not exist")
@@ -200,6 +239,18 @@ def setup_parser() -> ArgumentParser:
 
     # Shortcut to make the -l = 10, so it shows DEBUG (included) and higher.
     parser.add_argument("-d", "--debug", action="store_true")
+
+    # Profile the runner, with cProfile by default, and write the result under log/
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const=PROFILE_MODES[0],
+        default=None,
+        choices=PROFILE_MODES,
+    )
+
+    # Along with --profile, tell apart the work done for every source
+    parser.add_argument("--profile-sources", action="store_true")
     return parser
 
 
@@ -207,17 +258,11 @@ def load_config_files() -> Config:
     """
     Loads all configs existing in CONFIG_DIR.
 
-    This is a merge-all-to-one approach, so may be the case that later objects
-        overwrite older ones
+    This is a merge-all-to-one approach: main.yaml goes first and the rest
+        overwrite it in alphabetical order. The merged result is cached and
+        only built again when any of the files change.
     """
-    config_files = glob.glob(os.path.join(CONFIG_DIR, "*.yaml"))
-
-    # Yes, technically we're loading main.yaml twice
-    config = Config(filename=os.path.join(CONFIG_DIR, "main.yaml"))
-    for file in config_files:
-        config.merge_from_file(filename=os.path.join(CONFIG_DIR, file))
-
-    return config
+    return ConfigCache(config_dir=CONFIG_DIR, cache_file=CONFIG_CACHE_FILE).load()
 
 
 def load_logger(config: Config, loglevel: int = None) -> logging:
@@ -232,6 +277,29 @@ def load_logger(config: Config, loglevel: int = None) -> logging:
     return Logger(config=config, base_path=ROOT_DIR).get_logger()
 
 
+def run_profiled(runner: RunnerProtocol, args: Namespace, config: Config, logger: logging):
+    """Runs the runner inside the profiler and writes the profiles, even if it fails"""
+    from mastofeed.lib.profiler import Profiler
+
+    profiler = Profiler(
+        mode=args.profile,
+        output_dir=os.path.join(
+            ROOT_DIR, config.get("profiler.directory", DEFAULT_PROFILE_DIR)
+        ),
+        name="-".join([x for x in [args.command, args.subcommand] if x is not None]),
+        per_source=args.profile_sources,
+        interval=config.get("profiler.interval", Profiler.DEFAULT_INTERVAL)
+    )
+    logger.info(f"{TerminalColor.MAGENTA}Profiling with {args.profile}{TerminalColor.END}")
+    profiler.start()
+    try:
+        runner.run()
+    finally:
+        profiler.stop()
+        for filename in profiler.write():
+            logger.info(f"Profile written into {filename}")
+
+
 def run():
     try:
         # Set up the parser
@@ -254,6 +322,9 @@ def run():
             if args.debug:
                 loglevel = VERBOSE_LOGLEVEL
 
+        if args.profile_sources and args.profile is None:
+            raise RuntimeError("The --profile-sources option goes along with --profile")
+
         # Instantiating the config and logger
         config = load_config_files()
         logger = load_logger(config=config, loglevel=loglevel)
@@ -267,7 +338,10 @@ def run():
         runner = _get_runner_by_command(args=args)(config=config, logger=logger)
 
         # Execute the runner
-        runner.run()
+        if args.profile is not None:
+            run_profiled(runner=runner, args=args, config=config, logger=logger)
+        else:
+            runner.run()
     except RuntimeError as e:
         print(TerminalColor.RED_BRIGHT + str(e) + TerminalColor.END)
     except Exception:
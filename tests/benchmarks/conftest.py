@@ -0,0 +1,60 @@
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from synthetic_feeds import make_feed_document
+from functools import partial
+from threading import Thread
+import pytest
+
+
+def pytest_collection_modifyitems(config, items):
+    """The benchmarks are opt in: they only run with --benchmark-only"""
+    if config.getoption("benchmark_only", False):
+        return
+
+    skip = pytest.mark.skip(reason="The benchmarks only run with --benchmark-only")
+    for item in items:
+        if "benchmark" in getattr(item, "fixturenames", []):
+            item.add_marker(skip)
+
+
+class QuietRequestHandler(SimpleHTTPRequestHandler):
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+@pytest.fixture
+def feeds_dir(tmp_path):
+    directory = tmp_path / "feeds"
+    directory.mkdir()
+    return directory
+
+
+@pytest.fixture
+def write_feed(feeds_dir):
+    """Writes a synthetic feed into the feeds directory, returning its path"""
+
+    def _write_feed(
+        name: str = "feed", entries: int = 50, html_weight: int = 1, kind: str = "rss"
+    ) -> str:
+        path = feeds_dir / f"{name}.xml"
+        path.write_text(
+            make_feed_document(entries, html_weight, kind, site=f"{name}.example.com")
+        )
+        return str(path)
+
+    return _write_feed
+
+
+@pytest.fixture
+def feed_server(feeds_dir):
+    """Local HTTP stand-in that serves the feeds directory. Gives its base URL"""
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0), partial(QuietRequestHandler, directory=str(feeds_dir))
+    )
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+
+    server.shutdown()
+    server.server_close()
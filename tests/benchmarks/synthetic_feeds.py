@@ -0,0 +1,60 @@
+from email.utils import formatdate
+from datetime import datetime, timezone
+from time import time
+
+# The markup of an entry body, repeated html_weight times
+HTML_BLOCK = "<p>Lorem <b>ipsum</b> dolor sit amet, <a href=\"https://example.com/x\">" +\
+    "consectetur</a> adipiscing elit &amp; more.</p>" +\
+    "<div class=\"figure\"><img src=\"https://example.com/image.jpg\" alt=\"An image\"/>" +\
+    "<span>Sed do eiusmod tempor incididunt ut labore et dolore magna aliqua.</span></div>"
+
+RSS_TEMPLATE = "<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n<rss version=\"2.0\">" +\
+    "<channel><title>Synthetic</title><link>https://example.com/</link>" +\
+    "<language>en</language><description>Synthetic feed</description>{items}" +\
+    "</channel></rss>"
+RSS_ITEM = "<item><title>Post {index} about the news</title>" +\
+    "<link>https://{site}/post/{index}</link>" +\
+    "<guid>https://{site}/post/{index}</guid><pubDate>{date}</pubDate>" +\
+    "<description><![CDATA[{html}]]></description></item>"
+
+ATOM_TEMPLATE = "<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n" +\
+    "<feed xmlns=\"http://www.w3.org/2005/Atom\" xml:lang=\"en\"><title>Synthetic</title>" +\
+    "<id>https://example.com/</id><updated>{date}</updated>{items}</feed>"
+ATOM_ENTRY = "<entry><title>Post {index} about the news</title>" +\
+    "<link href=\"https://{site}/post/{index}\"/>" +\
+    "<id>https://{site}/post/{index}</id><published>{date}</published>" +\
+    "<updated>{date}</updated>" +\
+    "<content type=\"html\"><![CDATA[{html}]]></content></entry>"
+
+
+def make_feed_document(
+    entries: int = 50,
+    html_weight: int = 1,
+    kind: str = "rss",
+    site: str = "example.com"
+) -> str:
+    """
+    A synthetic RSS or Atom feed, the newest entry first and a minute apart
+
+    Every entry body has html_weight blocks of text, links and images,
+    and links to a post in the site.
+    """
+    now = time()
+    html = HTML_BLOCK * html_weight
+    if kind == "atom":
+        items = [
+            ATOM_ENTRY.format(
+                index=index, date=_get_iso_date(now - index * 60), html=html, site=site
+            ) for index in range(entries)
+        ]
+        return ATOM_TEMPLATE.format(date=_get_iso_date(now), items="".join(items))
+
+    items = [
+        RSS_ITEM.format(index=index, date=formatdate(now - index * 60), html=html, site=site)
+        for index in range(entries)
+    ]
+    return RSS_TEMPLATE.format(items="".join(items))
+
+
+def _get_iso_date(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
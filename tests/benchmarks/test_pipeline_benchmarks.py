@@ -0,0 +1,172 @@
+from pyxavi.config import Config
+from mastofeed.parsers.feed_parser import FeedParser
+from mastofeed.lib.keywords_filter import KeywordsFilter
+from mastofeed.lib.accounts_publisher import AccountsPublisher
+from mastofeed.lib.storage_backend import StorageBackend
+from mastofeed.lib.queue_post import QueuePost
+from mastofeed.lib.publisher import Publisher
+from mastofeed.runners.main import Main
+from logging import getLogger
+from unittest.mock import patch
+from synthetic_feeds import make_feed_document
+import yaml
+import os
+import pytest
+
+# (kind, entries, html_weight)
+FEED_SIZES = [("rss", 50, 1), ("rss", 500, 1), ("rss", 50, 20), ("atom", 500, 1)]
+ROUNDS = 5
+KEYWORDS = [f"keyword{x}" for x in range(50)] + ["àccent", "news", "Lorem ipsum"]
+
+
+def get_config(tmp_path, feeds: dict, backend: str = "yaml") -> Config:
+    feeds_file = tmp_path / "feeds.yaml"
+    feeds_file.write_text(yaml.safe_dump(feeds))
+
+    return Config(
+        params={
+            "logger": {
+                "name": "benchmark_logger"
+            },
+            "feed_parser": {
+                "storage_file": str(feeds_file)
+            },
+            "storage": {
+                "backend": backend, "database_file": str(tmp_path / "mastofeed.db")
+            },
+            "queue_storage": {
+                "file": str(tmp_path / "queue.yaml")
+            },
+            "keywords_filter": {
+                "profiles": {
+                    "benchmark": {
+                        "keywords": KEYWORDS
+                    }
+                }
+            },
+            "publisher": {
+                "dry_run": False
+            },
+        }
+    )
+
+
+def get_feeds(urls: list) -> dict:
+    return {
+        f"feed{index}": {
+            "name": f"Feed {index}", "site_url": url, "feed_url": url
+        }
+        for index,
+        url in enumerate(urls)
+    }
+
+
+def patched_publisher_init(
+    self,
+    config: Config,
+    named_account: str = "default",
+    base_path: str = None,
+    only_oldest: bool = False,
+    queue=None
+):
+    self._mastodon = None
+
+
+@pytest.mark.parametrize(argnames=("served"), argvalues=["file", "http"])
+@pytest.mark.parametrize(argnames=("kind", "entries", "html_weight"), argvalues=FEED_SIZES)
+def test_get_raw_content_for_source(
+    benchmark, tmp_path, write_feed, feed_server, served, kind, entries, html_weight
+):
+    path = write_feed(entries=entries, html_weight=html_weight, kind=kind)
+    url = path if served == "file" else f"{feed_server}/{os.path.basename(path)}"
+    parser = FeedParser(config=get_config(tmp_path, get_feeds([url])))
+
+    # Nothing is committed as seen, so every round gets all the posts again
+    posts = benchmark(parser.get_raw_content_for_source, "feed0")
+
+    assert len(posts) == entries
+
+
+@pytest.mark.parametrize(argnames=("kind", "entries", "html_weight"), argvalues=FEED_SIZES)
+def test_format_post_for_source(benchmark, tmp_path, write_feed, kind, entries, html_weight):
+    path = write_feed(entries=entries, html_weight=html_weight, kind=kind)
+    parser = FeedParser(config=get_config(tmp_path, get_feeds([path])))
+    posts = parser.get_raw_content_for_source("feed0")
+
+    def format_all():
+        for post in posts:
+            parser.format_post_for_source("feed0", post)
+
+    benchmark(format_all)
+
+    assert all([post.text for post in posts])
+
+
+@pytest.mark.parametrize(argnames=("html_weight"), argvalues=[1, 20])
+def test_profile_allows_text(benchmark, tmp_path, html_weight):
+    keywords_filter = KeywordsFilter(config=get_config(tmp_path, {}))
+    texts = [
+        f"<h1>Post {index}</h1>" + make_feed_document(1, html_weight) for index in range(100)
+    ]
+
+    def filter_all():
+        return [keywords_filter.profile_allows_text("benchmark", text) for text in texts]
+
+    assert all(benchmark(filter_all))
+
+
+@pytest.mark.parametrize(argnames=("backend"), argvalues=["yaml", "sqlite"])
+@pytest.mark.parametrize(argnames=("entries"), argvalues=[100, 1000])
+def test_queue_deduplicate_sort_save(benchmark, tmp_path, write_feed, backend, entries):
+    config = get_config(tmp_path, get_feeds([write_feed(entries=entries)]))
+    posts = FeedParser(config=config).get_raw_content_for_source("feed0")
+    storage_backend = StorageBackend(config=get_config(tmp_path, {}, backend=backend))
+
+    def setup():
+        queue = storage_backend.get_queue(
+            logger=getLogger("benchmark_logger"), queue_item_object=QueuePost
+        )
+        queue.clean()
+        # Every post comes twice, as when two feeds share it
+        for post in posts + posts:
+            queue.append(post)
+        return (queue, ), {}
+
+    def deduplicate_sort_save(queue):
+        queue.deduplicate()
+        queue.sort()
+        queue.save()
+        return queue.length()
+
+    assert benchmark.pedantic(deduplicate_sort_save, setup=setup, rounds=ROUNDS) == entries
+
+
+@pytest.mark.parametrize(argnames=("feeds", "entries", "html_weight"), argvalues=[(5, 50, 1)])
+def test_main_run(benchmark, tmp_path, write_feed, feeds, entries, html_weight):
+    urls = [
+        write_feed(name=f"feed{x}", entries=entries, html_weight=html_weight)
+        for x in range(feeds)
+    ]
+    published = []
+
+    def fake_publish_all_from_queue(self) -> None:
+        # Publishes nothing, just empties the queue as a real run would do
+        while not self._queue.is_empty():
+            published.append(self._queue.pop())
+        self._queue.save()
+
+    def setup():
+        # A fresh state, so every round finds all the posts new
+        config = get_config(tmp_path, get_feeds(urls))
+        for file in [tmp_path / "queue.yaml", tmp_path / "queue.yaml.journal"]:
+            if os.path.exists(file):
+                os.remove(file)
+        published.clear()
+        return (Main(config=config, logger=getLogger("benchmark_logger")), ), {}
+
+    with patch.object(Publisher, "__init__", new=patched_publisher_init),\
+         patch.object(AccountsPublisher, "publish_all_from_queue",
+                      new=fake_publish_all_from_queue):
+        benchmark.pedantic(lambda main: main.run(), setup=setup, rounds=ROUNDS)
+
+    assert len(published) == feeds * entries
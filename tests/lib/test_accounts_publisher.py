@@ -0,0 +1,119 @@
+from pyxavi.config import Config
+from mastofeed.lib.accounts_publisher import AccountsPublisher, AccountQueue
+from mastofeed.lib.publisher import Publisher
+from mastofeed.lib.journal_queue import JournalQueue
+from mastofeed.lib.queue_post import QueuePost
+from unittest.mock import patch, Mock
+from threading import Barrier
+from datetime import datetime
+import pytest
+
+CONFIG = {
+    "logger": {
+        "name": "custom_logger", "stdout": {
+            "active": False
+        }, "file": {
+            "active": False
+        }
+    },
+    "mastodon": {
+        "named_accounts": {
+            "default": {}, "other": {}
+        }
+    }
+}
+
+
+def patched_publisher_init(
+    self,
+    config: Config,
+    named_account: str = "default",
+    base_path: str = None,
+    only_oldest: bool = False,
+    queue=None
+):
+    self._named_account = named_account
+    self._queue = queue
+    self._media_pipeline = Mock()
+
+
+@pytest.fixture
+def queue(tmp_path) -> JournalQueue:
+    queue = JournalQueue(storage_file=str(tmp_path / "queue.yaml"), queue_item_object=QueuePost)
+    for day, account in enumerate(["default", "other", None, "unknown", "other"], start=1):
+        queue.append(
+            QueuePost(id=str(day), published_at=datetime(2024, 1, day), named_account=account)
+        )
+    return queue
+
+
+@pytest.fixture
+def instance(queue) -> AccountsPublisher:
+    return AccountsPublisher(config=Config(params=CONFIG), queue=queue)
+
+
+def test_get_account_for(instance):
+    assert instance.get_account_for(QueuePost(id="1")) == "default"
+    assert instance.get_account_for(QueuePost(id="1", named_account="other")) == "other"
+    assert instance.get_account_for(QueuePost(id="1", named_account="unknown")) == "default"
+
+
+@patch.object(Publisher, "__init__", new=patched_publisher_init)
+def test_get_publisher_once_per_account(instance):
+    publisher = instance.get_publisher()
+
+    assert publisher is instance.get_publisher("default")
+    assert publisher._named_account == "default"
+    assert isinstance(publisher._queue, AccountQueue)
+    assert instance.get_publisher("other")._named_account == "other"
+
+
+@patch.object(Publisher, "__init__", new=patched_publisher_init)
+def test_publish_all_from_queue_in_parallel_per_account(instance, queue, tmp_path):
+    # Both accounts have to be publishing at the same time to pass it
+    barrier = Barrier(2, timeout=5)
+    received = {}
+
+    def publish_all_from_queue(self):
+        received[self._named_account] = [x.id for x in self._queue.get_all()]
+        barrier.wait()
+        # Every account publishes only its oldest one
+        self._queue.pop()
+
+    with patch.object(Publisher, "publish_all_from_queue", new=publish_all_from_queue):
+        instance.publish_all_from_queue()
+
+    assert received == {"default": ["1", "3", "4"], "other": ["2", "5"]}
+    assert [x.id for x in queue.get_all()] == ["3", "4", "5"]
+    reloaded = JournalQueue(
+        storage_file=str(tmp_path / "queue.yaml"), queue_item_object=QueuePost
+    )
+    assert [x.id for x in reloaded.get_all()] == ["3", "4", "5"]
+
+
+@patch.object(Publisher, "__init__", new=patched_publisher_init)
+def test_publish_all_from_queue_keeps_the_part_that_failed(instance, queue):
+
+    def publish_all_from_queue(self):
+        self._queue.pop()
+        if self._named_account == "other":
+            raise RuntimeError("Connection lost")
+
+    with patch.object(Publisher, "publish_all_from_queue", new=publish_all_from_queue):
+        instance.publish_all_from_queue()
+
+    assert [x.id for x in queue.get_all()] == ["2", "3", "4", "5"]
+
+
+@patch.object(Publisher, "__init__", new=patched_publisher_init)
+def test_publish_all_from_queue_shuts_the_media_down_per_account(instance):
+
+    def publish_all_from_queue(self):
+        if self._named_account == "other":
+            raise RuntimeError("Connection lost")
+
+    with patch.object(Publisher, "publish_all_from_queue", new=publish_all_from_queue):
+        instance.publish_all_from_queue()
+
+    for named_account in ["default", "other"]:
+        instance.get_publisher(named_account)._media_pipeline.shutdown.assert_called_once()
@@ -0,0 +1,53 @@
+from mastofeed.lib.atomic_storage import AtomicStorage
+from unittest.mock import patch
+import pytest
+import yaml
+import os
+
+
+def test_write_file_replaces_content(tmp_path):
+    filename = os.path.join(tmp_path, "feeds.yaml")
+    with open(filename, "w") as stream:
+        yaml.safe_dump({"old": {"name": "Old"}}, stream)
+
+    instance = AtomicStorage(filename)
+    instance.set("new", {"name": "New"})
+    instance.write_file()
+
+    with open(filename, "r") as stream:
+        assert yaml.safe_load(stream) == {"old": {"name": "Old"}, "new": {"name": "New"}}
+    assert os.listdir(tmp_path) == ["feeds.yaml"]
+
+
+def test_write_file_keeps_original_on_failure(tmp_path):
+    filename = os.path.join(tmp_path, "feeds.yaml")
+    with open(filename, "w") as stream:
+        yaml.safe_dump({"old": {"name": "Old"}}, stream)
+
+    instance = AtomicStorage(filename)
+    instance.set("new", {"name": "New"})
+    with patch.object(yaml, "safe_dump", side_effect=RuntimeError("Disk full")):
+        with pytest.raises(RuntimeError):
+            instance.write_file()
+
+    with open(filename, "r") as stream:
+        assert yaml.safe_load(stream) == {"old": {"name": "Old"}}
+    assert os.listdir(tmp_path) == ["feeds.yaml"]
+
+
+def test_has_changed(tmp_path):
+    filename = os.path.join(tmp_path, "feeds.yaml")
+    instance = AtomicStorage(filename)
+    instance.set("news", {"name": "News"})
+    instance.write_file()
+
+    # Our own writes do not count
+    assert instance.has_changed() is False
+
+    other = AtomicStorage(filename)
+    other.set("other", {"name": "Other"})
+    other.write_file()
+
+    assert instance.has_changed() is True
+    instance.read_file()
+    assert instance.has_changed() is False
@@ -0,0 +1,76 @@
+from pyxavi.config import Config
+from mastofeed.lib.config_cache import ConfigCache
+from unittest.mock import patch
+import pytest
+import os
+
+
+@pytest.fixture
+def config_dir(tmp_path):
+    directory = tmp_path / "config"
+    directory.mkdir()
+    main_content = "app:\n  name: main\n  user: bot\nlogger:\n  name: x\n"
+    (directory / "main.yaml").write_text(main_content)
+    (directory / "zz.yaml").write_text("app:\n  name: last\n")
+    (directory / "aa.yaml").write_text("app:\n  name: first\n  admin: me\n")
+    return directory
+
+
+def get_cache(config_dir) -> ConfigCache:
+    return ConfigCache(
+        config_dir=str(config_dir), cache_file=str(config_dir.parent / "config.cache")
+    )
+
+
+def test_load_merges_main_first_and_the_rest_in_order(config_dir):
+    config = get_cache(config_dir).load()
+
+    assert isinstance(config, Config)
+    assert config.get("app.name") == "last"
+    assert config.get("app.admin") == "me"
+    assert config.get("app.user") == "bot"
+
+
+def test_load_parses_the_files_only_once(config_dir):
+    get_cache(config_dir).load()
+
+    with patch.object(ConfigCache, "merge_files") as mocked_merge,\
+         patch.object(ConfigCache, "_get_file_hash") as mocked_hash:
+        config = get_cache(config_dir).load()
+
+    mocked_merge.assert_not_called()
+    mocked_hash.assert_not_called()
+    assert config.get("app.name") == "last"
+
+
+def test_load_takes_the_changes(config_dir):
+    get_cache(config_dir).load()
+    (config_dir / "zz.yaml").write_text("app:\n  name: changed\n")
+
+    assert get_cache(config_dir).load().get("app.name") == "changed"
+
+    os.remove(config_dir / "zz.yaml")
+    assert get_cache(config_dir).load().get("app.name") == "first"
+
+
+def test_load_only_hashes_the_touched_files(config_dir):
+    get_cache(config_dir).load()
+    status = os.stat(config_dir / "zz.yaml")
+    os.utime(config_dir / "zz.yaml", ns=(status.st_atime_ns, status.st_mtime_ns + 1000000))
+
+    with patch.object(ConfigCache, "merge_files") as mocked_merge:
+        config = get_cache(config_dir).load()
+
+    mocked_merge.assert_not_called()
+    assert config.get("app.name") == "last"
+
+
+def test_load_rebuilds_a_broken_cache(config_dir):
+    (config_dir.parent / "config.cache").write_bytes(b"not a pickle")
+
+    assert get_cache(config_dir).load().get("app.name") == "last"
+
+
+def test_load_without_main_file(tmp_path):
+    with pytest.raises(RuntimeError):
+        ConfigCache(config_dir=str(tmp_path), cache_file=str(tmp_path / "config.cache")).load()
@@ -0,0 +1,62 @@
+from mastofeed.lib.discovery_cache import DiscoveryCache
+import pytest
+
+
+@pytest.fixture
+def filename(tmp_path) -> str:
+    return str(tmp_path / "discovery_cache.yaml")
+
+
+def get_instance(filename: str) -> DiscoveryCache:
+    return DiscoveryCache(filename=filename, ttl=100, negative_ttl=10)
+
+
+@pytest.mark.parametrize(
+    argnames=('url', 'expected'),
+    argvalues=[
+        ("https://Xavier.Arnaus.net/blog/", "https://xavier.arnaus.net/blog"),
+        ("https://xavier.arnaus.net/blog#top", "https://xavier.arnaus.net/blog"),
+        (" https://xavier.arnaus.net/blog?page=2 ", "https://xavier.arnaus.net/blog?page=2"),
+    ],
+)
+def test_normalize(filename, url, expected):
+    assert get_instance(filename).normalize(url) == expected
+
+
+def test_get_unknown(filename):
+    assert get_instance(filename).get("findfeeds", "https://xavier.arnaus.net") is None
+
+
+def test_positive_results_live_for_ttl(filename):
+    instance = get_instance(filename)
+    feeds = ["https://xavier.arnaus.net/blog.rss"]
+
+    instance.set("findfeeds", "https://xavier.arnaus.net/blog", feeds, now=1000)
+
+    assert instance.get(
+        "findfeeds", "https://Xavier.arnaus.net/blog/", now=1050
+    ) == {
+        "value": feeds
+    }
+    assert instance.get("is_a_valid_feed", "https://xavier.arnaus.net/blog", now=1050) is None
+    assert instance.get("findfeeds", "https://xavier.arnaus.net/blog", now=1100) is None
+
+
+def test_negative_results_live_for_negative_ttl(filename):
+    instance = get_instance(filename)
+
+    instance.set("findfeeds", "https://xavier.arnaus.net", [], now=1000)
+
+    assert instance.get("findfeeds", "https://xavier.arnaus.net", now=1005) == {"value": []}
+    assert instance.get("findfeeds", "https://xavier.arnaus.net", now=1010) is None
+
+
+def test_survives_restarts_and_prunes_the_expired(filename):
+    instance = get_instance(filename)
+    instance.set("findfeeds", "https://old.net", [], now=1000)
+    instance.set("is_a_valid_feed", "https://xavier.arnaus.net/blog.rss", True, now=1020)
+
+    reloaded = get_instance(filename)
+    cached = reloaded.get("is_a_valid_feed", "https://xavier.arnaus.net/blog.rss", now=1030)
+    assert cached == {"value": True}
+    assert len(reloaded._storage.get_all()) == 1
@@ -0,0 +1,72 @@
+from mastofeed.lib.feed_stats import FeedStats
+import pytest
+
+MIN = 100
+MAX = 10000
+
+
+def test_never_polled_is_due():
+    assert FeedStats().is_due(MIN, MAX, now=0) is True
+
+
+def test_record_poll_with_new_entries():
+    instance = FeedStats(last_new_at=0, empty_polls=3)
+
+    instance.record_poll(2, now=1000)
+
+    assert instance.last_poll_at == 1000
+    assert instance.last_new_at == 1000
+    assert instance.mean_gap == 1000
+    assert instance.empty_polls == 0
+
+    instance.record_poll(1, now=3000)
+    assert instance.mean_gap == pytest.approx(0.3 * 2000 + 0.7 * 1000)
+
+
+def test_record_poll_without_new_entries():
+    instance = FeedStats(last_new_at=0, mean_gap=500)
+
+    instance.record_poll(0, now=1000)
+
+    assert instance.last_poll_at == 1000
+    assert instance.last_new_at == 0
+    assert instance.mean_gap == 500
+    assert instance.empty_polls == 1
+
+
+@pytest.mark.parametrize(
+    argnames=('mean_gap', 'empty_polls', 'expected_interval'),
+    argvalues=[
+        (None, 0, MIN),
+        (None, 3, MIN * 8),
+        (None, 20, MAX),
+        (500, 3, 250),
+        (50, 3, MIN),
+        (100000, 20, MAX),
+        (None, 100000, MAX),
+    ],
+)
+def test_get_interval(mean_gap, empty_polls, expected_interval):
+    instance = FeedStats(mean_gap=mean_gap, empty_polls=empty_polls)
+
+    assert instance.get_interval(MIN, MAX) == expected_interval
+
+
+def test_get_interval_of_a_dead_feed_with_float_intervals():
+    instance = FeedStats(empty_polls=100000)
+
+    assert instance.get_interval(float(MIN), float(MAX)) == MAX
+
+
+def test_is_due_allows_some_margin():
+    instance = FeedStats(last_poll_at=1000, empty_polls=0)
+
+    assert instance.is_due(MIN, MAX, now=1050) is False
+    assert instance.is_due(MIN, MAX, now=1095) is True
+
+
+def test_to_and_from_dict():
+    instance = FeedStats(last_poll_at=1, last_new_at=2, mean_gap=3.5, empty_polls=4)
+
+    assert FeedStats.from_dict(instance.to_dict()).to_dict() == instance.to_dict()
+    assert FeedStats.from_dict(None).to_dict() == FeedStats().to_dict()
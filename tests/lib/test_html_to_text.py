@@ -0,0 +1,50 @@
+from mastofeed.lib.html_to_text import HtmlToText, html_to_text
+from mastofeed.lib.queue_post import QueuePost
+from unittest.mock import patch
+import pytest
+
+
+@pytest.mark.parametrize(
+    argnames=('html', 'max_length', 'expected'),
+    argvalues=[
+        (None, None, ""),
+        ("", None, ""),
+        ("I am the  body  ", None, "I am the body"),
+        ("I am the\n\n\nbody", None, "I am the body"),
+        ("I am the <strong>body</strong>", None, "I am the body"),
+        ("<p>I am the <br />body</p>", None, "I am the body"),
+        ("<p>First</p><p>Second</p>", None, "First Second"),
+        ("<i>glu</i>ed", None, "glued"),
+        ("Rock &amp; roll &#8211; live", None, "Rock & roll – live"),
+        ("<p>Text</p><script>var a = 1;</script><style>p {}</style>", None, "Text"),
+        ("<p>I am the <b>body</b></p>", 6, "I am t"),
+        ("Short", 100, "Short"),
+    ],
+)
+def test_html_to_text(html, max_length, expected):
+    assert html_to_text(html, max_length=max_length) == expected
+
+
+def test_convert_stops_parsing_at_max_length():
+    instance = HtmlToText()
+    with patch.object(HtmlToText, "handle_data", wraps=instance.handle_data) as mocked:
+        instance.convert("<p>One</p>" + "<p>More</p>" * 10, max_length=3)
+
+    assert mocked.call_count == 1
+
+
+def test_converter_is_reusable():
+    instance = HtmlToText()
+
+    assert instance.convert("<p>One</p>") == "One"
+    assert instance.convert("<p>Two</p>") == "Two"
+
+
+def test_plain_combined_content_is_cached_in_the_post():
+    post = QueuePost(id="1", raw_combined_content="Title <p>Body</p>")
+
+    with patch("mastofeed.lib.queue_post.html_to_text", return_value="Title Body") as mocked:
+        assert post.plain_combined_content == "Title Body"
+        assert post.plain_combined_content == "Title Body"
+
+    mocked.assert_called_once()
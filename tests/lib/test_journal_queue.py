@@ -0,0 +1,175 @@
+from mastofeed.lib.journal_queue import JournalQueue
+from mastofeed.lib.queue_post import QueuePost
+from pyxavi.queue_stack import Queue
+from datetime import datetime
+import pytest
+import yaml
+import os
+
+
+def _post(id: int, day: int) -> QueuePost:
+    return QueuePost(id=str(id), text=f"Post {id}", published_at=datetime(2024, 1, day))
+
+
+@pytest.fixture
+def filename(tmp_path) -> str:
+    return os.path.join(tmp_path, "queue.yaml")
+
+
+def _instance(filename: str, compact_after: int = None) -> JournalQueue:
+    return JournalQueue(
+        storage_file=filename, queue_item_object=QueuePost, compact_after=compact_after
+    )
+
+
+def test_items_come_sorted_and_deduplicated(filename):
+    instance = _instance(filename)
+
+    instance.append(_post(3, 3))
+    instance.append(_post(1, 1))
+    instance.append(_post(2, 2))
+    instance.append(_post(1, 1))
+
+    assert instance.length() == 3
+    assert instance.first().id == "1"
+    assert instance.last().id == "3"
+    assert [x.id for x in instance.get_all()] == ["1", "2", "3"]
+    assert instance.pop().id == "1"
+    assert instance.pop().id == "2"
+    assert instance.length() == 1
+
+
+def test_unpop_puts_the_item_back_at_the_head(filename):
+    instance = _instance(filename)
+    instance.append(_post(1, 1))
+    instance.append(_post(2, 2))
+
+    item = instance.pop()
+    instance.unpop(item)
+
+    assert instance.first().id == "1"
+    assert instance.length() == 2
+
+
+def test_remove_from_the_middle(filename):
+    instance = _instance(filename)
+    for id in range(1, 4):
+        instance.append(_post(id, id))
+
+    instance.remove(_post(2, 2))
+    instance.remove(_post(9, 9))
+    instance.save()
+
+    assert [x.id for x in instance.get_all()] == ["1", "3"]
+    assert [x.id for x in _instance(filename).get_all()] == ["1", "3"]
+
+
+def test_save_appends_to_the_journal(filename):
+    instance = _instance(filename)
+    instance.append(_post(1, 1))
+    instance.append(_post(2, 2))
+    instance.save()
+    instance.pop()
+    instance.save()
+
+    with open(filename + JournalQueue.JOURNAL_SUFFIX, "r") as stream:
+        assert len(stream.readlines()) == 3
+
+    reloaded = _instance(filename)
+    assert [x.id for x in reloaded.get_all()] == ["2"]
+
+
+def test_save_compacts_over_the_threshold(filename):
+    instance = _instance(filename, compact_after=2)
+    instance.append(_post(1, 1))
+    instance.append(_post(2, 2))
+    instance.save()
+    instance.pop()
+    instance.save()
+
+    assert os.path.exists(filename + JournalQueue.JOURNAL_SUFFIX) is False
+    with open(filename, "r") as stream:
+        assert len(yaml.safe_load(stream)["queue"]) == 1
+
+    # The snapshot stays readable by the pyxavi Queue
+    legacy = Queue(storage_file=filename, queue_item_object=QueuePost)
+    assert [x.id for x in legacy.get_all()] == ["2"]
+
+
+def test_load_ignores_an_already_compacted_journal(filename):
+    instance = _instance(filename)
+    instance.append(_post(1, 1))
+    instance.append(_post(2, 2))
+    instance.save()
+    with open(filename + JournalQueue.JOURNAL_SUFFIX, "r") as stream:
+        journal = stream.read()
+
+    # A crash between writing the snapshot and removing the journal
+    instance.pop()
+    instance.compact()
+    with open(filename + JournalQueue.JOURNAL_SUFFIX, "w") as stream:
+        stream.write(journal)
+
+    assert [x.id for x in _instance(filename).get_all()] == ["2"]
+
+
+def test_load_reads_a_legacy_queue_file(filename):
+    with open(filename, "w") as stream:
+        yaml.safe_dump({"queue": [_post(2, 2).to_dict(), _post(1, 1).to_dict()]}, stream)
+
+    instance = _instance(filename)
+
+    assert [x.id for x in instance.get_all()] == ["1", "2"]
+
+
+def test_clean(filename):
+    instance = _instance(filename)
+    instance.append(_post(1, 1))
+    instance.save()
+
+    instance.clean()
+    instance.save()
+
+    assert instance.is_empty() is True
+    assert _instance(filename).is_empty() is True
+
+
+def test_two_instances_on_the_same_files_keep_all_the_changes(filename):
+    # Like the feed run and the queue publisher running at the same time
+    runner = _instance(filename, compact_after=3)
+    runner.append(_post(1, 1))
+    runner.append(_post(2, 2))
+    runner.save()
+    publisher = _instance(filename, compact_after=3)
+
+    runner.append(_post(3, 3))
+    runner.append(_post(4, 4))
+    # This one compacts, so the journal of the other generation is gone
+    runner.save()
+    assert os.path.exists(filename + JournalQueue.JOURNAL_SUFFIX) is False
+
+    # The publisher did not see the new posts but its pop is not lost
+    assert publisher.pop().id == "1"
+    publisher.save()
+    assert [x.id for x in publisher.get_all()] == ["2", "3", "4"]
+
+    # And the runner gets the pop before compacting again
+    runner.append(_post(5, 5))
+    runner.compact()
+    assert [x.id for x in runner.get_all()] == ["2", "3", "4", "5"]
+    assert [x.id for x in _instance(filename).get_all()] == ["2", "3", "4", "5"]
+
+
+def test_load_warns_about_the_discarded_journal_lines(filename, caplog):
+    instance = _instance(filename)
+    instance.append(_post(1, 1))
+    instance.save()
+    with open(filename + JournalQueue.JOURNAL_SUFFIX, "r") as stream:
+        journal = stream.read()
+    instance.compact()
+    with open(filename + JournalQueue.JOURNAL_SUFFIX, "w") as stream:
+        stream.write(journal)
+
+    _instance(filename)
+
+    assert "Discarded 1 journal lines" in caplog.text
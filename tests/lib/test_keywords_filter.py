@@ -0,0 +1,81 @@
+from pyxavi.config import Config
+from mastofeed.lib.keywords_filter import KeywordsFilter
+from unittest.mock import patch
+import pytest
+
+CONFIG = {
+    "logger": {
+        "name": "custom_logger"
+    },
+    "keywords_filter": {
+        "profiles": {
+            "talamanca": {
+                "keywords": ["talamanca", "mura", "sant llorenc del munt", "st llorenc"]
+            },
+            "empty": {
+                "keywords": []
+            }
+        }
+    }
+}
+
+
+@pytest.fixture
+def instance() -> KeywordsFilter:
+    return KeywordsFilter(Config(params=CONFIG))
+
+
+@pytest.mark.parametrize(
+    argnames=('profile', 'text', 'expected'),
+    argvalues=[
+        ("talamanca", "Festa major a Talamanca", True),
+        ("talamanca", "<p>Excursió per <b>Sant Llorenc del Munt</b></p>", True),
+        ("talamanca", "Obres a la carretera de Mura", True),
+        ("talamanca", "Res a veure amb el Bages", False),
+        ("talamanca", "", False),
+        ("empty", "Festa major a Talamanca", False),
+        ("nonexisting", "Res a veure amb el Bages", True),
+    ],
+)
+def test_profile_allows_text(instance, profile, text, expected):
+    assert instance.profile_allows_text(profile, text) is expected
+
+
+def test_profile_is_compiled_once(instance):
+    with patch.object(Config, "get", wraps=instance._config.get) as mocked_get:
+        instance.profile_allows_text("talamanca", "Talamanca")
+        instance.profile_allows_text("talamanca", "Mura")
+        instance.profile_allows_text("talamanca", "Bages")
+
+    keywords_calls = [
+        call for call in mocked_get.call_args_list
+        if call.args[0] == "keywords_filter.profiles.talamanca.keywords"
+    ]
+    assert len(keywords_calls) == 1
+
+
+def test_keywords_are_matched_literally(instance):
+    instance._config.merge_from_dict(
+        parameters={"keywords_filter": {
+            "profiles": {
+                "regex": {
+                    "keywords": ["bv.1221"]
+                }
+            }
+        }}
+    )
+
+    assert instance.profile_allows_text("regex", "bv.1221") is True
+    assert instance.profile_allows_text("regex", "bvx1221") is False
+
+
+def test_text_is_normalized_once_per_cache_key(instance):
+    with patch.object(instance._normalizer, "normalize",
+                      wraps=instance._normalizer.normalize) as mocked_normalize:
+        instance.profile_allows_text("talamanca", "Talamanca", cache_key="post-1")
+        instance.profile_allows_text("empty", "Talamanca", cache_key="post-1")
+        instance.profile_allows_text("talamanca", "Talamanca", cache_key="post-1")
+
+    # Once for the text and once for every keyword of the compiled profile
+    texts = [call for call in mocked_normalize.call_args_list if call.args[0] == "Talamanca"]
+    assert len(texts) == 1
@@ -0,0 +1,107 @@
+from mastofeed.lib.media_cache import MediaCache
+import pytest
+import os
+
+URL = "https://domain.com/image.png"
+
+
+@pytest.fixture
+def instance(tmp_path) -> MediaCache:
+    return MediaCache(
+        media_storage=str(tmp_path),
+        filename=str(tmp_path / "media_cache.yaml"),
+        max_size=10,
+        max_age=100,
+        reuse_media_id_for=50
+    )
+
+
+def download(tmp_path, name: str, content: bytes) -> str:
+    file = tmp_path / name
+    file.write_bytes(content)
+    return str(file)
+
+
+def test_get_unknown_url(instance):
+    assert instance.get(URL) is None
+
+
+def test_add_renames_after_the_content(instance, tmp_path):
+    file = download(tmp_path, "download.png", b"image")
+
+    cached = instance.add(URL, file, "image/png", now=1)
+
+    assert not os.path.exists(file)
+    assert os.path.basename(cached["file"]) == cached["content_hash"][:16] + ".png"
+    assert instance.get(URL, now=2) == cached
+
+
+def test_same_content_is_stored_once(instance, tmp_path):
+    first = instance.add(URL, download(tmp_path, "1.png", b"image"), "image/png", now=1)
+    second = instance.add(
+        "https://other.com/copy.png", download(tmp_path, "2.png", b"image"), "image/png", now=2
+    )
+
+    assert first["file"] == second["file"]
+    assert not os.path.exists(tmp_path / "2.png")
+    assert instance.get_total_size() == 5
+
+
+def test_media_id_is_reused_only_while_unattached_and_young(instance, tmp_path):
+    instance.add(URL, download(tmp_path, "1.png", b"image"), "image/png", now=1)
+    instance.set_media_id(URL, "123", now=10)
+
+    assert instance.get(URL, now=20)["media_id"] == "123"
+    assert instance.get(URL, now=70)["media_id"] is None
+
+    instance.set_media_id(URL, "456", now=100)
+    instance.mark_attached(["456"])
+    assert instance.get(URL, now=101)["media_id"] is None
+
+
+def test_media_id_is_kept_per_account(instance, tmp_path):
+    instance.add(URL, download(tmp_path, "1.png", b"image"), "image/png", now=1)
+    instance.set_media_id(URL, "123", now=10)
+    instance.set_media_id(URL, "456", account="other", now=10)
+
+    assert instance.get(URL, now=20)["media_id"] == "123"
+    assert instance.get(URL, account="other", now=20)["media_id"] == "456"
+
+    instance.mark_attached(["456"], account="other")
+    assert instance.get(URL, account="other", now=20)["media_id"] is None
+    assert instance.get(URL, now=20)["media_id"] == "123"
+
+
+def test_get_instance_is_shared_per_file(tmp_path):
+    filename = str(tmp_path / "shared.yaml")
+
+    assert MediaCache.get_instance(str(tmp_path), filename=filename) is\
+        MediaCache.get_instance(str(tmp_path), filename=filename)
+
+
+def test_evict_expired_and_least_recently_used(instance, tmp_path):
+    old = instance.add("https://domain.com/old.png", download(tmp_path, "1", b"old"), now=1)
+    lru = instance.add("https://domain.com/lru.png", download(tmp_path, "2", b"lru12"), now=150)
+    new = instance.add("https://domain.com/new.png", download(tmp_path, "3", b"new12"), now=160)
+    instance.add("https://domain.com/big.png", download(tmp_path, "4", b"big"), now=155)
+
+    # old expired, and lru goes away to fit 10 bytes
+    assert instance.evict(now=170) == 2
+
+    assert not os.path.exists(old["file"]) and not os.path.exists(lru["file"])
+    assert instance.get("https://domain.com/lru.png") is None
+    assert instance.get("https://domain.com/new.png", now=171) == new
+    assert instance.get_total_size() == 8
+
+
+def test_save_and_load(instance, tmp_path):
+    cached = instance.add(URL, download(tmp_path, "1.png", b"image"), "image/png", now=1)
+    instance.set_media_id(URL, "123", now=10)
+    instance.save()
+
+    loaded = MediaCache(
+        media_storage=str(tmp_path),
+        filename=str(tmp_path / "media_cache.yaml"),
+        reuse_media_id_for=50
+    )
+    assert loaded.get(URL, now=20) == dict(cached, media_id="123")
@@ -0,0 +1,103 @@
+from mastofeed.lib.media_pipeline import MediaPipeline
+from unittest.mock import patch, MagicMock
+from mastofeed.lib.media_cache import MediaCache
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Barrier
+import requests
+import pytest
+import os
+
+URL = "https://domain.com/img/image.png?size=big"
+
+
+def mocked_response(content: bytes = b"image", ok: bool = True) -> MagicMock:
+    response = MagicMock()
+    response.ok = ok
+    response.status_code = 200 if ok else 404
+    response.iter_content.return_value = [content]
+    response.__enter__.return_value = response
+    return response
+
+
+def test_fetch_takes_the_prefetched_download(tmp_path):
+    instance = MediaPipeline(media_storage=str(tmp_path))
+
+    with patch.object(requests, "get", return_value=mocked_response()) as mocked_get:
+        assert instance.prefetch([{"url": URL}]) == 1
+        fetched = instance.fetch(URL)
+
+    mocked_get.assert_called_once()
+    assert fetched["mime_type"] == "image/png"
+    assert fetched["file"].endswith(".png")
+    with open(fetched["file"], "rb") as stream:
+        assert stream.read() == b"image"
+    assert os.listdir(tmp_path) == [os.path.basename(fetched["file"])]
+
+
+def test_concurrent_fetches_of_the_same_url_get_their_own_file(tmp_path):
+    # Like the publishers of two accounts, each one with its pipeline
+    instances = [MediaPipeline(media_storage=str(tmp_path)) for _ in range(2)]
+    both_started = Barrier(2, timeout=5)
+
+    def get(url, **kwargs):
+        # Both downloads are writing at the same time
+        both_started.wait()
+        return mocked_response()
+
+    with patch.object(requests, "get", new=get):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            fetched = list(executor.map(lambda x: x.fetch(URL), instances))
+
+    assert fetched[0]["file"] != fetched[1]["file"]
+    cache = MediaCache(media_storage=str(tmp_path), filename=str(tmp_path / "cache.yaml"))
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        cached = list(
+            executor.map(lambda x: cache.add(URL, x["file"], x["mime_type"]), fetched)
+        )
+
+    assert cached[0]["file"] == cached[1]["file"]
+    assert sorted(os.listdir(tmp_path)
+                  ) == sorted(["cache.yaml", os.path.basename(cached[0]["file"])])
+
+
+def test_fetch_raises_on_failed_download(tmp_path):
+    instance = MediaPipeline(media_storage=str(tmp_path))
+
+    with patch.object(requests, "get", return_value=mocked_response(ok=False)):
+        with pytest.raises(RuntimeError):
+            instance.fetch(URL)
+
+    assert os.listdir(tmp_path) == []
+
+
+def test_prefetch_downloads_in_parallel(tmp_path):
+    instance = MediaPipeline(media_storage=str(tmp_path), max_workers=3)
+    all_started = Event()
+    started = []
+
+    def get(url, **kwargs):
+        started.append(url)
+        if len(started) == 3:
+            all_started.set()
+        # Only finishes if the three run at the same time
+        assert all_started.wait(timeout=5)
+        return mocked_response()
+
+    media = [{"url": f"https://domain.com/{index}.jpg"} for index in range(0, 3)]
+    with patch.object(requests, "get", new=get):
+        assert instance.prefetch(media + [{"path": "local.jpg"}]) == 3
+        # Already in progress
+        assert instance.prefetch(media) == 0
+        files = [instance.fetch(x["url"])["file"] for x in media]
+
+    assert sorted(os.listdir(tmp_path)) == sorted([os.path.basename(x) for x in files])
+
+
+def test_shutdown_removes_the_files_nobody_took(tmp_path):
+    instance = MediaPipeline(media_storage=str(tmp_path))
+
+    with patch.object(requests, "get", return_value=mocked_response()):
+        instance.prefetch([{"url": URL}])
+        instance.shutdown()
+
+    assert os.listdir(tmp_path) == []
@@ -3,11 +3,16 @@ from pyxavi.storage import Storage
 from pyxavi.queue_stack import Queue
 from pyxavi.url import Url
 from mastofeed.lib.publisher import Publisher
-from mastofeed.lib.mentions_listener import MentionParser, Mention, MentionAction
+from mastofeed.lib.atomic_storage import AtomicStorage
+from mastofeed.lib.mentions_listener import MentionParser, Mention, MentionAction,\
+    MentionContext, MentionsListener
 from pyxavi.mastodon_helper import StatusPostVisibility, StatusPost
 from logging import Logger as BuiltInLogger
 from unittest.mock import patch, Mock
+from threading import Event
+import logging
 import copy
+import yaml
 import pytest
 
 CONFIG = {
@@ -21,6 +26,11 @@ CONFIG = {
         "user": "@feeder@social.arnaus.net",
         "admin": "xavi@social.arnaus.net",
         "restrict_writes": True
+    },
+    "mentions_listener": {
+        "discovery_cache": {
+            "active": False
+        }
     }
 }
 
@@ -76,6 +86,216 @@ def test_instantiation():
     assert isinstance(instance._publisher, Publisher)
 
 
+@patch.object(Storage, "read_file", new=patch_storage_read_file)
+def test_context_is_set_up_once_for_all_mentions():
+    config = Config(params=CONFIG)
+    mocked_publisher_init = Mock(return_value=None)
+    with patch.object(Publisher, "__init__", new=mocked_publisher_init):
+        listener = MentionsListener()
+        listener.load_config(config=config)
+
+        notification = Mock(type=MentionsListener.NOTIFICATION_TYPE_MENTION)
+        with patch.object(MentionParser, "load_mention"),\
+             patch.object(MentionParser, "parse"),\
+             patch.object(MentionParser, "execute"),\
+             patch.object(MentionParser, "answer_back"):
+            listener.on_notification(notification)
+            listener.on_notification(notification)
+            listener.shutdown()
+
+    mocked_publisher_init.assert_called_once()
+
+
+@patch.object(Storage, "read_file", new=patch_storage_read_file)
+@patch.object(Publisher, "__init__", new=patched_publisher_init)
+def test_notifications_are_processed_off_the_streaming_thread():
+    listener = MentionsListener()
+    listener.load_config(config=Config(params=CONFIG))
+    release = Event()
+    processed = []
+
+    def slow_parse(self):
+        assert release.wait(timeout=5)
+        processed.append(self)
+
+    with patch.object(MentionParser, "load_mention"),\
+         patch.object(MentionParser, "parse", new=slow_parse),\
+         patch.object(MentionParser, "execute"),\
+         patch.object(MentionParser, "answer_back"):
+        assert listener.on_notification(Mock(type="favourite")) is False
+        # It returns while the parse is still waiting
+        assert listener.on_notification(Mock(type="mention")) is True
+        assert processed == []
+
+        release.set()
+        listener.shutdown()
+
+    assert len(processed) == 1
+
+
+@patch.object(Storage, "read_file", new=patch_storage_read_file)
+@patch.object(Publisher, "__init__", new=patched_publisher_init)
+def test_mentions_are_processed_once_and_the_last_id_is_kept(tmp_path):
+    config = Config(params=CONFIG)
+    config.merge_from_dict(
+        parameters={"mentions_listener": {
+            "state_file": str(tmp_path / "listener_state.yaml")
+        }}
+    )
+    listener = MentionsListener()
+    listener.load_config(config=config)
+
+    with patch.object(MentionsListener, "_process_mention") as mocked_process:
+        assert listener.on_notification(Mock(type="mention", id=11)) is True
+        listener.shutdown()
+        # Already processed, as it comes from the stream and from the catch up
+        assert listener.on_notification(Mock(type="mention", id=11)) is False
+        assert listener.on_notification(Mock(type="mention", id=9)) is False
+
+    mocked_process.assert_called_once()
+    assert listener.last_notification_id == 11
+    assert yaml.safe_load(open(tmp_path / "listener_state.yaml")) == {
+        "last_notification_id": 11
+    }
+
+
+@patch.object(Storage, "read_file", new=patch_storage_read_file)
+@patch.object(Publisher, "__init__", new=patched_publisher_init)
+def test_the_last_id_waits_for_the_older_mentions_in_process():
+    listener = MentionsListener()
+    listener.load_config(config=Config(params=CONFIG))
+
+    assert listener._start_processing(1) is True
+    assert listener._start_processing(2) is True
+    listener._finish_processing(2)
+    assert listener.last_notification_id is None
+
+    listener._finish_processing(1)
+    assert listener.last_notification_id == 2
+    listener.shutdown()
+
+
+@patch.object(Storage, "read_file", new=patch_storage_read_file)
+@patch.object(Publisher, "__init__", new=patched_publisher_init)
+def test_catch_up_queues_the_missed_mentions_once_connected():
+    listener = MentionsListener()
+    listener.load_config(config=Config(params=CONFIG))
+    listener.last_notification_id = 10
+    mastodon = Mock()
+    mastodon.notifications.return_value = [
+        Mock(type="mention", id=13), Mock(type="mention", id=12)
+    ]
+
+    processed = []
+
+    def run_now(method, *args):
+        method(*args)
+
+    with patch.object(MentionsListener, "_process_mention",
+                      new=lambda self, x: processed.append(x.id)),\
+         patch.object(listener._executor, "submit", new=run_now):
+        listener.request_catch_up(mastodon)
+        mastodon.notifications.assert_not_called()
+
+        # The first heartbeat tells that the stream is connected
+        listener.handle_heartbeat()
+        listener.handle_heartbeat()
+        listener.shutdown()
+
+    mastodon.notifications.assert_called_once_with(min_id=10, types=["mention"], limit=40)
+    assert processed == [12, 13]
+    assert listener.last_notification_id == 13
+
+
+@patch.object(Storage, "read_file", new=patch_storage_read_file)
+@patch.object(Publisher, "__init__", new=patched_publisher_init)
+def test_catch_up_needs_a_processed_mention():
+    listener = MentionsListener()
+    listener.load_config(config=Config(params=CONFIG))
+    mastodon = Mock()
+
+    assert listener.catch_up(mastodon) == 0
+    mastodon.notifications.assert_not_called()
+    listener.shutdown()
+
+
+@patch.object(Storage, "read_file", new=patch_storage_read_file)
+@patch.object(Publisher, "__init__", new=patched_publisher_init)
+def test_context_discover_gives_up_after_the_timeout():
+    config = Config(params=CONFIG)
+    config.merge_from_dict(parameters={"mentions_listener": {"discovery_timeout": 0.1}})
+    context = MentionContext(config=config)
+    release = Event()
+
+    def slow_findfeeds(url):
+        release.wait(timeout=5)
+        return [url]
+
+    assert context.discover(lambda url: [url], "https://a.com") == ["https://a.com"]
+    assert context.discover(slow_findfeeds, "https://a.com", default=[]) == []
+    release.set()
+
+
+@patch.object(Storage, "read_file", new=patch_storage_read_file)
+@patch.object(Publisher, "__init__", new=patched_publisher_init)
+def test_context_discover_logs_the_errors_of_the_method(caplog):
+    context = MentionContext(config=Config(params=CONFIG))
+
+    def failing_findfeeds(url):
+        raise ConnectionError("Connection refused")
+
+    with caplog.at_level(logging.WARNING):
+        assert context.discover(failing_findfeeds, "https://a.com", default=[]) == []
+
+    assert len(caplog.records) == 1
+    assert caplog.records[0].getMessage() == "Could not discover https://a.com"
+    assert caplog.records[0].exc_info[0] is ConnectionError
+    assert "seconds" not in caplog.text
+
+
+@patch.object(Storage, "read_file", new=patch_storage_read_file)
+@patch.object(Publisher, "__init__", new=patched_publisher_init)
+def test_context_discover_uses_the_cache(tmp_path):
+    config = Config(params=CONFIG)
+    config.merge_from_dict(
+        parameters={
+            "mentions_listener": {
+                "discovery_cache": {
+                    "active": True, "file": str(tmp_path / "discovery_cache.yaml")
+                }
+            }
+        }
+    )
+    context = MentionContext(config=config)
+    mocked_findfeeds = Mock(return_value=["https://a.com/feed"])
+    mocked_findfeeds.__name__ = "findfeeds"
+
+    assert context.discover(mocked_findfeeds, "https://a.com") == ["https://a.com/feed"]
+    assert context.discover(mocked_findfeeds, "https://a.com/") == ["https://a.com/feed"]
+    mocked_findfeeds.assert_called_once()
+
+
+@patch.object(Storage, "read_file", new=patch_storage_read_file)
+@patch.object(Publisher, "__init__", new=patched_publisher_init)
+def test_context_reloads_the_feeds_storage_only_when_changed():
+    context = MentionContext(config=Config(params=CONFIG))
+    first = MentionParser(config=Config(params=CONFIG), context=context)
+
+    mocked_read_file = Mock()
+    with patch.object(AtomicStorage, "read_file", new=mocked_read_file):
+        with patch.object(AtomicStorage, "has_changed", return_value=False):
+            second = MentionParser(config=Config(params=CONFIG), context=context)
+        mocked_read_file.assert_not_called()
+
+        with patch.object(AtomicStorage, "has_changed", return_value=True):
+            MentionParser(config=Config(params=CONFIG), context=context)
+        mocked_read_file.assert_called_once()
+
+    assert first._publisher is second._publisher
+    assert first._feeds_storage is second._feeds_storage
+    assert first._logger is second._logger
+
+
 def test_format_answer():
 
     instance = get_mention_parser()
@@ -929,7 +1149,7 @@ def test_execute(
     mocked_storage_write_file = Mock()
     mocked_listener_user_can_write = Mock()
     mocked_listener_user_can_write.return_value = user_can_write
-    with patch.object(Storage, "write_file", new=mocked_storage_write_file):
+    with patch.object(AtomicStorage, "write_file", new=mocked_storage_write_file):
         with patch.object(instance, "user_can_write", new=mocked_listener_user_can_write):
             parsed_result = instance.execute()
 
@@ -961,6 +1181,43 @@ def test_execute(
             assert saved_stuff["name"] == old_entry["name"]
 
 
+def test_execute_update_keeps_the_named_account():
+    instance = get_mention_parser()
+    instance.mention = Mention.from_dict(
+        {
+            "status_id": 1234,
+            "content": "@feeder update xavi https://xavier.arnaus.net/blog",
+            "username": "xavi@social.arnaus.net",
+            "visibility": StatusPostVisibility.PUBLIC
+        }
+    )
+    instance.action = MentionAction.UPDATE
+    instance.complements = {
+        "alias": "xavi",
+        "site_url": "https://xavier.arnaus.net/blog",
+        "feed_url": "https://xavier.arnaus.net/blog.rss",
+        "name": "Xavi's blog"
+    }
+    instance.error = None
+    instance._feeds_storage.set(
+        param_name="xavi",
+        value={
+            "site_url": "https://old.url",
+            "feed_url": "https://old.url/blog.rss",
+            "name": "Old Blog",
+            "named_account": "other"
+        }
+    )
+
+    with patch.object(AtomicStorage, "write_file", new=Mock()):
+        with patch.object(instance, "user_can_write", new=Mock(return_value=True)):
+            instance.execute()
+
+    saved_stuff = instance._feeds_storage.get(param_name="xavi")
+    assert saved_stuff["feed_url"] == "https://xavier.arnaus.net/blog.rss"
+    assert saved_stuff["named_account"] == "other"
+
+
 def test_answer_back():
 
     # Set up the mentioning environment
@@ -0,0 +1,63 @@
+from pyxavi.config import Config
+from mastofeed.lib.overlay_config import OverlayConfig
+from unittest.mock import Mock
+import pytest
+
+BASE = {
+    "logger": {
+        "name": "custom_logger"
+    },
+    "mastodon": {
+        "named_accounts": {
+            "default": {
+                "instance_type": "mastodon"
+            }
+        }
+    }
+}
+
+
+@pytest.fixture
+def base() -> Config:
+    return Config(params=BASE)
+
+
+def test_instantiation(base):
+    instance = OverlayConfig(base=base, overlay={})
+
+    assert isinstance(instance, Config)
+
+
+def test_get_reads_the_overlay_first(base):
+    connection = Mock()
+    instance = OverlayConfig(base=base, overlay={"mastodon": connection, "default": {"a": 1}})
+
+    # The objects are kept as given
+    assert instance.get("mastodon") is connection
+    assert instance.get("default.a") == 1
+    assert instance.get("logger.name") == "custom_logger"
+    assert instance.get("logger.unknown", "value") == "value"
+    assert instance.key_exists("default.a") is True
+    assert instance.key_exists("logger.name") is True
+    assert instance.key_exists("mastodon.named_accounts") is False
+
+
+def test_the_base_is_not_copied(base):
+    instance = OverlayConfig(base=base, overlay={"default": {}})
+    base.merge_from_dict(parameters={"logger": {"name": "changed"}})
+
+    assert instance.get("logger.name") == "changed"
+
+
+def test_get_all(base):
+    connection = Mock()
+    instance = OverlayConfig(base=base, overlay={"mastodon": connection})
+
+    assert instance.get_all() == {"logger": {"name": "custom_logger"}, "mastodon": connection}
+
+
+def test_it_is_read_only(base):
+    instance = OverlayConfig(base=base, overlay={})
+
+    with pytest.raises(RuntimeError):
+        instance.set("logger.name", "changed")
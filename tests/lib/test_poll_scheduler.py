@@ -0,0 +1,69 @@
+from mastofeed.lib.poll_scheduler import PollScheduler
+
+
+def test_new_sources_are_due_right_away():
+    instance = PollScheduler(default_interval=100, jitter=0)
+
+    instance.sync(["news", "other"], now=1000)
+
+    assert instance.get_due(now=1000) == ["news", "other"]
+    assert instance.seconds_until_next(now=1000) == 0
+
+
+def test_sync_forgets_removed_sources():
+    instance = PollScheduler(default_interval=100, jitter=0)
+    instance.sync(["news", "other"], now=1000)
+
+    instance.sync(["news"], now=1000)
+
+    assert instance.get_due(now=1000) == ["news"]
+
+
+def test_no_sources_no_wait():
+    assert PollScheduler().seconds_until_next() is None
+
+
+def test_success_schedules_by_interval():
+    instance = PollScheduler(default_interval=100, intervals={"busy": 10}, jitter=0)
+    instance.sync(["news", "busy"], now=1000)
+
+    instance.mark_success("news", now=1000)
+    instance.mark_success("busy", now=1000)
+
+    assert instance.get_due(now=1050) == ["busy"]
+    assert instance.seconds_until_next(now=1000) == 10
+    assert instance.get_due(now=1100) == ["busy", "news"]
+
+
+def test_jitter_spreads_the_polls():
+    instance = PollScheduler(default_interval=100, jitter=0.1)
+    instance.sync(["news"], now=1000)
+
+    instance.mark_success("news", now=1000)
+
+    assert 90 <= instance.seconds_until_next(now=1000) <= 110
+
+
+def test_failures_back_off_up_to_the_limit():
+    instance = PollScheduler(default_interval=100, jitter=0, max_backoff=500)
+    instance.sync(["news"], now=0)
+
+    instance.mark_failure("news", now=0)
+    assert instance.seconds_until_next(now=0) == 200
+    instance.mark_failure("news", now=0)
+    assert instance.seconds_until_next(now=0) == 400
+    instance.mark_failure("news", now=0)
+    assert instance.seconds_until_next(now=0) == 500
+
+    instance.mark_success("news", now=0)
+    assert instance.seconds_until_next(now=0) == 100
+
+
+def test_failures_of_a_dead_source():
+    instance = PollScheduler(default_interval=100.0, jitter=0, max_backoff=500)
+    instance.sync(["news"], now=0)
+    instance._failures["news"] = 100000
+
+    instance.mark_failure("news", now=0)
+
+    assert instance.seconds_until_next(now=0) == 500
@@ -0,0 +1,94 @@
+from mastofeed.lib.profiler import Profiler
+from concurrent.futures import ThreadPoolExecutor
+import pstats
+import pytest
+
+
+def busy(amount: int) -> int:
+    return sum([x * x for x in range(amount)])
+
+
+def fetch(source: str) -> int:
+    with Profiler.section(f"source:{source}"):
+        return busy(10000)
+
+
+def run_profiled(profiler: Profiler) -> None:
+    profiler.start()
+    try:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            list(executor.map(fetch, ["feed1", "feed2"]))
+        with Profiler.section("source:feed1"):
+            busy(10000)
+    finally:
+        profiler.stop()
+
+
+def get_functions(filename: str) -> list:
+    return [function for (file, line, function) in pstats.Stats(filename).stats.keys()]
+
+
+def test_unknown_mode():
+    with pytest.raises(RuntimeError):
+        Profiler(mode="magic")
+
+
+def test_section_does_nothing_without_a_profiler():
+    with Profiler.section("source:feed1"):
+        assert busy(10) == 285
+
+
+def test_cprofile_includes_the_threads(tmp_path):
+    profiler = Profiler(mode=Profiler.CPROFILE, output_dir=str(tmp_path), name="feed-run")
+    run_profiled(profiler)
+
+    files = profiler.write()
+
+    assert len(files) == 1
+    assert files[0].endswith(".pstats")
+    assert "fetch" in get_functions(files[0])
+    assert "busy" in get_functions(files[0])
+
+
+def test_cprofile_per_source(tmp_path):
+    profiler = Profiler(
+        mode=Profiler.CPROFILE, output_dir=str(tmp_path), name="feed-run", per_source=True
+    )
+    run_profiled(profiler)
+
+    files = profiler.write()
+
+    assert len(files) == 3
+    assert files[1].endswith("-source-feed1.pstats")
+    assert files[2].endswith("-source-feed2.pstats")
+    for filename in files:
+        assert "busy" in get_functions(filename)
+
+
+def test_sampling_writes_collapsed_stacks(tmp_path):
+    profiler = Profiler(
+        mode=Profiler.SAMPLING,
+        output_dir=str(tmp_path),
+        name="feed-run",
+        per_source=True,
+        interval=3600
+    )
+    # The sampler waits for an hour, so only these samples are taken
+    profiler.start()
+    with Profiler.section("source:feed1"):
+        profiler.take_sample()
+    profiler.take_sample()
+    profiler.stop()
+
+    files = profiler.write()
+
+    assert len(files) == 1
+    assert files[0].endswith(".folded")
+    # Other threads may be alive, like the ones of other tests
+    lines = [x for x in open(files[0]).read().splitlines() if x.startswith("MainThread;")]
+    assert len(lines) == 2
+    for line in lines:
+        stack, count = line.rsplit(" ", 1)
+        assert int(count) == 1
+        assert "test_sampling_writes_collapsed_stacks" in stack
+    assert len([x for x in lines if x.startswith("MainThread;source:feed1;")]) == 1
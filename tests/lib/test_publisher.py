@@ -0,0 +1,242 @@
+from pyxavi.config import Config
+from pyxavi.mastodon_publisher import MastodonPublisher
+from mastofeed.lib.publisher import Publisher
+from mastofeed.lib.media_pipeline import MediaPipeline
+from mastofeed.lib.media_cache import MediaCache
+from mastofeed.lib.rate_limiter import RateLimiter, RateLimitReached
+from mastofeed.lib.journal_queue import JournalQueue
+from mastofeed.lib.queue_post import QueuePost, QueuePostMedia
+from mastodon import MastodonRatelimitError
+from unittest.mock import patch, Mock
+from threading import Barrier
+from datetime import datetime
+import logging
+import pytest
+
+
+def patched_mastodon_publisher_init(
+    self, config: Config, logger, named_account: str = None, base_path: str = None
+):
+    self._config = config
+    self._logger = logger
+    self._is_dry_run = False
+    self._media_storage = config.get("publisher.media_storage")
+
+
+@pytest.fixture
+def instance(tmp_path) -> Publisher:
+    config = Config(
+        params={
+            "logger": {
+                "name": "custom_logger", "stdout": {
+                    "active": False
+                }, "file": {
+                    "active": False
+                }
+            },
+            "publisher": {
+                "media_storage": str(tmp_path),
+                "max_media_per_status": 3,
+                "rate_limit": {
+                    "active": True, "file": str(tmp_path / "rate_limit.yaml")
+                }
+            },
+            "media_cache": {
+                "file": str(tmp_path / "media_cache.yaml")
+            }
+        }
+    )
+    with patch.object(MastodonPublisher, "__init__", new=patched_mastodon_publisher_init),\
+         patch("mastofeed.lib.publisher.Logger") as mocked_logger:
+        mocked_logger.return_value.get_logger.return_value = logging.getLogger("custom_logger")
+        return Publisher(config=config, queue=JournalQueue(queue_item_object=QueuePost))
+
+
+def test_publish_media_uploads_concurrently_in_order(instance):
+    media = [{"url": f"https://domain.com/{index}.jpg"} for index in range(0, 4)]
+    # Only 3 are allowed, and they only finish if they run at the same time
+    barrier = Barrier(3, timeout=5)
+
+    def media_post(media_file, download_file, description, mime_type):
+        barrier.wait()
+        return {"id": media_file}
+
+    with patch.object(MediaPipeline, "prefetch") as mocked_prefetch,\
+         patch.object(MediaPipeline, "fetch",
+                      side_effect=lambda url: {"file": url, "mime_type": None}),\
+         patch.object(MediaCache, "add",
+                      side_effect=lambda url, file, mime_type, account: {
+                          "file": file, "mime_type": mime_type, "media_id": None
+                      }),\
+         patch.object(Publisher, "_do_media_publish", side_effect=media_post):
+        result = instance.publish_media(media=media)
+
+    mocked_prefetch.assert_called_once_with(media[:3])
+    assert result == [x["url"] for x in media[:3]]
+
+
+def test_publish_media_skips_failed_ones(instance):
+    media = [{"url": "https://domain.com/1.jpg"}, {"path": "local.jpg", "mime_type": "a/b"}]
+
+    with patch.object(MediaPipeline, "fetch", side_effect=RuntimeError("Not found")),\
+         patch.object(Publisher, "_do_media_publish",
+                      return_value={"id": 2}) as mocked_media_publish:
+        result = instance.publish_media(media=media)
+
+    mocked_media_publish.assert_called_once_with(
+        media_file="local.jpg", download_file=False, description=None, mime_type="a/b"
+    )
+    assert result == [2]
+
+
+def test_prefetch_media_of_next_posts(instance):
+    for index in range(0, 7):
+        instance._queue.append(
+            QueuePost(
+                id=str(index),
+                published_at=datetime(2024, 1, index + 1),
+                media=[QueuePostMedia(url=f"https://domain.com/{index}.jpg")]
+            )
+        )
+
+    mocked_prefetch = Mock(return_value=5)
+    with patch.object(MediaPipeline, "prefetch", new=mocked_prefetch):
+        instance.prefetch_media()
+
+    urls = [x["url"] for x in mocked_prefetch.call_args.args[0]]
+    assert urls == [f"https://domain.com/{index}.jpg" for index in range(0, 5)]
+
+
+def test_publish_all_from_queue_removes_the_prefetched_media_not_taken(instance, tmp_path):
+    instance._only_oldest = True
+    for index in range(0, 3):
+        instance._queue.append(
+            QueuePost(
+                id=str(index),
+                published_at=datetime(2024, 1, index + 1),
+                media=[QueuePostMedia(url=f"https://domain.com/{index}.jpg")]
+            )
+        )
+    response = Mock(ok=True)
+    response.iter_content.return_value = [b"image"]
+    response.__enter__ = Mock(return_value=response)
+    response.__exit__ = Mock(return_value=None)
+
+    with patch("mastofeed.lib.media_pipeline.requests.get", return_value=response),\
+         patch.object(Publisher, "_execute_action", return_value={"id": 1}):
+        instance.publish_all_from_queue()
+
+    # Only the oldest was published, and its media was never taken either
+    assert instance._queue.length() == 2
+    assert [x.suffix for x in tmp_path.iterdir() if x.suffix == ".jpg"] == []
+
+
+def test_publish_media_reuses_cached_media(instance, tmp_path):
+    downloaded = tmp_path / "downloaded.jpg"
+    downloaded.write_bytes(b"image")
+    media = [{"url": "https://domain.com/1.jpg"}]
+
+    with patch.object(MediaPipeline, "prefetch"),\
+         patch.object(MediaPipeline, "fetch",
+                      return_value={"file": str(downloaded), "mime_type": "image/jpeg"}
+                      ) as mocked_fetch,\
+         patch.object(Publisher, "_do_media_publish",
+                      return_value={"id": 1}) as mocked_media_publish:
+        # The status failed, so the uploaded media is reused
+        assert instance.publish_media(media=media) == [1]
+        assert instance.publish_media(media=media) == [1]
+        mocked_media_publish.assert_called_once()
+
+        # Once attached, it is uploaded again but not downloaded
+        instance._media_cache.mark_attached([1])
+        assert instance.publish_media(media=media) == [1]
+        assert mocked_media_publish.call_count == 2
+
+    mocked_fetch.assert_called_once()
+
+
+def test_publish_media_does_not_download_cached_media(instance, tmp_path):
+    media = [{"url": "https://domain.com/1.jpg"}]
+    response = Mock(ok=True)
+    response.iter_content.return_value = [b"image"]
+    response.__enter__ = Mock(return_value=response)
+    response.__exit__ = Mock(return_value=None)
+
+    with patch("mastofeed.lib.media_pipeline.requests.get",
+               return_value=response) as mocked_get,\
+         patch.object(Publisher, "_do_media_publish", return_value={"id": 1}):
+        assert instance.publish_media(media=media) == [1]
+        files = sorted(tmp_path.iterdir())
+
+        # Uploaded again once attached, but from the cached file
+        instance._media_cache.mark_attached([1])
+        assert instance.publish_media(media=media) == [1]
+
+    mocked_get.assert_called_once()
+    assert sorted(tmp_path.iterdir()) == files
+
+
+def queue_posts(instance: Publisher, amount: int) -> None:
+    for index in range(0, amount):
+        instance._queue.append(
+            QueuePost(id=str(index), published_at=datetime(2024, 1, index + 1))
+        )
+
+
+def test_publish_all_from_queue_stops_at_the_rate_limit(instance):
+    queue_posts(instance, 3)
+
+    with patch.object(RateLimiter, "acquire", side_effect=[True, False]),\
+         patch.object(Publisher, "_execute_action",
+                      return_value={"id": 1}) as mocked_execute:
+        instance.publish_all_from_queue()
+
+    mocked_execute.assert_called_once()
+    assert instance._queue.length() == 2
+
+
+def test_publish_all_from_queue_is_not_paced_by_default(instance):
+    instance._is_rate_limit_active = False
+    queue_posts(instance, 3)
+
+    with patch.object(RateLimiter, "acquire") as mocked_acquire,\
+         patch.object(Publisher, "_execute_action", return_value={"id": 1}):
+        instance.publish_all_from_queue()
+
+    mocked_acquire.assert_not_called()
+    assert instance._queue.is_empty()
+
+
+def test_publish_all_from_queue_keeps_the_post_when_rate_limited(instance):
+    queue_posts(instance, 2)
+
+    with patch.object(Publisher, "_execute_action", side_effect=RateLimitReached(1234)):
+        instance.publish_all_from_queue()
+
+    assert instance._queue.length() == 2
+    assert instance._queue.first().id == "0"
+
+
+def test_call_rate_limited_waits_for_the_reset(instance):
+    instance._mastodon = Mock(ratelimit_reset=1234, ratelimit_remaining=10)
+    method = Mock(side_effect=[MastodonRatelimitError(), {"id": 1}])
+
+    with patch.object(RateLimiter, "block_until") as mocked_block,\
+         patch.object(RateLimiter, "wait_until_reset") as mocked_wait:
+        assert instance._call_rate_limited(method, "a", b="c") == {"id": 1}
+
+    mocked_block.assert_called_once_with(1234)
+    mocked_wait.assert_called_once()
+    assert method.call_count == 2
+
+
+def test_call_rate_limited_gives_up(instance):
+    instance._mastodon = Mock(ratelimit_reset=1234)
+    method = Mock(side_effect=MastodonRatelimitError())
+
+    with patch.object(RateLimiter, "block_until"),\
+         patch.object(RateLimiter, "wait_until_reset"):
+        with pytest.raises(RateLimitReached):
+            instance._call_rate_limited(method)
+
+    assert method.call_count == Publisher.MAX_RATE_LIMIT_RETRIES + 1
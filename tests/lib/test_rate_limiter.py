@@ -0,0 +1,100 @@
+from mastofeed.lib.rate_limiter import RateLimiter, RateLimitReached
+from mastofeed.lib.atomic_storage import AtomicStorage
+from pyxavi.storage import Storage
+import pytest
+
+
+class FakeClock:
+
+    def __init__(self, now: float = 1000) -> None:
+        self.now = now
+        self.slept = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def get_instance(clock: FakeClock, storage: Storage = None) -> RateLimiter:
+    # 1 token every 10 seconds, up to 3
+    return RateLimiter(
+        capacity=3,
+        period=30,
+        max_wait=60,
+        storage=storage,
+        key="default",
+        clock=clock,
+        sleeper=clock.sleep
+    )
+
+
+def test_acquire_spreads_the_calls():
+    clock = FakeClock()
+    instance = get_instance(clock)
+
+    for _ in range(0, 3):
+        assert instance.acquire() is True
+    assert clock.slept == []
+
+    assert instance.acquire() is True
+    assert clock.slept == [pytest.approx(10)]
+
+
+def test_acquire_refuses_too_long_waits():
+    clock = FakeClock()
+    instance = get_instance(clock)
+    instance.block_until(clock.now + 120)
+
+    assert instance.acquire() is False
+    assert clock.slept == []
+
+
+def test_sync_blocks_until_the_reset():
+    clock = FakeClock()
+    instance = get_instance(clock)
+
+    instance.sync(remaining=5, reset_at=clock.now + 50)
+    assert instance.seconds_until_available() == 0
+
+    instance.sync(remaining=0, reset_at=clock.now + 50)
+    assert instance.seconds_until_available(0) == 50
+
+    instance.wait_until_reset()
+    assert clock.slept == [50]
+    assert instance.seconds_until_available(0) == 0
+
+
+def test_wait_until_reset_raises_when_too_far():
+    clock = FakeClock()
+    instance = get_instance(clock)
+    instance.block_until(clock.now + 3600)
+
+    with pytest.raises(RateLimitReached) as error:
+        instance.wait_until_reset()
+
+    assert error.value.reset_at == clock.now + 3600
+
+
+def test_block_until_without_reset_waits_a_token():
+    clock = FakeClock()
+    instance = get_instance(clock)
+
+    instance.block_until(None)
+
+    assert instance.seconds_until_available(0) == 10
+
+
+def test_state_survives_between_runs(tmp_path):
+    clock = FakeClock()
+    filename = str(tmp_path / "rate_limit.yaml")
+    instance = get_instance(clock, storage=AtomicStorage(filename=filename))
+    for _ in range(0, 3):
+        instance.acquire()
+    instance.save()
+
+    clock.now += 5
+    loaded = get_instance(clock, storage=AtomicStorage(filename=filename))
+    assert loaded.seconds_until_available() == pytest.approx(5)
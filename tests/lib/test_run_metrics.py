@@ -0,0 +1,118 @@
+from mastofeed.lib.run_metrics import RunMetrics
+import pytest
+import json
+import stat
+import os
+
+
+class FakeClock:
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def test_measure_adds_up_the_stage_for_the_run_and_the_source(clock):
+    metrics = RunMetrics(runner="main", clock=clock)
+
+    for _ in range(3):
+        with metrics.measure(RunMetrics.FILTER, source="feed1"):
+            clock.now += 0.5
+    with metrics.measure(RunMetrics.FILTER, source="feed2"):
+        clock.now += 1
+    with metrics.measure(RunMetrics.PUBLISH):
+        clock.now += 2
+
+    report = metrics.to_dict()
+    assert report["stages"] == {"filter": 2.5, "publish": 2}
+    assert report["sources"]["feed1"]["stages"] == {"filter": 1.5}
+    assert report["sources"]["feed2"]["stages"] == {"filter": 1}
+    assert "publish" not in report["sources"]["feed1"]["stages"]
+
+
+def test_measure_adds_the_time_even_when_the_block_fails(clock):
+    metrics = RunMetrics(clock=clock)
+
+    with pytest.raises(RuntimeError):
+        with metrics.measure(RunMetrics.FETCH, source="feed1"):
+            clock.now += 3
+            raise RuntimeError("Timeout")
+
+    assert metrics.to_dict()["sources"]["feed1"]["stages"] == {"fetch": 3}
+
+
+def test_count(clock):
+    metrics = RunMetrics(clock=clock)
+
+    metrics.count("seen", source="feed1")
+    metrics.count("seen", 2, source="feed2")
+    metrics.count("queued", 0, source="feed1")
+
+    report = metrics.to_dict()
+    assert report["counters"] == {"seen": 3}
+    assert report["sources"]["feed1"]["counters"] == {"seen": 1}
+    assert report["sources"]["feed2"]["counters"] == {"seen": 2}
+
+
+def test_duration_stops_at_finish(clock):
+    metrics = RunMetrics(clock=clock)
+    clock.now += 4
+    metrics.finish()
+    clock.now += 10
+
+    assert metrics.get_duration() == 4
+
+
+def test_to_prometheus(clock):
+    metrics = RunMetrics(runner="main", clock=clock)
+    with metrics.measure(RunMetrics.FETCH, source="feed\"1"):
+        clock.now += 1.5
+    metrics.count("queued", 2, source="feed\"1")
+    metrics.finish()
+
+    lines = metrics.to_prometheus().splitlines()
+
+    assert "# TYPE mastofeed_run_duration_seconds gauge" in lines
+    assert "mastofeed_run_duration_seconds{runner=\"main\"} 1.5" in lines
+    assert "mastofeed_run_stage_seconds{runner=\"main\",stage=\"fetch\"} 1.5" in lines
+    assert "mastofeed_run_posts{runner=\"main\",counter=\"queued\"} 2" in lines
+    assert "mastofeed_source_stage_seconds{runner=\"main\",source=\"feed\\\"1\"," +\
+        "stage=\"fetch\"} 1.5" in lines
+    assert "mastofeed_source_posts{runner=\"main\",source=\"feed\\\"1\"," +\
+        "counter=\"queued\"} 2" in lines
+
+
+def test_write(tmp_path, clock):
+    metrics = RunMetrics(runner="daemon", clock=clock)
+    metrics.count("queued", 5, source="feed1")
+    json_file = tmp_path / "log" / "run_metrics.json"
+    prometheus_file = tmp_path / "textfile" / "mastofeed.prom"
+
+    metrics.write(json_file=str(json_file), prometheus_file=str(prometheus_file))
+
+    report = json.loads(json_file.read_text())
+    assert report["runner"] == "daemon"
+    assert report["sources"]["feed1"]["counters"] == {"queued": 5}
+    assert "mastofeed_run_posts{runner=\"daemon\",counter=\"queued\"} 5" in\
+        prometheus_file.read_text()
+    # No temporary files are left behind
+    assert os.listdir(json_file.parent) == ["run_metrics.json"]
+    # Readable by the collectors running as another user
+    assert stat.S_IMODE(os.stat(prometheus_file).st_mode) == RunMetrics.FILE_MODE
+
+
+def test_write_keeps_the_permissions_of_the_replaced_file(tmp_path, clock):
+    prometheus_file = tmp_path / "mastofeed.prom"
+    prometheus_file.write_text("")
+    os.chmod(prometheus_file, 0o640)
+
+    RunMetrics(clock=clock).write(prometheus_file=str(prometheus_file))
+
+    assert stat.S_IMODE(os.stat(prometheus_file).st_mode) == 0o640
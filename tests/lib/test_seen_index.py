@@ -0,0 +1,114 @@
+from pyxavi.storage import Storage
+from mastofeed.lib.seen_index import SeenIndex
+from unittest.mock import patch
+import copy
+import pytest
+
+# This keeps the state of the storage
+STORAGE = {
+    "news": {
+        "name": "News",
+        "site_url": "https://www.example.cat/",
+        "feed_url": "https://www.example.cat/rss/my_feed",
+    }
+}
+
+
+@pytest.fixture(autouse=True)
+def setup_function():
+
+    global STORAGE
+
+    backup_storage = copy.deepcopy(STORAGE)
+
+    yield
+
+    STORAGE = backup_storage
+
+
+def patch_storage_read_file(self):
+    self._content = STORAGE
+
+
+@patch.object(Storage, "read_file", new=patch_storage_read_file)
+def get_instance(max_items: int = None, max_age_days: int = None) -> SeenIndex:
+    return SeenIndex(
+        storage=Storage("feeds.yaml"), max_items=max_items, max_age_days=max_age_days
+    )
+
+
+def test_hash_id_is_stable():
+    id = "//domain.com/blog_entry_1.html"
+
+    assert SeenIndex.hash_id(id) == SeenIndex.hash_id(id)
+    assert SeenIndex.hash_id(id) != SeenIndex.hash_id("//domain.com/blog_entry_2.html")
+    assert len(SeenIndex.hash_id(id)) == SeenIndex.HASH_LENGTH
+
+
+def test_load_empty():
+    instance = get_instance()
+
+    assert instance.load("news") == 0
+    assert instance.contains("news", "//domain.com/blog_entry_1.html") is False
+    assert instance.is_dirty("news") is False
+
+
+def test_load_migrates_legacy_list():
+    STORAGE["news"]["urls_seen"] = [
+        "//domain.com/blog_entry_1.html", "//domain.com/blog_entry_2.html"
+    ]
+
+    instance = get_instance()
+
+    assert instance.load("news") == 2
+    assert instance.contains("news", "//domain.com/blog_entry_1.html") is True
+    assert instance.contains("news", "//domain.com/blog_entry_2.html") is True
+    assert instance.is_dirty("news") is True
+
+    instance.save("news")
+
+    assert "urls_seen" not in instance._storage.get("news")
+    assert len(instance._storage.get("news.seen")) == 2
+    assert instance.is_dirty("news") is False
+
+
+def test_add_and_contains():
+    instance = get_instance()
+    instance.load("news")
+
+    instance.add("news", ["//domain.com/blog_entry_1.html"])
+
+    assert instance.contains("news", "//domain.com/blog_entry_1.html") is True
+    assert instance.contains("news", "//domain.com/blog_entry_2.html") is False
+    assert instance.contains("other", "//domain.com/blog_entry_1.html") is False
+    assert instance.is_dirty("news") is True
+
+
+def test_add_prunes_by_max_items_keeping_newest():
+    STORAGE["news"]["urls_seen"] = ["1", "2", "3"]
+
+    instance = get_instance(max_items=3)
+    instance.load("news")
+
+    instance.add("news", ["4", "5"])
+
+    assert instance.length("news") == 3
+    assert instance.contains("news", "1") is False
+    assert instance.contains("news", "2") is False
+    assert instance.contains("news", "3") is True
+    assert instance.contains("news", "4") is True
+    assert instance.contains("news", "5") is True
+
+
+def test_add_prunes_by_max_age():
+    STORAGE["news"]["seen"] = {SeenIndex.hash_id("old"): 1000}
+
+    instance = get_instance(max_age_days=30)
+    instance.load("news")
+
+    assert instance.contains("news", "old") is True
+
+    instance.add("news", ["new"])
+
+    assert instance.contains("news", "old") is False
+    assert instance.contains("news", "new") is True
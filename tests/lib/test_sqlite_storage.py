@@ -0,0 +1,146 @@
+from mastofeed.lib.sqlite_storage import SqliteDatabase, SqliteFeedsStorage,\
+    SqliteSeenIndex, SqliteQueue
+from mastofeed.lib.storage_protocol import FeedsStorageProtocol, SeenIndexProtocol
+from mastofeed.lib.queue_post import QueuePost
+from pyxavi.queue_stack import Queue
+from datetime import datetime
+import pytest
+import os
+
+
+@pytest.fixture
+def database(tmp_path) -> SqliteDatabase:
+    return SqliteDatabase.get_instance(os.path.join(tmp_path, "mastofeed.db"))
+
+
+def test_database_is_shared_per_file(tmp_path, database):
+    assert SqliteDatabase.get_instance(os.path.join(tmp_path, "mastofeed.db")) is database
+
+
+def test_feeds_storage_write_and_read(database):
+    instance = SqliteFeedsStorage(database=database)
+
+    assert isinstance(instance, FeedsStorageProtocol)
+    assert instance.get_all() == {}
+
+    instance.set_slugged("xavi", {"site_url": "https://xavier.arnaus.net/blog", "name": "X"})
+    instance.set("xavi.etag", "abc")
+    instance.write_file()
+
+    reloaded = SqliteFeedsStorage(database=database)
+    assert reloaded.key_exists("xavi") is True
+    assert reloaded.get("xavi.site_url") == "https://xavier.arnaus.net/blog"
+    assert reloaded.get("xavi.etag") == "abc"
+    assert reloaded.get("xavi.modified", "default") == "default"
+
+
+def test_feeds_storage_not_written_until_write_file(database):
+    instance = SqliteFeedsStorage(database=database)
+    instance.set("xavi", {"name": "X"})
+
+    assert SqliteFeedsStorage(database=database).key_exists("xavi") is False
+
+
+def test_feeds_storage_delete(database):
+    instance = SqliteFeedsStorage(database=database)
+    instance.set("xavi", {"name": "X"})
+    instance.set("other", {"name": "O"})
+    instance.write_file()
+
+    instance.delete("xavi")
+    instance.write_file()
+
+    reloaded = SqliteFeedsStorage(database=database)
+    assert reloaded.key_exists("xavi") is False
+    assert reloaded.key_exists("other") is True
+
+
+def test_seen_index_add_and_contains(database):
+    feeds = SqliteFeedsStorage(database=database)
+    instance = SqliteSeenIndex(database=database)
+
+    assert isinstance(instance, SeenIndexProtocol)
+    assert instance.load("news") == 0
+
+    instance.add("news", ["//domain.com/1.html", "//domain.com/2.html"])
+    feeds.write_file()
+
+    assert instance.is_dirty("news") is True
+    assert instance.contains("news", "//domain.com/1.html") is True
+    assert instance.contains("news", "//domain.com/3.html") is False
+    assert instance.contains("other", "//domain.com/1.html") is False
+    assert SqliteSeenIndex(database=database).load("news") == 2
+
+
+def test_seen_index_prunes_by_max_items(database):
+    instance = SqliteSeenIndex(database=database, max_items=2)
+    instance.import_items("news", {"aaa": 1, "bbb": 2})
+
+    instance.add("news", ["new"])
+
+    assert instance.length("news") == 2
+    assert instance.contains("news", "new") is True
+
+
+def test_seen_index_prunes_by_max_age(database):
+    instance = SqliteSeenIndex(database=database, max_age_days=30)
+    instance.import_items("news", {"aaa": 1000})
+
+    instance.add("news", ["new"])
+
+    assert instance.length("news") == 1
+
+
+def test_queue_save_and_load(database):
+    instance = SqliteQueue(database=database, queue_item_object=QueuePost)
+
+    assert isinstance(instance, Queue)
+    assert instance.is_empty() is True
+
+    instance.append(QueuePost(id="2", text="Second", published_at=datetime(2024, 1, 2)))
+    instance.append(QueuePost(id="1", text="First", published_at=datetime(2024, 1, 1)))
+    instance.append(QueuePost(id="1", text="First", published_at=datetime(2024, 1, 1)))
+    instance.deduplicate()
+    instance.sort()
+    instance.save()
+
+    reloaded = SqliteQueue(database=database, queue_item_object=QueuePost)
+    assert reloaded.length() == 2
+    assert reloaded.first().id == "1"
+
+    popped = reloaded.pop()
+    reloaded.save()
+
+    assert popped.text == "First"
+    reloaded = SqliteQueue(database=database, queue_item_object=QueuePost)
+    assert [x.id for x in reloaded.get_all()] == ["2"]
+
+
+def test_queue_remove(database):
+    instance = SqliteQueue(database=database, queue_item_object=QueuePost)
+    for day in range(1, 4):
+        instance.append(QueuePost(id=str(day), published_at=datetime(2024, 1, day)))
+    instance.save()
+
+    instance.remove(QueuePost(id="2", published_at=datetime(2024, 1, 2)))
+    instance.save()
+
+    reloaded = SqliteQueue(database=database, queue_item_object=QueuePost)
+    assert [x.id for x in reloaded.get_all()] == ["1", "3"]
+
+
+def test_feeds_storage_has_changed(tmp_path, database):
+    instance = SqliteFeedsStorage(database=database)
+    instance.set("xavi", {"name": "X"})
+    instance.write_file()
+
+    assert instance.has_changed() is False
+
+    # Another process, another connection
+    other = SqliteDatabase(os.path.join(tmp_path, "mastofeed.db"))
+    other.execute("INSERT INTO feeds (alias, data) VALUES (?, ?)", ("other", "{}"))
+    other.commit()
+
+    assert instance.has_changed() is True
+    instance.read_file()
+    assert instance.has_changed() is False
@@ -0,0 +1,32 @@
+from mastofeed.lib.text_normalizer import TextNormalizer
+import pytest
+
+
+@pytest.mark.parametrize(
+    argnames=('text', 'unicode_folding', 'expected'),
+    argvalues=[
+        ("Sant Llorenç del Munt", False, "sant llorenc del munt"),
+        ("Festa a l'Ametlla de Mar", False, "festa a lametlla de mar"),
+        ("Carretera BV-1221.", False, "carretera bv1221"),
+        ("<p>Excursió a <b>Montcau</b></p>", False, "excursio a montcau"),
+        ("Rock &amp; roll", False, "rock & roll"),
+        ("Plaça Rovira i Trias", True, "placa rovira i trias"),
+        ("Öl in Köln", False, "öl in köln"),
+        ("Öl in Köln", True, "ol in koln"),
+    ],
+)
+def test_normalize(text, unicode_folding, expected):
+    assert TextNormalizer(unicode_folding=unicode_folding).normalize(text) == expected
+
+
+@pytest.mark.parametrize(
+    argnames=('text', 'expected'),
+    argvalues=[
+        ("Just text", "Just text"),
+        ("<p>Hola <a href='#'>món</a></p>", "Hola món"),
+        ("<p>Hola</p><script>var a = 1;</script><style>p {}</style><!-- x -->", "Hola"),
+        ("1 < 2 and 3 > 2", "1 < 2 and 3 > 2"),
+    ],
+)
+def test_strip_html(text, expected):
+    assert TextNormalizer().strip_html(text) == expected
@@ -1,12 +1,15 @@
 from pyxavi.config import Config
 from pyxavi.storage import Storage
+from pyxavi.url import Url
 from mastofeed.lib.queue_post import QueuePost, QueuePostMedia
 from mastofeed.parsers.parser_protocol import ParserProtocol
 from mastofeed.parsers.feed_parser import FeedParser
+from mastofeed.lib.atomic_storage import AtomicStorage
 import feedparser
 from datetime import datetime
 from time import localtime
 from dateutil import parser
+from dateutil.relativedelta import relativedelta
 from unittest.mock import patch, Mock
 from unittest import TestCase
 import pytest
@@ -46,7 +49,8 @@ SOURCES = {
         "language_overwrite": False,
         "keywords_filter_profile": "talamanca",
         "show_name": False,
-        "max_summary_length": 4500
+        "max_summary_length": 4500,
+        "named_account": None
     }
 }
 
@@ -119,7 +123,9 @@ def test_get_raw_content_for_source_no_entries_incoming():
     with patch.object(feedparser, "parse", new=mocked_feedparser_parse):
         raw_content = instance.get_raw_content_for_source(source)
 
-    mocked_feedparser_parse.assert_called_once_with(SOURCES["news"]["url"])
+    mocked_feedparser_parse.assert_called_once_with(
+        SOURCES["news"]["url"], etag=None, modified=None
+    )
     assert raw_content == []
 
 
@@ -132,6 +138,217 @@ def test_get_raw_content_for_source_bad_source():
         _ = instance.get_raw_content_for_source(source)
 
 
+def test_get_raw_content_for_source_sends_validators():
+    global FEEDS
+
+    source = list(SOURCES.keys())[0]
+    FEEDS["news"]["etag"] = "\"abc\""
+    FEEDS["news"]["modified"] = "Thu, 09 Nov 2023 07:00:00 GMT"
+
+    instance = get_instance()
+
+    mocked_feedparser_parse = Mock()
+    mocked_feedparser_parse.return_value = {"entries": []}
+    with patch.object(feedparser, "parse", new=mocked_feedparser_parse):
+        _ = instance.get_raw_content_for_source(source)
+
+    mocked_feedparser_parse.assert_called_once_with(
+        SOURCES["news"]["url"], etag="\"abc\"", modified="Thu, 09 Nov 2023 07:00:00 GMT"
+    )
+
+
+def test_get_raw_content_for_source_not_modified(entry_1):
+    source = list(SOURCES.keys())[0]
+
+    instance = get_instance()
+
+    mocked_feedparser_parse = Mock()
+    mocked_feedparser_parse.return_value = {
+        "status": 304, "entries": __prepare_published_parsed_for_entries([entry_1])
+    }
+    with patch.object(feedparser, "parse", new=mocked_feedparser_parse):
+        raw_content = instance.get_raw_content_for_source(source)
+
+    assert raw_content == []
+
+
+def test_validators_are_saved_with_the_seen_state():
+    source = list(SOURCES.keys())[0]
+
+    instance = get_instance()
+
+    mocked_feedparser_parse = Mock()
+    mocked_feedparser_parse.return_value = {
+        "status": 200, "etag": "\"abc\"", "modified": "Thu, 09 Nov 2023 07:00:00 GMT"
+    }
+    with patch.object(feedparser, "parse", new=mocked_feedparser_parse):
+        _ = instance.get_raw_content_for_source(source)
+
+    # Not saved until the seen state is saved
+    assert instance._feeds_storage.get("news.etag") is None
+
+    mocked_storage_write_file = Mock()
+    with patch.object(AtomicStorage, "write_file", new=mocked_storage_write_file):
+        instance.set_ids_as_seen_for_source(source, [])
+        instance.commit_seen_state()
+
+    mocked_storage_write_file.assert_called_once()
+    assert instance._feeds_storage.get("news.etag") == "\"abc\""
+    assert instance._feeds_storage.get("news.modified") == "Thu, 09 Nov 2023 07:00:00 GMT"
+
+
+def test_get_raw_content_for_sources_fetches_all():
+    global FEEDS
+
+    FEEDS["other"] = {
+        "name": "Other",
+        "site_url": "https://www.other.cat/",
+        "feed_url": "https://www.other.cat/rss/my_feed",
+    }
+
+    instance = get_instance()
+
+    mocked_feedparser_parse = Mock()
+    mocked_feedparser_parse.return_value = {"entries": []}
+    with patch.object(feedparser, "parse", new=mocked_feedparser_parse):
+        results = dict(instance.get_raw_content_for_sources())
+
+    assert mocked_feedparser_parse.call_count == 2
+    assert results == {"news": [], "other": []}
+
+
+def test_get_raw_content_for_sources_only_given_sources():
+    instance = get_instance()
+
+    mocked_feedparser_parse = Mock()
+    mocked_feedparser_parse.return_value = {"entries": []}
+    with patch.object(feedparser, "parse", new=mocked_feedparser_parse):
+        results = list(instance.get_raw_content_for_sources([]))
+
+    mocked_feedparser_parse.assert_not_called()
+    assert results == []
+
+
+def test_get_raw_content_for_sources_bad_source():
+    instance = get_instance()
+
+    with TestCase.assertRaises(FeedParser, RuntimeError):
+        _ = list(instance.get_raw_content_for_sources(["wrong"]))
+
+
+def test_get_raw_content_for_sources_skip_failed():
+    global FEEDS
+
+    FEEDS["other"] = {
+        "name": "Other",
+        "site_url": "https://www.other.cat/",
+        "feed_url": "https://www.other.cat/rss/my_feed",
+    }
+
+    instance = get_instance()
+
+    def parse(url, etag, modified):
+        if "other" in url:
+            raise RuntimeError("Boom")
+        return {"status": 200, "entries": []}
+
+    with patch.object(feedparser, "parse", new=parse):
+        results = dict(instance.get_raw_content_for_sources(skip_failed=True))
+
+    assert results == {"news": []}
+    assert instance.get_failed_sources() == ["other"]
+
+
+def test_get_raw_content_for_source_failed_fetch():
+    source = list(SOURCES.keys())[0]
+
+    instance = get_instance()
+
+    mocked_feedparser_parse = Mock()
+    mocked_feedparser_parse.return_value = {"status": 500, "entries": []}
+    with patch.object(feedparser, "parse", new=mocked_feedparser_parse):
+        raw_content = instance.get_raw_content_for_source(source)
+
+    assert raw_content == []
+    assert instance.get_failed_sources() == [source]
+
+
+def test_reload_sources_if_changed():
+    global FEEDS
+
+    instance = get_instance()
+
+    with patch.object(AtomicStorage, "has_changed", return_value=False):
+        assert instance.reload_sources_if_changed() is False
+
+    FEEDS["other"] = {
+        "name": "Other",
+        "site_url": "https://www.other.cat/",
+        "feed_url": "https://www.other.cat/rss/my_feed",
+    }
+    with patch.object(AtomicStorage, "has_changed", return_value=True),\
+         patch.object(Storage, "read_file", new=patch_storage_read_file):
+        assert instance.reload_sources_if_changed() is True
+
+    assert list(instance.get_sources().keys()) == ["news", "other"]
+
+
+def test_get_due_sources_without_adaptive_polling():
+    global FEEDS
+
+    FEEDS["news"]["stats"] = {"last_poll_at": datetime.now().timestamp()}
+
+    instance = get_instance()
+
+    assert instance.get_due_sources() == ["news"]
+    assert instance.get_poll_interval("news") is None
+
+
+def test_get_due_sources_with_adaptive_polling():
+    global FEEDS
+
+    CONFIG["feed_parser"]["adaptive_polling"] = {
+        "active": True, "min_interval": 100, "max_interval": 1000
+    }
+    FEEDS["news"]["stats"] = {"last_poll_at": 10000, "empty_polls": 2}
+    FEEDS["other"] = {
+        "name": "Other",
+        "site_url": "https://www.other.cat/",
+        "feed_url": "https://www.other.cat/rss/my_feed",
+    }
+
+    instance = get_instance()
+
+    assert instance.get_poll_interval("news") == 400
+    assert instance.get_due_sources(now=10200) == ["other"]
+    assert instance.get_due_sources(now=10400) == ["news", "other"]
+
+
+def test_commit_seen_state_records_the_stats():
+    global FEEDS
+
+    CONFIG["feed_parser"]["adaptive_polling"] = {"active": True}
+    FEEDS["other"] = {
+        "name": "Other",
+        "site_url": "https://www.other.cat/",
+        "feed_url": "https://www.other.cat/rss/my_feed",
+    }
+
+    instance = get_instance()
+    instance._failed_sources.add("other")
+
+    mocked_storage_write_file = Mock()
+    with patch.object(AtomicStorage, "write_file", new=mocked_storage_write_file):
+        instance.set_ids_as_seen_for_source("news", [])
+        instance.set_ids_as_seen_for_source("other", [])
+        instance.commit_seen_state()
+
+    mocked_storage_write_file.assert_called_once()
+    assert instance._feeds_storage.get("news.stats.empty_polls") == 1
+    # Failed polls don't count
+    assert instance._feeds_storage.get("other.stats", None) is None
+
+
 @pytest.fixture
 def entry_1():
     # summary, language and published_parsed
@@ -268,7 +485,9 @@ def test_get_raw_content_for_source_with_language_overwrite(
     raw_content_titles = [x.raw_content["title"] for x in raw_content]
     expected_titles = [x.raw_content["title"] for x in expected_result]
 
-    mocked_feedparser_parse.assert_called_once_with(SOURCES["news"]["url"])
+    mocked_feedparser_parse.assert_called_once_with(
+        SOURCES["news"]["url"], etag=None, modified=None
+    )
     assert raw_content_titles == expected_titles
 
     for idx in range(0, len(indexes)):
@@ -314,7 +533,9 @@ def test_get_raw_content_for_source_without_language_overwrite(
     raw_content_titles = [x.raw_content["title"] for x in raw_content]
     expected_titles = [x.raw_content["title"] for x in expected_result]
 
-    mocked_feedparser_parse.assert_called_once_with(SOURCES["news"]["url"])
+    mocked_feedparser_parse.assert_called_once_with(
+        SOURCES["news"]["url"], etag=None, modified=None
+    )
     assert raw_content_titles == expected_titles
 
     for idx in range(0, len(indexes)):
@@ -356,7 +577,9 @@ def test_get_raw_content_for_source_without_language_overwrite_nor_default_nor_i
     raw_content_titles = [x.raw_content["title"] for x in raw_content]
     expected_titles = [x.raw_content["title"] for x in expected_result]
 
-    mocked_feedparser_parse.assert_called_once_with(SOURCES["news"]["url"])
+    mocked_feedparser_parse.assert_called_once_with(
+        SOURCES["news"]["url"], etag=None, modified=None
+    )
     assert raw_content_titles == expected_titles
 
     for idx in range(0, len(indexes)):
@@ -398,7 +621,9 @@ def test_get_raw_content_for_source_without_language_overwrite_nor_language_in_f
     raw_content_titles = [x.raw_content["title"] for x in raw_content]
     expected_titles = [x.raw_content["title"] for x in expected_result]
 
-    mocked_feedparser_parse.assert_called_once_with(SOURCES["news"]["url"])
+    mocked_feedparser_parse.assert_called_once_with(
+        SOURCES["news"]["url"], etag=None, modified=None
+    )
     assert raw_content_titles == expected_titles
 
     for idx in range(0, len(indexes)):
@@ -411,6 +636,97 @@ def test_get_raw_content_for_source_without_language_overwrite_nor_language_in_f
         assert raw_content[idx].language == expected_entry[indexes[idx]].language
 
 
+def __archive_entries(how_many: int, newest: datetime) -> list:
+    # Entries ordered from newest to oldest, one per day
+    return __prepare_published_parsed_for_entries(
+        [
+            {
+                "title": f"I am a title {index}",
+                "link": f"http://domain.com/blog_entry_{index}.html",
+                "summary": f"I am a summary {index}",
+                "published_parsed": newest - relativedelta(days=index),
+            } for index in range(0, how_many)
+        ]
+    )
+
+
+def test_get_raw_content_for_source_skips_seen_entries():
+    global FEEDS
+
+    source = list(SOURCES.keys())[0]
+    FEEDS["news"]["urls_seen"] = [
+        "//domain.com/blog_entry_1.html", "//domain.com/blog_entry_3.html"
+    ]
+
+    instance = get_instance()
+
+    mocked_feedparser_parse = Mock()
+    mocked_feedparser_parse.return_value = {"entries": __archive_entries(5, datetime.now())}
+    with patch.object(feedparser, "parse", new=mocked_feedparser_parse):
+        raw_content = instance.get_raw_content_for_source(source)
+
+    assert [x.id for x in raw_content] == [
+        "//domain.com/blog_entry_0.html",
+        "//domain.com/blog_entry_2.html",
+        "//domain.com/blog_entry_4.html"
+    ]
+
+
+def test_get_raw_content_for_source_skips_too_old_entries():
+    source = list(SOURCES.keys())[0]
+    CONFIG["default"] = {"months_post_too_old": 1}
+
+    instance = get_instance()
+
+    entries = __archive_entries(3, datetime.now()) +\
+        __archive_entries(3, datetime.now() - relativedelta(months=2))
+    mocked_feedparser_parse = Mock()
+    mocked_feedparser_parse.return_value = {"entries": entries}
+    with patch.object(feedparser, "parse", new=mocked_feedparser_parse),\
+         patch.object(FeedParser, "_FeedParser__datetime_from_struct_date",
+                      wraps=instance._FeedParser__datetime_from_struct_date) as mocked_date:
+        raw_content = instance.get_raw_content_for_source(source)
+
+    assert len(raw_content) == 3
+    # The old ones are discarded before building their dates
+    assert mocked_date.call_count == 3
+
+
+@pytest.mark.parametrize(
+    argnames=('streak', 'reversed', 'expected_clean_calls'),
+    argvalues=[
+        (0, False, 100),
+        (3, False, 8),
+        (3, True, 100),
+    ],
+)
+def test_get_raw_content_for_source_stops_after_seen_streak(
+    streak, reversed, expected_clean_calls
+):
+    global FEEDS
+
+    source = list(SOURCES.keys())[0]
+    CONFIG["feed_parser"]["stop_after_seen_streak"] = streak
+    FEEDS["news"]["urls_seen"] = [
+        f"//domain.com/blog_entry_{index}.html" for index in range(5, 100)
+    ]
+
+    instance = get_instance()
+
+    entries = __archive_entries(100, datetime.now())
+    if reversed:
+        # Not ordered by date, so it can't trust the streak
+        entries.reverse()
+    mocked_feedparser_parse = Mock()
+    mocked_feedparser_parse.return_value = {"entries": entries}
+    with patch.object(feedparser, "parse", new=mocked_feedparser_parse),\
+         patch.object(Url, "clean", wraps=Url.clean) as mocked_clean:
+        raw_content = instance.get_raw_content_for_source(source)
+
+    assert len(raw_content) == 5
+    assert mocked_clean.call_count == expected_clean_calls
+
+
 def test_is_id_already_seen_for_source_no_stack():
 
     source = list(SOURCES.keys())[0]
@@ -460,9 +776,15 @@ def test_set_ids_as_seen_for_source_from_scratch():
     assert instance.is_id_already_seen_for_source(source, id4) is False
 
     mocked_storage_write_file = Mock()
-    with patch.object(Storage, "write_file", new=mocked_storage_write_file):
+    with patch.object(AtomicStorage, "write_file", new=mocked_storage_write_file):
         instance.set_ids_as_seen_for_source(source, [id1, id2, id3, id4])
 
+        # Nothing is saved until the seen state is committed
+        mocked_storage_write_file.assert_not_called()
+        assert instance.is_id_already_seen_for_source(source, id4) is False
+
+        instance.commit_seen_state()
+
     mocked_storage_write_file.assert_called_once()
 
     assert instance.is_id_already_seen_for_source(source, id1) is True
@@ -489,9 +811,15 @@ def test_set_ids_as_seen_for_source_adding_some():
     assert instance.is_id_already_seen_for_source(source, id4) is False
 
     mocked_storage_write_file = Mock()
-    with patch.object(Storage, "write_file", new=mocked_storage_write_file):
+    with patch.object(AtomicStorage, "write_file", new=mocked_storage_write_file):
         instance.set_ids_as_seen_for_source(source, [id3, id4])
 
+        # Nothing is saved until the seen state is committed
+        mocked_storage_write_file.assert_not_called()
+        assert instance.is_id_already_seen_for_source(source, id4) is False
+
+        instance.commit_seen_state()
+
     mocked_storage_write_file.assert_called_once()
 
     assert instance.is_id_already_seen_for_source(source, id1) is True
@@ -500,6 +828,43 @@ def test_set_ids_as_seen_for_source_adding_some():
     assert instance.is_id_already_seen_for_source(source, id4) is True
 
 
+def test_commit_seen_state_writes_once_for_all_sources():
+    global FEEDS
+
+    FEEDS["other"] = {
+        "name": "Other",
+        "site_url": "https://www.other.cat/",
+        "feed_url": "https://www.other.cat/rss/my_feed",
+    }
+    id1 = "//domain.com/blog_entry_1.html"
+    id2 = "//other.com/blog_entry_1.html"
+
+    instance = get_instance()
+
+    mocked_storage_write_file = Mock()
+    with patch.object(AtomicStorage, "write_file", new=mocked_storage_write_file):
+        instance.set_ids_as_seen_for_source("news", [id1])
+        instance.set_ids_as_seen_for_source("other", [id2])
+        instance.commit_seen_state()
+
+    mocked_storage_write_file.assert_called_once()
+    assert instance.is_id_already_seen_for_source("news", id1) is True
+    assert instance.is_id_already_seen_for_source("other", id2) is True
+
+
+def test_commit_seen_state_nothing_to_write():
+    source = list(SOURCES.keys())[0]
+
+    instance = get_instance()
+
+    mocked_storage_write_file = Mock()
+    with patch.object(AtomicStorage, "write_file", new=mocked_storage_write_file):
+        instance.set_ids_as_seen_for_source(source, [])
+        instance.commit_seen_state()
+
+    mocked_storage_write_file.assert_not_called()
+
+
 def test_post_process_for_source_do_nothing():
 
     posts = [QueuePost()]
@@ -0,0 +1,129 @@
+from pyxavi.config import Config
+from mastofeed.runners.daemon import FeedDaemon
+from mastofeed.runners.runner_protocol import RunnerProtocol
+from mastofeed.runners.main import Main
+from mastofeed.lib.journal_queue import JournalQueue
+from mastofeed.lib.queue_post import QueuePost
+from datetime import datetime
+from logging import getLogger
+from unittest.mock import patch, Mock
+import pytest
+
+CONFIG = {
+    "logger": {
+        "name": "custom_logger"
+    },
+    "feed_daemon": {
+        "interval": 100, "jitter": 0, "reload_check_seconds": 30
+    }
+}
+
+
+def patched_main_init(self, config: Config, logger, params: dict = None):
+    self._config = config
+    self._logger = logger
+    self._queue = Mock()
+
+
+@pytest.fixture
+def parser():
+    parser = Mock()
+    parser.get_sources.return_value = {"news": {}, "other": {}}
+    parser.get_failed_sources.return_value = ["other"]
+    parser.get_poll_interval.return_value = None
+    return parser
+
+
+@pytest.fixture
+def instance(parser) -> FeedDaemon:
+    with patch.object(Main, "__init__", new=patched_main_init):
+        instance = FeedDaemon(config=Config(params=CONFIG), logger=getLogger("custom_logger"))
+
+    instance._parsers = {"RSS Feed": parser}
+    instance._schedulers = {"RSS Feed": instance._build_scheduler()}
+    return instance
+
+
+def test_instantiation(instance):
+    assert isinstance(instance, FeedDaemon)
+    assert isinstance(instance, RunnerProtocol)
+
+
+def test_run_cycle_polls_only_due_sources(instance, parser):
+    with patch.object(Main, "run_parser") as mocked_run_parser:
+        instance.run_cycle()
+        instance.run_cycle()
+
+    mocked_run_parser.assert_called_once_with(
+        instance=parser, sources=["news", "other"], skip_failed=True
+    )
+    parser.reload_sources_if_changed.assert_called()
+    # The failed one waits longer
+    scheduler = instance._schedulers["RSS Feed"]
+    assert scheduler._next_poll["other"] > scheduler._next_poll["news"]
+
+
+def test_run_cycle_reloads_the_queue_changed_by_another_process(instance, tmp_path):
+    filename = str(tmp_path / "queue.yaml")
+    instance._main._queue = JournalQueue(storage_file=filename, queue_item_object=QueuePost)
+    for day in range(1, 4):
+        instance._main._queue.append(
+            QueuePost(id=str(day), published_at=datetime(2024, 1, day))
+        )
+    instance._main._queue.save()
+    seen = []
+
+    def run_parser(self, instance, sources, skip_failed):
+        seen.append([x.id for x in self._queue.get_all()])
+
+    with patch.object(Main, "run_parser", new=run_parser):
+        instance.run_cycle()
+
+        # The publish_queue cron publishes the oldest one meanwhile
+        other_process = JournalQueue(storage_file=filename, queue_item_object=QueuePost)
+        other_process.pop()
+        other_process.save()
+
+        instance._schedulers["RSS Feed"] = instance._build_scheduler()
+        instance.run_cycle()
+
+    assert seen == [["1", "2", "3"], ["2", "3"]]
+
+
+def test_run_cycle_uses_the_adaptive_interval(instance, parser):
+    parser.get_failed_sources.return_value = []
+    parser.get_poll_interval.side_effect = lambda source: 1000 if source == "news" else None
+
+    with patch.object(Main, "run_parser"):
+        instance.run_cycle()
+
+    scheduler = instance._schedulers["RSS Feed"]
+    assert scheduler._next_poll["news"] - scheduler._next_poll["other"] == pytest.approx(900, 1)
+
+
+def test_run_cycle_survives_errors(instance, parser):
+    with patch.object(Main, "run_parser", side_effect=RuntimeError("Boom")),\
+         patch.object(Main, "report_error") as mocked_report_error:
+        instance.run_cycle()
+
+    mocked_report_error.assert_called_once()
+    assert instance._schedulers["RSS Feed"].get_due() == []
+
+
+def test_seconds_to_wait_checks_the_storage_meanwhile(instance):
+    with patch.object(Main, "run_parser"):
+        instance.run_cycle()
+
+    assert instance.seconds_to_wait() == 30
+
+
+def test_run_stops(instance):
+
+    def run_cycle_and_stop():
+        instance.stop()
+
+    with patch.object(FeedDaemon, "load_parsers"),\
+         patch.object(FeedDaemon, "run_cycle", side_effect=run_cycle_and_stop) as mocked_cycle:
+        instance.run()
+
+    mocked_cycle.assert_called_once()
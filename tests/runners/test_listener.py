@@ -0,0 +1,101 @@
+from pyxavi.config import Config
+from mastofeed.runners.listener import Listener
+from mastofeed.runners.runner_protocol import RunnerProtocol
+from logging import getLogger
+from unittest.mock import patch, Mock
+import pytest
+
+CONFIG = {
+    "logger": {
+        "name": "custom_logger"
+    },
+    "listener": {
+        "stream_timeout": 10, "backoff_base": 5, "max_backoff": 60, "jitter": 0
+    }
+}
+
+
+@pytest.fixture
+def instance() -> Listener:
+    instance = Listener(config=Config(params=CONFIG), logger=getLogger("custom_logger"))
+    instance._mastodon_instance = Mock()
+    instance._mention_listener = Mock()
+    return instance
+
+
+def test_instantiation(instance):
+    assert isinstance(instance, Listener)
+    assert isinstance(instance, RunnerProtocol)
+
+
+def test_seconds_to_wait_grows_exponentially_until_the_max(instance):
+    waits = []
+    for failures in range(1, 7):
+        instance._failures = failures
+        waits.append(instance.seconds_to_wait())
+
+    assert waits == [5, 10, 20, 40, 60, 60]
+
+
+def test_seconds_to_wait_in_a_long_outage(instance):
+    instance._backoff_base = 5.0
+    instance._failures = 100000
+
+    assert instance.seconds_to_wait() == 60
+
+
+def test_seconds_to_wait_has_jitter(instance):
+    instance._jitter = 0.2
+    instance._failures = 1
+    with patch("mastofeed.runners.listener.random.uniform", return_value=-1) as mocked_uniform:
+        assert instance.seconds_to_wait() == 4
+
+    mocked_uniform.assert_called_once_with(-1, 1)
+
+
+def test_run_reconnects_in_a_loop_waiting_the_backoff(instance):
+    waits = []
+    stream_user = instance._mastodon_instance.stream_user
+    stream_user.side_effect = [RuntimeError("Boom"), RuntimeError("Boom"), None]
+
+    def wait(seconds):
+        waits.append(seconds)
+        if len(waits) == 3:
+            instance.stop()
+
+    with patch.object(instance._stop_event, "wait", new=wait),\
+         patch.object(instance, "_get_default_mastodon_instance") as mocked_connect:
+        instance.run()
+
+    # Connected once, listening 3 times, and catching up before every stream
+    mocked_connect.assert_not_called()
+    assert stream_user.call_count == 3
+    stream_user.assert_called_with(instance._mention_listener, timeout=10)
+    assert instance._mention_listener.request_catch_up.call_count == 3
+    assert waits == [5, 10, 20]
+    instance._mention_listener.shutdown.assert_called_once()
+
+
+def test_run_reports_once_per_streak_of_failures(instance):
+    instance._mastodon_instance.stream_user.side_effect = RuntimeError("Boom")
+
+    def wait(seconds):
+        if instance._failures == 3:
+            instance.stop()
+
+    with patch.object(instance._stop_event, "wait", new=wait),\
+         patch.object(instance._logger, "exception") as mocked_exception,\
+         patch.object(instance._logger, "warning") as mocked_warning:
+        instance.run()
+
+    mocked_exception.assert_called_once()
+    assert mocked_warning.call_count == 2
+
+
+def test_a_healthy_connection_resets_the_backoff(instance):
+    instance._failures = 4
+    with patch("mastofeed.runners.listener.time", return_value=1000):
+        instance.count_failure(started_at=1000 - instance._healthy_after)
+
+    assert instance._failures == 1
+    assert instance.seconds_to_wait() == 5
@@ -7,6 +7,7 @@ from mastofeed.lib.publisher import Publisher
 from logging import Logger as BuiltInLogger, getLogger
 from unittest.mock import patch
 import copy
+import json
 import pytest
 
 CONFIG = {
@@ -124,3 +125,31 @@ def test_instance_() -> Main:
     logger = getLogger(name=CONFIG["logger"]["name"])
 
     return Main(config=config, logger=logger)
+
+
+def test_write_run_metrics_only_when_active(tmp_path):
+    metrics_file = tmp_path / "run_metrics.json"
+    CONFIG["run_metrics"] = {"active": False, "file": str(metrics_file)}
+    instance = get_instance()
+
+    instance.start_run_metrics(runner_name="main")
+    instance.write_run_metrics()
+    assert not metrics_file.exists()
+
+    CONFIG["run_metrics"]["active"] = True
+    instance = get_instance()
+    instance.start_run_metrics(runner_name="main")
+    instance._run_metrics.count("seen", source="feed1")
+    instance.write_run_metrics()
+
+    report = json.loads(metrics_file.read_text())
+    assert report["runner"] == "main"
+    assert report["sources"]["feed1"]["counters"] == {"seen": 1}
+
+
+def test_write_run_metrics_does_not_break_the_run(tmp_path):
+    CONFIG["run_metrics"] = {"active": True, "file": str(tmp_path)}
+    instance = get_instance()
+
+    # The file is a directory, so it can not be written
+    instance.write_run_metrics()
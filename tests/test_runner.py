@@ -0,0 +1,109 @@
+from mastofeed.runners.runner_protocol import RunnerProtocol
+from importlib.metadata import PackageNotFoundError
+from pyxavi.config import Config
+from argparse import Namespace
+from logging import getLogger
+from unittest.mock import patch
+import subprocess
+import runner
+import sys
+import pytest
+
+# Microseconds that importing the runner can take, without the interpreter start up
+IMPORT_TIME_BUDGET = 300000
+HEAVY_MODULES = ["mastodon", "feedparser", "bs4", "dateutil", "requests", "pkg_resources"]
+
+
+def get_runner_paths() -> list:
+    paths = []
+    for command, (action, description) in runner.COMMAND_MAP.items():
+        for subaction, subdescription in runner.SUBCOMMAND_MAP.get(command, {}).values():
+            paths.append(subaction)
+        paths.append(action)
+
+    return [x for x in paths if not x.startswith("#")]
+
+
+def test_import_does_not_load_the_heavy_modules():
+    code = "import sys, runner; print(','.join(sorted(sys.modules.keys())))"
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    modules = result.stdout.strip().split(",")
+
+    for heavy_module in HEAVY_MODULES:
+        assert heavy_module not in modules
+
+
+def test_import_time_is_within_the_budget():
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import runner"],
+        capture_output=True,
+        text=True,
+        check=True
+    )
+
+    # The lines are "import time: self [us] | cumulative | imported package"
+    cumulative = [
+        int(line.split("|")[1]) for line in result.stderr.splitlines()
+        if line.split("|")[-1].strip() == "runner"
+    ]
+    assert len(cumulative) == 1
+    assert cumulative[0] < IMPORT_TIME_BUDGET
+
+
+@pytest.mark.parametrize(argnames=('path'), argvalues=get_runner_paths())
+def test_every_runner_can_be_loaded(path):
+    loaded = runner.load_runner(path)
+
+    assert issubclass(loaded, RunnerProtocol)
+    assert loaded.__name__ == path.rsplit(".", 1)[1]
+
+
+def test_get_runner_by_command_loads_it():
+    loaded = runner._get_runner_by_command(Namespace(command="feed", subcommand="daemon"))
+
+    assert loaded.__name__ == "FeedDaemon"
+
+
+def test_get_version_without_the_package_installed():
+    with patch.object(runner, "version", side_effect=PackageNotFoundError("MastoFeed")):
+        assert runner.get_version() == runner.UNKNOWN_VERSION
+
+    with patch.object(runner, "version", return_value="1.2.3"):
+        assert runner.get_version() == "1.2.3"
+
+
+def test_profile_arguments():
+    parser = runner.setup_parser()
+
+    assert parser.parse_args(["feed", "run"]).profile is None
+    assert parser.parse_args(["feed", "run", "--profile"]).profile == "cprofile"
+    args = parser.parse_args(["feed", "run", "--profile", "sampling", "--profile-sources"])
+    assert args.profile == "sampling"
+    assert args.profile_sources is True
+
+
+def test_profile_modes_are_the_profiler_ones():
+    from mastofeed.lib.profiler import Profiler
+
+    assert runner.PROFILE_MODES == Profiler.MODES
+
+
+def test_run_profiled_writes_the_profile_even_when_the_runner_fails(tmp_path):
+
+    class FailingRunner:
+
+        def run(self):
+            raise RuntimeError("Oops")
+
+    config = Config(params={"profiler": {"directory": str(tmp_path)}})
+    args = Namespace(
+        command="feed", subcommand="run", profile="cprofile", profile_sources=False
+    )
+
+    with pytest.raises(RuntimeError):
+        runner.run_profiled(FailingRunner(), args, config, getLogger("test_runner"))
+
+    assert [x.suffix for x in tmp_path.iterdir()] == [".pstats"]
+    assert next(tmp_path.iterdir()).name.startswith("profile-feed-run-")